@@ -1,16 +1,17 @@
 # -------------------------------------------------------------
 # Import necessary libraries:
 # - Dash for building the web app UI
-# - pandas for handling dataset operations
-# - joblib for loading the trained ML model
-# - sklearn preprocessing for encoding categorical variables
+# - shared_model for loading the trained model and its encoders
 # -------------------------------------------------------------
+import os
+
 import dash
-from dash import html, dcc, Input, Output, State
-import pandas as pd
-import joblib
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
+from dash import html, dcc, ClientsideFunction, Input, Output, State
+import shared_model
+from client_tree import export_flight_tree
+from encoding import FlightEncoder
+from prediction_cache import cache_from_env
+from price_sweep import price_surface
 
 # -------------------------------------------------------------
 # Initialize the Dash application and set the browser tab title
@@ -19,52 +20,64 @@ app = dash .Dash(__name__)
 app.title = "Flight Price Ticket Prediction App"
 
 # -------------------------------------------------------------
-# Function to load the pre-trained Decision Tree model
-# and the dataset used during training.
-# Ensures that the model and encoders match the training data.
+# Load the pre-trained Decision Tree model artifact.
+# The artifact holds the model together with the encoders
+# fitted on the same training data, so they always match.
+# It is rebuilt only when the dataset changes, and served from
+# its array bundle without importing sklearn or pandas.
 # -------------------------------------------------------------
-def load_model_and_data():
-    model_path = r"C:\Users\Fluxtech\Downloads\decision_tree_flight_model.pkl"
-    dataset_path = r"C:\Users\Fluxtech\Downloads\archive (1)\flight_dataset.csv"
-    model = joblib.load(model_path)
-    data = pd.read_csv(dataset_path)
-    return model, data
+artifact = shared_model.load_model("flight")
 
-# -------------------------------------------------------------
-# Load the ML model and dataset into memory
-# -------------------------------------------------------------
-model, data = load_model_and_data()
+# Array-backed copy of the tree for fast single-row predictions
+# (bit-identical to the DecisionTreeRegressor, see tree_engine.py)
+compiled_model = artifact["compiled_model"]
+
+# The compiled tree, or with FLIGHT_PRICE_TABLE=1 a precomputed
+# lookup table over every cell of its split grid (see price_table.py)
+predictor = artifact["predictor"]
+
+# LRU cache of predictions keyed on the encoded features, with the
+# duration bucketed by the tree's split points; cleared whenever
+# the artifact version changes (off unless PRICE_CACHE_SIZE is set:
+# a hit costs about as much as the tree)
+price_cache = cache_from_env(compiled_model, [artifact["features"].index('Duration_hours')])
 
 # -------------------------------------------------------------
-# Standardize categorical text fields by converting them to
-# lowercase and stripping unnecessary whitespace, ensuring
-# encoding consistency with the training phase.
+# LabelEncoders for each categorical column, fitted on the
+# normalized (stripped, lowercased) training data.
 # -------------------------------------------------------------
-for col in ['Airline', 'Source', 'Destination']:
-    data[col] = data[col].astype(str).str.strip().str.lower()
+label_encoders = artifact["label_encoders"]
+
+# Dropdown choices are the categories seen during training
+categories = {col: list(le.classes_) for col, le in label_encoders.items()}
 
 # -------------------------------------------------------------
-# Create LabelEncoders for each categorical column.
-# Each encoder is fitted using the original training dataset.
-# Encoders are stored for use during user input transformations.
+# Lookup tables built once from the same LabelEncoders used
+# during training. If a new/unseen category appears, it encodes
+# to a fallback value (-1) and is counted in unknown_counts.
 # -------------------------------------------------------------
-label_encoders = {}
-for col in ['Airline', 'Source', 'Destination']:
-    le = LabelEncoder()
-    le.fit(data[col])
-    label_encoders[col] = le
+encoder = FlightEncoder.from_artifact(artifact)
 
 # -------------------------------------------------------------
-# Function to safely transform user input values using the same
-# LabelEncoder used during training. If a new/unseen category
-# appears, return a fallback value (-1) to prevent errors.
+# In-browser prediction (DASH_CLIENTSIDE=1, the default): the
+# tree and encoders are exported to a few KB of JSON that ships
+# with the page, and assets/flight_tree.js predicts on click
+# with no server round trip. The server callback still answers
+# when the browser cannot (e.g. an empty number field), and is
+# the only path with DASH_CLIENTSIDE=0.
 # -------------------------------------------------------------
-def safe_transform(encoder, value):
-    value = value.strip().lower()
-    if value in encoder.classes_:
-        return encoder.transform([value])[0]
-    else:
-        return -1
+CLIENTSIDE = os.environ.get("DASH_CLIENTSIDE", "1") == "1"
+client_model = export_flight_tree(artifact) if CLIENTSIDE else None
+
+# Fields the price curve can vary
+SWEEP_OPTIONS = [
+    {'label': 'Month', 'value': 'month'},
+    {'label': 'Total Stops', 'value': 'total_stops'},
+    {'label': 'Duration (hours)', 'value': 'duration_hours'},
+    {'label': 'Airline', 'value': 'airline'},
+    {'label': 'Source', 'value': 'source'},
+    {'label': 'Destination', 'value': 'destination'},
+]
 
 # -------------------------------------------------------------
 # Define the layout of the Dash web application.
@@ -86,22 +99,22 @@ app.layout = html.Div(
         html.Label('Airline'),
         dcc.Dropdown(
             id='airline-input',
-            options=[{'label':i.title(), 'value':i} for i in sorted(data['Airline'].unique())],
-            value = sorted(data['Airline'].unique())[0]),
+            options=[{'label':i.title(), 'value':i} for i in categories['Airline']],
+            value = categories['Airline'][0]),
 
         # Source city dropdown
         html.Label("Source"),
         dcc.Dropdown(
             id='Source-input',
-            options=[{'label':i.title(), 'value':i} for i in sorted(data['Source'].unique())],
-            value = sorted(data['Source'].unique())[0]),
+            options=[{'label':i.title(), 'value':i} for i in categories['Source']],
+            value = categories['Source'][0]),
 
         # Destination city dropdown
         html.Label("Destination"),
         dcc.Dropdown(
             id='Destination-input',
-            options=[{'label': i.title(), 'value': i} for i in sorted(data['Destination'].unique())],
-            value=sorted(data['Destination'].unique())[0]),
+            options=[{'label': i.title(), 'value': i} for i in categories['Destination']],
+            value=categories['Destination'][0]),
 
         # Total stops numeric input
         html.Label("Total Stops"),
@@ -122,45 +135,81 @@ app.layout = html.Div(
 
         # Output display for predicted price
         html.Div(id='prediction-output', style={'fontSize': '20px', 'fontWeight': 'bold'}),
-        html.Hr()
+
+        # Exported tree for the browser, and the click count the
+        # browser hands to the server when it cannot predict
+        dcc.Store(id='client-model', data=client_model),
+        dcc.Store(id='predict-fallback'),
+        html.Hr(),
+
+        # Price curve of the flight above over one or two varying fields
+        html.H3("Explore Prices"),
+        html.Label("Vary"),
+        dcc.Dropdown(id='sweep-x', options=SWEEP_OPTIONS, value='month', clearable=False),
+        html.Label("One line per"),
+        dcc.Dropdown(id='sweep-series', options=SWEEP_OPTIONS, value='total_stops'),
+        html.Br(),
+        html.Button("Show price curve", id='sweep-button', n_clicks=0),
+        html.Div(id='sweep-error', style={'color': 'crimson'}),
+        dcc.Graph(id='sweep-graph'),
     ]
 )
 
 # -------------------------------------------------------------
-# Callback function:
-# Runs when user clicks the "Predict Price" button.
-# - Retrieves user input
-# - Encodes categorical features
-# - Prepares model input in correct order
-# - Generates flight price prediction
-# - Displays price on the interface
+# Clientside callback (in the browser):
+# Runs when user clicks the "Predict Price" button and predicts
+# with the exported tree, exactly like the server callback below;
+# without a usable prediction it sets 'predict-fallback' instead.
 # -------------------------------------------------------------
-@app.callback(
-    Output('prediction-output', 'children'),
-    Input('predict-price-button', 'n_clicks'),
+FORM_STATES = [
     State('airline-input', 'value'),
     State('Source-input', 'value'),
     State('Destination-input', 'value'),
     State('stops-input', 'value'),
     State('duration-input', 'value'),
     State('month-input', 'value'),
+]
+
+if CLIENTSIDE:
+    app.clientside_callback(
+        ClientsideFunction(namespace='flight', function_name='predictPrice'),
+        Output('prediction-output', 'children'),
+        Output('predict-fallback', 'data'),
+        Input('predict-price-button', 'n_clicks'),
+        *FORM_STATES,
+        State('client-model', 'data'),
+    )
+
+# -------------------------------------------------------------
+# Callback function (on the server):
+# Runs when user clicks the "Predict Price" button, or only on
+# the browser's fallback when predicting clientside.
+# - Retrieves user input
+# - Encodes categorical features
+# - Prepares model input in correct order
+# - Generates flight price prediction
+# - Displays price on the interface
+# -------------------------------------------------------------
+@app.callback(
+    Output('prediction-output', 'children', allow_duplicate=CLIENTSIDE),
+    Input('predict-fallback', 'data') if CLIENTSIDE else Input('predict-price-button', 'n_clicks'),
+    *FORM_STATES,
+    prevent_initial_call=CLIENTSIDE,
 )
 
 def predict_price(n_clicks, airline, Source, Destination, stops, duration, month):
     # Only run prediction after the user clicks the button
     if n_clicks > 0:
 
-        # Encode inputs safely using previously fitted encoders
-        airline_encoded = safe_transform(label_encoders['Airline'], airline)
-        source_encoded = safe_transform(label_encoders['Source'], Source)
-        destination_encoded = safe_transform(label_encoders['Destination'], Destination)
-
-        # Maintain correct feature order for the model
-        input_data = [
-            [airline_encoded, source_encoded, destination_encoded, stops, duration, month]]
+        # Encode inputs safely, keeping the feature order of the model
+        input_data = encoder.encode_row(airline, Source, Destination, stops, duration, month)
 
         # Generate prediction using the Decision Tree model
-        predicted_price = model.predict(input_data)[0]
+        predicted_price = price_cache.get_or_compute(
+            input_data,
+            lambda: predictor.predict_one(input_data),
+            artifact["version"]
+        )
 
         # Format output text
         result_text = "Estimated Flight Ticket Price: {:.2f}".format(predicted_price)
@@ -169,7 +218,69 @@ def predict_price(n_clicks, airline, Source, Destination, stops, duration, month
         return ""
 
 # -------------------------------------------------------------
-# Run the Dash server in debug mode
+# Callback function:
+# Runs when user clicks "Show price curve".
+# - Takes the form values as the base flight
+# - Prices the whole grid (e.g. 12 months x 5 stop counts) in
+#   one batched predictor call instead of one submit per point
+# - Draws one line per value of the second field
+# -------------------------------------------------------------
+@app.callback(
+    Output('sweep-graph', 'figure'),
+    Output('sweep-error', 'children'),
+    Input('sweep-button', 'n_clicks'),
+    State('sweep-x', 'value'),
+    State('sweep-series', 'value'),
+    State('airline-input', 'value'),
+    State('Source-input', 'value'),
+    State('Destination-input', 'value'),
+    State('stops-input', 'value'),
+    State('duration-input', 'value'),
+    State('month-input', 'value'),
+)
+
+def price_curve(n_clicks, x_field, series_field, airline, Source, Destination, stops, duration, month):
+    if n_clicks == 0:
+        return dash.no_update, ""
+    base = {
+        'airline': airline, 'source': Source, 'destination': Destination,
+        'total_stops': stops or 0, 'duration_hours': duration or 0, 'month': month or 1,
+    }
+    dimensions = [x_field] if series_field in (None, x_field) else [series_field, x_field]
+    try:
+        surface = price_surface(predictor, encoder, base, dimensions)
+    except ValueError as exc:
+        return dash.no_update, str(exc)
+
+    x_axis = surface["axes"][-1]
+    if len(dimensions) == 1:
+        traces = [{'x': x_axis["values"], 'y': surface["prices"], 'mode': 'lines+markers', 'name': 'Price'}]
+    else:
+        series_axis = surface["axes"][0]
+        traces = [
+            {'x': x_axis["values"], 'y': prices, 'mode': 'lines+markers', 'name': f"{series_axis['name']} = {value}"}
+            for value, prices in zip(series_axis["values"], surface["prices"])
+        ]
+    figure = {
+        'data': traces,
+        'layout': {
+            'title': {'text': 'Estimated price by ' + x_axis["name"].replace('_', ' ')},
+            'xaxis': {'title': {'text': x_axis["name"].replace('_', ' ')}},
+            'yaxis': {'title': {'text': 'Price'}},
+        },
+    }
+    return figure, ""
+
+# -------------------------------------------------------------
+# Cache hit/miss/eviction counters, served by the underlying
+# Flask server
+# -------------------------------------------------------------
+@app.server.route('/cache/stats')
+def cache_stats():
+    return price_cache.stats()
+
+# -------------------------------------------------------------
+# Run the Dash server (DASH_DEBUG=1 for the debugger and reloader)
 # -------------------------------------------------------------
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(debug=os.environ.get("DASH_DEBUG", "0") == "1")
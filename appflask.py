@@ -3,139 +3,192 @@
  FLIGHT PRICE PREDICTION - FLASK DEPLOYMENT 
 ===========================================================
 
-This script trains a Decision Tree Regressor on a flight 
-price dataset and deploys it using a simple Flask web app.
+This script loads the Decision Tree Regressor trained on a
+flight price dataset (see model_store.py) and deploys it
+using a simple Flask web app.
 
 Users can input flight details (Airline, Source, Destination,
 Stops, Duration, Month) and receive a predicted ticket price.
+POST /api/predict takes the same fields as JSON and returns
+the price as JSON, without any HTML. Every prediction is
+recorded in the audit log (see audit_log.py). POST /api/sweep prices
+a base flight over one or two varying fields (months ×
+stops, a duration range...) in one batched call and returns
+the price surface (see price_sweep.py).
+
+The form template is compiled once; the empty form page and
+the stylesheet are pre-rendered, gzipped and served with an
+ETag, and result pages are rendered once per distinct price.
+
+Run with a production server (waitress, `pip install waitress`;
+without it a threaded Werkzeug server is used, with a warning):
+    python appflask.py                 FLASK_DEBUG=1 for debug mode
+    gunicorn -w 4 --keep-alive 5 appflask:app
 ===========================================================
 """
 
-import pandas as pd
-from sklearn.tree import DecisionTreeRegressor
-from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split
-import joblib
+import gzip
+import hashlib
+import logging
 import os
-from flask import Flask, render_template_string, request
+import sys
+from functools import lru_cache
+
+import numpy as np
+from flask import Flask, Response, abort, jsonify, request
+import shared_model
+from encoding import FlightEncoder
+from price_sweep import price_surface
+from model_registry import ADMIN_ENABLED, ModelRegistry
+from metrics import AppMetrics, elapsed, instrument_flask, mark
+from audit_log import add_audit_gauges, audit_from_env
+from prediction_cache import cache_from_env
 
 # Initialize Flask app
 app = Flask(__name__)
 
 # ===========================================================
-# 1) LOAD DATASET
+# 1) SERVING OBJECTS FOR ONE MODEL VERSION
 # ===========================================================
-file_path = "C:\\Users\\Fluxtech\\Downloads\\archive (1)\\flight_dataset.csv"
-data = pd.read_csv(file_path)
-
-# Clean and standardize categorical text columns
-for col in ['Airline', 'Source', 'Destination']:
-    data[col] = data[col].astype(str).str.strip().str.lower()
-
-# ===========================================================
-# 2) FEATURE SELECTION
-# ===========================================================
-features = ['Airline', 'Source', 'Destination', 'Total_Stops', 
-            'Duration_hours', 'Month']
-target = "Price"
+def prepare_model(artifact):
+    """
+    Adds the request-path objects to an artifact that already has its
+    evaluators: "compiled_model" is an array-backed copy of the tree
+    (bit-identical to the DecisionTreeRegressor, see tree_engine.py)
+    and "predictor" the tree itself or, with FLIGHT_PRICE_TABLE=1, a
+    lookup table over every cell of its split grid (see price_table.py).
+    """
+    # LRU cache of predictions keyed on the encoded features, with the
+    # duration bucketed by the tree's split points (off unless
+    # PRICE_CACHE_SIZE is set: a hit costs about as much as the tree)
+    artifact["price_cache"] = cache_from_env(
+        artifact["compiled_model"], [artifact["features"].index('Duration_hours')]
+    )
 
-X = data.loc[:, features].copy()
-y = data[target]
+    # Dict lookups built once from the encoders and stops mapping.
+    # Categories NOT seen during training encode to -1 and are
+    # counted in encoder.unknown_counts.
+    artifact["encoder"] = FlightEncoder.from_artifact(artifact)
+    return artifact
 
-# ===========================================================
-# 3) ENCODE CATEGORICAL COLUMNS
-# ===========================================================
-label_encoders = {}
-
-for col in ['Airline', 'Source', 'Destination']:
-    le = LabelEncoder()
-    X[col] = le.fit_transform(X[col])
-    label_encoders[col] = le  # Store encoder for later use in prediction
-
-# Mapping for total stops (string → numeric)
-stops_mapping = {
-    'non-stop': 0,
-    '1 stop': 1,
-    '2 stops': 2,
-    '3 stops': 3,
-    '4 stops': 4
-}
 
-# Convert stops column using mapping
-X['Total_Stops'] = X['Total_Stops'].map(stops_mapping).fillna(0).astype(int)
+def warmup_model(model, rows=256):
+    """
+    Runs a batch of random in-range rows through the predictor and the
+    full form path, and fails if the table and the tree disagree.
+    """
+    rng = np.random.default_rng(0)
+    encoders = model["label_encoders"]
+    X = np.column_stack([
+        rng.integers(0, len(encoders['Airline'].classes_), rows),
+        rng.integers(0, len(encoders['Source'].classes_), rows),
+        rng.integers(0, len(encoders['Destination'].classes_), rows),
+        rng.choice(list(model["stops_mapping"].values()), rows),
+        rng.uniform(0, 48, rows),
+        rng.integers(1, 13, rows),
+    ]).astype(np.float64)
+    predicted = model["predictor"].predict(X)
+    if not np.isfinite(predicted).all() or np.any(predicted != model["compiled_model"].predict(X)):
+        raise ValueError(f"Flight model {model['version']} failed its warm-up check")
+
+    row = model["encoder"].encode_row(
+        encoders['Airline'].classes_[0], encoders['Source'].classes_[0],
+        encoders['Destination'].classes_[0], "non-stop", 2.5, 1
+    )
+    model["predictor"].predict_one(row)
 
 # ===========================================================
-# 4) SPLIT DATA AND TRAIN MODEL
+# 2) LOAD MODEL (HOT RELOADABLE)
 # ===========================================================
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
+# Request counts, per-stage latency histograms and unknown-category
+# counters, served in Prometheus text format at /metrics; the
+# model_version label follows the served version
+metrics = AppMetrics("flask", "flight", version=None)
+
+# The artifact is trained once from flight_dataset.csv and
+# rebuilt only when the dataset changes (see model_store.py).
+# Under `python shared_model.py serve flight -- gunicorn ...` every
+# worker attaches the tree (and the price table, if enabled) from
+# shared memory instead.
+# New versions written by `python model_store.py flight` are loaded,
+# warmed and swapped in by a background thread (see model_registry.py);
+# each request reads registry.current once and keeps that version.
+registry = ModelRegistry(
+    "flight",
+    prepare=prepare_model,
+    warmup=warmup_model,
+    on_swap=lambda model: setattr(metrics, "version", model["version"])
+)
+registry.load_initial()
+registry.start()
+
+# Feature order used for training and for every prediction path
+features = registry.current["features"]
+
+metrics.add_unknown_categories(lambda: registry.current["encoder"])
+metrics.add_gauge(
+    "prediction_cache_lookups_total", "Price cache lookups by result.", ("app", "result"),
+    lambda: [(("flask", result), registry.current["price_cache"].stats()[key])
+             for result, key in (("hit", "hits"), ("miss", "misses"))],
+    kind="counter"
 )
 
-model = DecisionTreeRegressor(max_depth=6, random_state=42)
-model.fit(X_train, y_train)
+# Inputs, features, price, version and latency of every prediction,
+# written to SQLite by a background thread (see audit_log.py)
+audit = audit_from_env("flask", "flight")
+add_audit_gauges(metrics, audit)
+instrument_flask(app, metrics)
 
 # ===========================================================
-# 5) SAFE TRANSFORM FOR UNKNOWN CATEGORIES
+# 3) HTML FORM (PRECOMPILED TEMPLATE) AND STYLESHEET
 # ===========================================================
-def safe_transform(encoder, value):
-    """
-    Converts a category to its encoded numeric value.
-    If the category was NOT seen during training, return -1.
-    """
-    if value in encoder.classes_:
-        return encoder.transform([value])[0]
-    else:
-        print(f"'{value}' not found in training data. Using fallback (-1)")
-        return -1
+FORM_CSS = """
+body {
+    font-family: Arial, sans-serif;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    height: 100vh;
+    background-color: #f0f2f5;
+}
+.container {
+    background: white;
+    padding: 30px 40px;
+    border-radius: 10px;
+    box-shadow: 0 4px 10px 0 rgba(0,0,0,0.1);
+    text-align: center;
+    width: 350px;
+}
+h2 { margin-bottom: 20px; }
+input[type="text"], input[type="number"] {
+    width: 90%;
+    padding: 8px;
+    margin: 8px 0;
+    font-size: 16px;
+}
+input[type="submit"] {
+    padding: 10px 20px;
+    font-size: 16px;
+    background-color: #007bff;
+    color: white;
+    border: none;
+    border-radius: 5px;
+    cursor: pointer;
+    margin-top: 10px;
+}
+input[type="submit"]:hover {
+    background-color: #0056b3;
+}
+h3 { margin-top: 20px; }
+"""
 
-# ===========================================================
-# 6) HTML FORM (INLINE TEMPLATE)
-# ===========================================================
 HTML_FORM = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
 <meta charset="utf-8">
 <title>Flight Dataset</title>
-<style>
-    body {
-        font-family: Arial, sans-serif;
-        display: flex;
-        justify-content: center;
-        align-items: center;
-        height: 100vh;
-        background-color: #f0f2f5;
-    }
-    .container {
-        background: white;
-        padding: 30px 40px;
-        border-radius: 10px;
-        box-shadow: 0 4px 10px 0 rgba(0,0,0,0.1);
-        text-align: center;
-        width: 350px;
-    }
-    h2 { margin-bottom: 20px; }
-    input[type="text"], input[type="number"] {
-        width: 90%;
-        padding: 8px;
-        margin: 8px 0;
-        font-size: 16px;
-    }
-    input[type="submit"] {
-        padding: 10px 20px;
-        font-size: 16px;
-        background-color: #007bff;
-        color: white;
-        border: none;
-        border-radius: 5px;
-        cursor: pointer;
-        margin-top: 10px;
-    }
-    input[type="submit"]:hover {
-        background-color: #0056b3;
-    }
-    h3 { margin-top: 20px; }
-</style>
+<link rel="stylesheet" href="/static/flight.css?v={{ css_version }}">
 </head>
 <body>
 <div class="container">
@@ -161,54 +214,270 @@ HTML_FORM = """
 </html>
 """
 
+
+class StaticAsset:
+    """
+    A response body prepared once: gzipped copy and ETags included.
+    The gzipped body has its own strong ETag ("-gz" suffix), as a
+    different content-coding must (RFC 9110, 8.8.3).
+    """
+
+    def __init__(self, body, content_type, cache_control):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.gzipped = gzip.compress(self.body, 9, mtime=0)
+        self.etag = hashlib.sha256(self.body).hexdigest()[:16]
+        self.gzip_etag = self.etag + "-gz"
+        self.content_type = content_type
+        self.cache_control = cache_control
+
+    def response(self):
+        """
+        304 when the client already has one of the two variants (with
+        that variant's ETag), otherwise the body, gzipped if the client
+        accepts it.
+        """
+        use_gzip = "gzip" in request.accept_encodings
+        preferred, other = (self.gzip_etag, self.etag) if use_gzip else (self.etag, self.gzip_etag)
+        matched = next((etag for etag in (preferred, other) if etag in request.if_none_match), None)
+        if matched is not None:
+            response = Response(status=304)
+            etag = matched
+        elif use_gzip:
+            response = Response(self.gzipped, content_type=self.content_type)
+            response.headers["Content-Encoding"] = "gzip"
+            etag = self.gzip_etag
+        else:
+            response = Response(self.body, content_type=self.content_type)
+            etag = self.etag
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = self.cache_control
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+# Stylesheet cached by browsers for a day; the URL changes with its content
+STYLESHEET = StaticAsset(FORM_CSS, "text/css; charset=utf-8", "public, max-age=86400")
+
+# Compiled once (autoescaped like render_template_string) instead of per request
+FORM_TEMPLATE = app.jinja_env.from_string(HTML_FORM)
+
+# The empty form never changes: browsers revalidate it with its ETag
+EMPTY_FORM = StaticAsset(
+    FORM_TEMPLATE.render(price=None, css_version=STYLESHEET.etag),
+    "text/html; charset=utf-8", "no-cache"
+)
+
+
+@lru_cache(maxsize=4096)
+def result_page(price):
+    """
+    Result page for a formatted price. The tree only ever predicts one
+    of its leaf values, so a few dozen pages cover every request.
+    """
+    return FORM_TEMPLATE.render(price=price, css_version=STYLESHEET.etag).encode("utf-8")
+
+
+@app.route('/static/flight.css')
+def stylesheet():
+    return STYLESHEET.response()
+
 # ===========================================================
-# 7) FLASK ROUTE — PREDICTION
+# 4) FLASK ROUTE — PREDICTION
 # ===========================================================
 @app.route('/', methods=['GET', 'POST'])
 def predict():
-    price = None
-
     if request.method == 'POST':
+        # The whole request uses this version, even if a reload swaps it
+        model = registry.current
 
         # Read inputs from HTML form
-        airline_input = request.form["Airline"].strip().lower()
-        source_input = request.form["Source"].strip().lower()
-        destination_input = request.form["Destination"].strip().lower()
+        airline_input = request.form["Airline"]
+        source_input = request.form["Source"]
+        destination_input = request.form["Destination"]
 
         # Stops entered as string (e.g. "1 stop")
         stops_input = request.form["Total Stops (e.g. 'non-stop', '1 stop')"]
 
         duration_hours = float(request.form["Duration Hours"])
         month_input = int(request.form["Month (1-12)"])
-
-        # Encode user inputs
-        airline_encoded = safe_transform(label_encoders['Airline'], airline_input)
-        source_encoded = safe_transform(label_encoders['Source'], source_input)
-        destination_encoded = safe_transform(label_encoders['Destination'], destination_input)
-
-        # Map stops
-        stops_encoded = stops_mapping.get(stops_input, 0)
-
-        # Prepare data for prediction
-        input_data = [[
-            airline_encoded, 
-            source_encoded, 
-            destination_encoded, 
-            stops_encoded, 
-            duration_hours, 
+        mark("parse")
+
+        # Encode user inputs and map stops in one pass
+        input_data = model["encoder"].encode_row(
+            airline_input,
+            source_input,
+            destination_input,
+            stops_input,
+            duration_hours,
             month_input
-        ]]
+        )
+        mark("encode")
 
         # Predict price
-        predicted_price = model.predict(input_data)
-        price = "{:.2f}".format(predicted_price[0])
+        predicted_price = model["price_cache"].get_or_compute(
+            input_data,
+            lambda: model["predictor"].predict_one(input_data),
+            model["version"]
+        )
+        price = "{:.2f}".format(predicted_price)
+        mark("predict")
+
+        audit.record("/", model["version"], {
+            "airline": airline_input, "source": source_input, "destination": destination_input,
+            "total_stops": stops_input, "duration_hours": duration_hours, "month": month_input,
+        }, input_data, predicted_price, elapsed())
+
+        page = Response(result_page(price), content_type="text/html; charset=utf-8")
+        mark("render")
+        return page
+
+    return EMPTY_FORM.response()
+
+# JSON fields of POST /api/predict and their types
+API_FIELDS = {
+    "airline": str,
+    "source": str,
+    "destination": str,
+    "total_stops": (str, int, float),
+    "duration_hours": (int, float),
+    "month": int,
+}
 
-        return render_template_string(HTML_FORM, price=price)
 
-    return render_template_string(HTML_FORM, price=None)
+def invalid_field(payload, optional=()):
+    """
+    Error message for the first missing or mistyped API field of
+    `payload`, or None; `optional` fields may be left out.
+    """
+    if not isinstance(payload, dict):
+        return "Send a JSON object"
+    for field, kind in API_FIELDS.items():
+        value = payload.get(field)
+        if value is None and field in optional:
+            continue
+        if not isinstance(value, kind) or isinstance(value, bool):
+            return f"'{field}' is missing or not a valid value"
+    return None
+
+# JSON variant of the form: no HTML is rendered at all
+@app.route('/api/predict', methods=['POST'])
+def api_predict():
+    model = registry.current
+    payload = request.get_json(silent=True)
+    error = invalid_field(payload)
+    if error:
+        return jsonify({"detail": error}), 400
+    mark("parse")
+
+    input_data = model["encoder"].encode_row(
+        payload["airline"],
+        payload["source"],
+        payload["destination"],
+        payload["total_stops"],
+        float(payload["duration_hours"]),
+        payload["month"]
+    )
+    mark("encode")
+
+    predicted_price = model["price_cache"].get_or_compute(
+        input_data,
+        lambda: model["predictor"].predict_one(input_data),
+        model["version"]
+    )
+    mark("predict")
+    audit.record("/api/predict", model["version"], payload, input_data, predicted_price, elapsed())
+    return jsonify({"price": round(float(predicted_price), 2), "model_version": model["version"]})
+
+# Price surface over one or two swept fields, e.g.
+# {"base": {...API fields...}, "vary": ["month", "total_stops"]}
+# or "vary": [{"name": "duration_hours", "start": 1, "stop": 24, "step": 0.5}];
+# swept fields may be left out of "base"
+@app.route('/api/sweep', methods=['POST'])
+def api_sweep():
+    model = registry.current
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("vary"), list):
+        return jsonify({"detail": "Send a JSON object with 'base' and a 'vary' list"}), 400
+    swept = [spec.get("name") if isinstance(spec, dict) else spec for spec in payload["vary"]]
+    error = invalid_field(payload.get("base"), optional=swept)
+    if error:
+        return jsonify({"detail": error}), 400
+    mark("parse")
+
+    try:
+        surface = price_surface(model["predictor"], model["encoder"], payload["base"], payload["vary"])
+    except ValueError as exc:
+        return jsonify({"detail": str(exc)}), 400
+    mark("predict")
+    return jsonify({**surface, "model_version": model["version"]})
+
+# Cache hit/miss/eviction counters
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(registry.current["price_cache"].stats())
+
+# Audit log counters: recorded, written, spilled and dropped records
+@app.route('/audit/stats')
+def audit_stats():
+    return jsonify(audit.stats())
+
+# Per-worker stats: how the model was loaded, startup time and memory use
+@app.route('/worker/stats')
+def worker_stats():
+    return jsonify(shared_model.worker_stats())
 
 # ===========================================================
-# 8) RUN APPLICATION
+# 5) MODEL VERSION: STATUS, RELOAD, ROLLBACK
 # ===========================================================
+@app.route('/model/status')
+def model_status():
+    return jsonify(registry.status())
+
+# Check the manifest now instead of waiting for the next poll
+@app.route('/model/reload', methods=['POST'])
+def model_reload():
+    if not ADMIN_ENABLED:
+        abort(404)
+    swapped = registry.check(force=True)
+    return jsonify({"swapped": swapped, **registry.status()})
+
+# Swap back to ?version=... (default: the previously served version)
+@app.route('/model/rollback', methods=['POST'])
+def model_rollback():
+    if not ADMIN_ENABLED:
+        abort(404)
+    try:
+        registry.rollback(request.args.get("version"))
+    except LookupError as exc:
+        return jsonify({"detail": str(exc)}), 404
+    return jsonify(registry.status())
+
+# ===========================================================
+# 6) RUN APPLICATION
+# ===========================================================
+def serve(host=None, port=None):
+    """
+    Production server: waitress (a declared dependency of the Flask
+    app). If it is missing, warns and falls back to Werkzeug's threaded
+    server (HTTP/1.1 keep-alive) without debugger, reloader or
+    per-request access log. FLASK_DEBUG=1 runs the debug server.
+    """
+    host = host or os.environ.get("FLASK_HOST", "127.0.0.1")
+    port = int(port or os.environ.get("FLASK_PORT", "5000"))
+    if os.environ.get("FLASK_DEBUG", "0") == "1":
+        app.run(host=host, port=port, debug=True)
+        return
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        print("WARNING: waitress is not installed (pip install waitress); falling back to "
+              "Werkzeug's development server, which is not meant for production traffic",
+              file=sys.stderr)
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        print(f"Serving on http://{host}:{port} (threaded Werkzeug server)")
+        app.run(host=host, port=port, threaded=True, debug=False, use_reloader=False)
+        return
+    waitress_serve(app, host=host, port=port, threads=int(os.environ.get("FLASK_THREADS", "8")))
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    serve()
@@ -0,0 +1,108 @@
+/*
+ * Flight price tree evaluated in the browser (see client_tree.py).
+ *
+ * The model is the JSON export of the served DecisionTreeRegressor and
+ * its encoders, kept in the 'client-model' dcc.Store. Encoding, tree
+ * descent and price formatting follow the Python path exactly:
+ * - categories: exact lookup, then strip + lowercase, unknown -> -1
+ * - stop labels through stops_mapping (unknown -> 0), numbers as is
+ * - features rounded to float32 (Math.fround) like sklearn's tree
+ * - "{:.2f}" rounding, including Python's half-to-even on exact ties
+ *
+ * Dash serves every file in assets/ with the page.
+ */
+(function (root) {
+    'use strict';
+
+    var has = Object.prototype.hasOwnProperty;
+
+    // Python's str(value).strip().lower() for dropdown values
+    function normalize(value) {
+        return (value === null || value === undefined ? 'None' : String(value)).trim().toLowerCase();
+    }
+
+    function lookup(table, value) {
+        var key = value === null || value === undefined ? 'None' : String(value);
+        if (has.call(table, key)) {
+            return table[key];
+        }
+        key = normalize(value);
+        return has.call(table, key) ? table[key] : null;
+    }
+
+    // Feature row in model order, or null when a number is missing
+    // (those go to the server callback, which predicts them with the
+    // tree's missing-value path)
+    function encode(model, airline, source, destination, stops, duration, month) {
+        var row = [];
+        var values = [airline, source, destination];
+        for (var i = 0; i < model.categorical.length; i++) {
+            var code = lookup(model.tables[model.categorical[i]], values[i]);
+            row.push(code === null ? model.unknown_code : code);
+        }
+        if (typeof stops === 'string') {
+            var stopsCode = lookup(model.stops, stops);
+            row.push(stopsCode === null ? 0 : stopsCode);
+        } else {
+            row.push(stops);
+        }
+        row.push(duration, month);
+        for (var j = 0; j < row.length; j++) {
+            if (typeof row[j] !== 'number') {
+                return null;
+            }
+        }
+        return row;
+    }
+
+    // Leaf value reached by one row (CompiledTree.predict_one)
+    function predict(model, row) {
+        var x = row.map(Math.fround);
+        var left = model.left, right = model.right;
+        var feature = model.feature, threshold = model.threshold;
+        var node = 0;
+        while (left[node] >= 0) {
+            var v = x[feature[node]];
+            if (v <= threshold[node] || (v !== v && model.missing_left[node])) {
+                node = left[node];
+            } else {
+                node = right[node];
+            }
+        }
+        return model.value[node];
+    }
+
+    // Python's "{:.2f}".format(price). toFixed agrees except on exact
+    // ties (fractions of .125, .375, .625, .875), which Python rounds
+    // half to even and toFixed rounds up.
+    function formatPrice(price) {
+        var eighths = price * 8;
+        if (Number.isInteger(eighths) && eighths % 2 !== 0 && Math.abs(price) < 1e15) {
+            var cents = Math.floor(price * 100);
+            if (cents % 2 !== 0) {
+                cents += 1;
+            }
+            return (cents / 100).toFixed(2);
+        }
+        return price.toFixed(2);
+    }
+
+    root.flightTree = {normalize: normalize, encode: encode, predict: predict, formatPrice: formatPrice};
+
+    root.dash_clientside = Object.assign({}, root.dash_clientside, {
+        flight: {
+            // Returns [prediction text, server fallback trigger]
+            predictPrice: function (nClicks, airline, source, destination, stops, duration, month, model) {
+                var noUpdate = root.dash_clientside.no_update;
+                if (!nClicks) {
+                    return ['', noUpdate];
+                }
+                var row = model ? encode(model, airline, source, destination, stops, duration, month) : null;
+                if (row === null) {
+                    return [noUpdate, nClicks];
+                }
+                return ['Estimated Flight Ticket Price: ' + formatPrice(predict(model, row)), noUpdate];
+            }
+        }
+    });
+})(typeof window !== 'undefined' ? window : globalThis);
@@ -0,0 +1,530 @@
+"""
+===========================================================
+ PREDICTION AUDIT LOG (BATCHED SQLITE WRITES)
+===========================================================
+
+Keeps a record of every prediction served: inputs, encoded
+features, output, model version and latency.
+
+- `record()` only appends a tuple to an in-memory ring
+  buffer (about a microsecond); nothing is serialized or
+  written on the request path.
+- A background writer thread drains the buffer every
+  AUDIT_LOG_FLUSH_MS milliseconds (or as soon as a batch is
+  full) and inserts each batch with one `executemany` in
+  one transaction, into a SQLite database in WAL mode.
+- When the buffer is full (the disk cannot keep up), new
+  records are appended to a JSON-lines spill file of this
+  process (<db>.<pid>.spill) and replayed into the database
+  once the writer has caught up (AUDIT_LOG_OVERFLOW=spill,
+  the default), or
+  counted and dropped (AUDIT_LOG_OVERFLOW=drop). Spill
+  lines that are not a whole record (e.g. cut short by a
+  crash) are skipped and counted as malformed.
+- The writer starts on the first record, so every forked
+  worker process gets its own; WAL lets them share one file.
+  Spill files left by processes that are gone (a crash, an
+  earlier run) are replayed by the next writer to start.
+
+Environment settings:
+    AUDIT_LOG           1 (default) to record, 0 to disable
+    AUDIT_LOG_PATH      database file (default <MODEL_ARTIFACT_DIR>/audit_log.db)
+    AUDIT_LOG_CAPACITY  records the buffer holds (default 10000)
+    AUDIT_LOG_BATCH     records per insert (default 500)
+    AUDIT_LOG_FLUSH_MS  longest wait between writes (default 200)
+    AUDIT_LOG_OVERFLOW  spill (default) or drop
+
+Measure the cost of record() and the write throughput, and
+check that every record reaches the database:
+    python audit_log.py bench [n_records] [--capacity N]
+Show the latest records:
+    python audit_log.py tail [n] [--path FILE]
+===========================================================
+"""
+
+import atexit
+import collections
+import glob
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from model_store import ARTIFACT_DIR
+
+ENABLED = os.environ.get("AUDIT_LOG", "1") == "1"
+DEFAULT_PATH = os.environ.get("AUDIT_LOG_PATH", os.path.join(ARTIFACT_DIR, "audit_log.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    app TEXT NOT NULL,
+    model TEXT NOT NULL,
+    model_version TEXT,
+    endpoint TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    inputs TEXT,
+    features TEXT,
+    output TEXT,
+    latency_ms REAL
+)
+"""
+INSERT = ("INSERT INTO predictions (ts, app, model, model_version, endpoint, rows, inputs, "
+          "features, output, latency_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+def _json_default(value):
+    # NumPy arrays and scalars (batch features, labels) and pydantic
+    # request models as plain JSON
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+
+def _dumps(value):
+    return json.dumps(value, default=_json_default, separators=(",", ":"))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def connect(path):
+    """
+    Opens the audit database in WAL mode and creates its table.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Durable at WAL checkpoints; a crash loses at most the last commits
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(SCHEMA)
+    conn.commit()
+    return conn
+
+
+class AuditLog:
+    """
+    Ring buffer of prediction records drained into SQLite by a
+    background thread.
+    """
+
+    def __init__(self, app_name, model_name, path=DEFAULT_PATH, capacity=10000,
+                 batch_size=500, flush_ms=200.0, overflow="spill"):
+        if capacity < 1 or batch_size < 1:
+            raise ValueError("capacity and batch_size must be at least 1")
+        if overflow not in ("spill", "drop"):
+            raise ValueError("overflow must be 'spill' or 'drop'")
+        self.app_name = app_name
+        self.model_name = model_name
+        self.path = path
+        self.spill_path = self._own_spill_path()
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self.overflow = overflow
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.malformed = 0
+        self.errors = 0
+        self.last_error = None
+        # deque appends and pops are atomic: no lock on the request path
+        self._buffer = collections.deque()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._spill_file = None
+        self._replays = 0
+        self._spill_pending = bool(self._orphaned_spills())
+        self._writer = None
+        self._closing = False
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+        atexit.register(self.close)
+
+    def record(self, endpoint, version, inputs, features, output, latency=None):
+        """
+        Queues one prediction (or one batch of them) for writing.
+        `features` is a feature row or a 2-D array of rows, `latency`
+        the seconds spent on the request so far. Never blocks.
+        """
+        if self._writer is None:
+            self._start()
+        entry = (time.time(), endpoint, version, inputs, features, output, latency)
+        self.recorded += 1
+        buffered = len(self._buffer)
+        if buffered >= self.capacity:
+            self._overflow(entry)
+            return
+        self._buffer.append(entry)
+        if buffered + 1 == self.batch_size:
+            self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._writer is None and not self._closing:
+                self._writer = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                self._writer.start()
+
+    def _reset_after_fork(self):
+        # The writer thread does not survive fork; records the parent
+        # buffered are its own to write
+        self._buffer = collections.deque()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._spill_file = None
+        self.spill_path = self._own_spill_path()
+        self._spill_pending = bool(self._orphaned_spills())
+        self._writer = None
+
+    # -------------------------------------------------------
+    # Overflow: spill file or drop
+    # -------------------------------------------------------
+    def _overflow(self, entry):
+        if self.overflow == "drop":
+            self.dropped += 1
+            return
+        try:
+            line = _dumps(self._row(entry)) + "\n"
+            with self._spill_lock:
+                if self._spill_file is None:
+                    # Line-buffered appends, to this process's own file
+                    self._spill_file = open(self.spill_path, "a", buffering=1, encoding="utf-8")
+                self._spill_file.write(line)
+                self._spill_pending = True
+            self.spilled += 1
+        except (OSError, TypeError, ValueError) as exc:
+            self.dropped += 1
+            self.last_error = f"spill: {exc}"
+
+    def _own_spill_path(self):
+        return f"{self.path}.{os.getpid()}.spill"
+
+    def _orphaned_spills(self):
+        # Spill and replay files whose process is gone; those of live
+        # workers (and this one) are still in use and are left alone
+        orphans = []
+        for name in glob.glob(glob.escape(self.path) + ".*spill*"):
+            owner = name[len(self.path) + 1:].split(".")[0]
+            if not owner.isdigit() or (int(owner) != os.getpid() and not _pid_alive(int(owner))):
+                orphans.append(name)
+        return orphans
+
+    def _claim(self, name):
+        # Renames a spill file to a replay file of this process, or None
+        # when another process claimed it first
+        self._replays += 1
+        replaying = f"{self.spill_path}.{self._replays}.replay"
+        try:
+            os.replace(name, replaying)
+        except FileNotFoundError:
+            return None
+        return replaying
+
+    def _take_spill(self):
+        # Moves this process's spill file aside (under the lock, so no
+        # record is half-written), and any orphaned ones, and returns the
+        # files to replay
+        with self._spill_lock:
+            self._spill_pending = False
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+            taken = [self._claim(self.spill_path)] if os.path.exists(self.spill_path) else []
+        taken += [self._claim(name) for name in self._orphaned_spills()]
+        return [replaying for replaying in taken if replaying is not None]
+
+    def _read_spill(self, path):
+        # Skips (and counts) lines that are not a whole record, such as
+        # one cut short by a crash mid-write
+        rows = []
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                if not isinstance(row, list) or len(row) != INSERT.count("?"):
+                    self.malformed += 1
+                    self.dropped += 1
+                    continue
+                rows.append(tuple(row))
+        return rows
+
+    # -------------------------------------------------------
+    # Writer thread
+    # -------------------------------------------------------
+    def _row(self, entry):
+        # Serialized in the writer thread (or when spilling), not per request
+        ts, endpoint, version, inputs, features, output, latency = entry
+        shape = getattr(features, "shape", None)
+        if shape is not None:
+            rows = shape[0] if len(shape) == 2 else 1
+        else:
+            rows = len(features) if features and isinstance(features[0], (list, tuple)) else 1
+        return (ts, self.app_name, self.model_name, version, endpoint, rows, _dumps(inputs),
+                _dumps(features), _dumps(output), None if latency is None else latency * 1000.0)
+
+    def _insert(self, conn, rows):
+        try:
+            with conn:
+                conn.executemany(INSERT, rows)
+        except sqlite3.Error as exc:
+            self.errors += 1
+            self.dropped += len(rows)
+            self.last_error = f"sqlite: {exc}"
+            return False
+        self.written += len(rows)
+        self.batches += 1
+        return True
+
+    def _drain(self, conn):
+        buffer = self._buffer
+        while buffer:
+            batch = []
+            while buffer and len(batch) < self.batch_size:
+                batch.append(buffer.popleft())
+            self._insert(conn, [self._row(entry) for entry in batch])
+
+        # Caught up: replay what overflowed meanwhile (or before a restart)
+        if self._spill_pending:
+            for replaying in self._take_spill():
+                rows = self._read_spill(replaying)
+                for start in range(0, len(rows), self.batch_size):
+                    if self._insert(conn, rows[start:start + self.batch_size]):
+                        self.replayed += len(rows[start:start + self.batch_size])
+                os.remove(replaying)
+
+    def _run(self):
+        try:
+            conn = connect(self.path)
+        except (OSError, sqlite3.Error) as exc:
+            # Cannot write at all: keep the apps serving, drop the records
+            self.errors += 1
+            self.last_error = f"open: {exc}"
+            print(f"Audit log disabled, cannot open {self.path}: {exc}", file=sys.stderr)
+            self.overflow = "drop"
+            self.capacity = 0
+            self.dropped += len(self._buffer)
+            self._buffer.clear()
+            return
+        try:
+            while True:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                self._drain_safely(conn)
+                if self._closing:
+                    self._drain_safely(conn)
+                    return
+        finally:
+            conn.close()
+
+    def _drain_safely(self, conn):
+        # A failure is counted and reported; the writer keeps running
+        try:
+            self._drain(conn)
+        except Exception as exc:
+            self.errors += 1
+            self.last_error = f"writer: {type(exc).__name__}: {exc}"
+            print(f"Audit log writer error: {self.last_error}", file=sys.stderr)
+
+    def flush(self, timeout=5.0):
+        """
+        Waits until everything recorded so far is written (or timeout).
+        """
+        deadline = time.monotonic() + timeout
+        while (self._buffer or self._spill_pending) and time.monotonic() < deadline:
+            if self._writer is None or not self._writer.is_alive():
+                return False
+            self._wake.set()
+            time.sleep(0.005)
+        return not self._buffer and not self._spill_pending
+
+    def close(self, timeout=5.0):
+        """
+        Writes the remaining records and stops the writer thread.
+        """
+        self._closing = True
+        writer = self._writer
+        if writer is not None and writer.is_alive():
+            self._wake.set()
+            writer.join(timeout)
+
+    def stats(self):
+        """
+        Returns record counters and the current buffer depth.
+        """
+        return {
+            "enabled": True,
+            "path": self.path,
+            "recorded": self.recorded,
+            "written": self.written,
+            "batches": self.batches,
+            "mean_batch_size": self.written / self.batches if self.batches else 0.0,
+            "buffered": len(self._buffer),
+            "capacity": self.capacity,
+            "overflow": self.overflow,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+            "malformed": self.malformed,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+class DisabledAuditLog:
+    """
+    Stand-in with the same interface when AUDIT_LOG=0.
+    """
+
+    def record(self, endpoint, version, inputs, features, output, latency=None):
+        pass
+
+    def flush(self, timeout=5.0):
+        return True
+
+    def close(self, timeout=5.0):
+        pass
+
+    def stats(self):
+        return {"enabled": False}
+
+
+def audit_from_env(app_name, model_name):
+    """
+    Builds the audit log configured by the AUDIT_LOG_* variables.
+    """
+    if not ENABLED:
+        return DisabledAuditLog()
+    return AuditLog(
+        app_name,
+        model_name,
+        path=DEFAULT_PATH,
+        capacity=int(os.environ.get("AUDIT_LOG_CAPACITY", "10000")),
+        batch_size=int(os.environ.get("AUDIT_LOG_BATCH", "500")),
+        flush_ms=float(os.environ.get("AUDIT_LOG_FLUSH_MS", "200")),
+        overflow=os.environ.get("AUDIT_LOG_OVERFLOW", "spill"),
+    )
+
+
+def add_audit_gauges(metrics, audit):
+    """
+    Exposes the audit counters at /metrics.
+    """
+    metrics.add_gauge(
+        "audit_log_records_total", "Prediction audit records by outcome.", ("app", "result"),
+        lambda: [((metrics.app_name, result), audit.stats().get(result, 0))
+                 for result in ("recorded", "written", "spilled", "dropped")],
+        kind="counter"
+    )
+    metrics.add_gauge(
+        "audit_log_buffered", "Audit records waiting for the writer thread.", ("app",),
+        lambda: [((metrics.app_name,), audit.stats().get("buffered", 0))]
+    )
+
+
+# ===========================================================
+# COMMAND LINE: BENCHMARK / TAIL
+# ===========================================================
+def _count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def bench(n_records=100000, capacity=10000):
+    """
+    Records `n_records` flight-sized predictions into a scratch database
+    and checks that every one of them was written exactly once.
+    """
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(prefix="audit-"), "audit.db")
+    audit = AuditLog("bench", "flight", path=path, capacity=capacity)
+    inputs = {"airline": "IndiGo", "source": "Delhi", "destination": "Cochin",
+              "total_stops": "1 stop", "duration_hours": 2.5, "month": 3}
+    features = [3.0, 2.0, 1.0, 1.0, 2.5, 3]
+    output = {"price": 5432.1}
+
+    # Timed one call at a time: the writer thread competes for the GIL,
+    # and calls that find the buffer full spill to disk
+    clock = time.perf_counter
+    timings = []
+    for _ in range(n_records):
+        start = clock()
+        audit.record("/api/predict", "v1", inputs, features, output, 1e-4)
+        timings.append(clock() - start)
+    timings.sort()
+    start = time.perf_counter()
+    audit.flush(timeout=120)
+    audit.close()
+    drain = time.perf_counter() - start
+    stats = audit.stats()
+    stored = _count(path)
+
+    print(f"record(): median {timings[len(timings) // 2] * 1e6:.2f} µs, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.2f} µs per call")
+    print(f"writer: {stats['written']} rows in {stats['batches']} batches "
+          f"(mean {stats['mean_batch_size']:.0f}), {drain:.2f} s to drain after the last record")
+    print(f"spilled {stats['spilled']} (replayed {stats['replayed']}), dropped {stats['dropped']}")
+    print(f"Database {path}: {stored} rows, expected {n_records}")
+    return stored == n_records and stats["dropped"] == 0
+
+
+def tail(n=10, path=DEFAULT_PATH):
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT ts, app, model_version, endpoint, rows, inputs, output, latency_ms "
+            "FROM predictions ORDER BY id DESC LIMIT ?", (n,)
+        ).fetchall()
+    finally:
+        conn.close()
+    for ts, app, version, endpoint, count, inputs, output, latency in reversed(rows):
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+        latency = "-" if latency is None else f"{latency:.2f} ms"
+        print(f"{stamp} {app} {endpoint} v={version} rows={count} {latency} {inputs} -> {output}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    command = args.pop(0) if args else "bench"
+
+    def option(name, default):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    if command == "bench":
+        capacity = int(option("--capacity", "10000"))
+        ok = bench(int(args[0]) if args else 100000, capacity)
+        sys.exit(0 if ok else 1)
+    elif command == "tail":
+        path = option("--path", DEFAULT_PATH)
+        tail(int(args[0]) if args else 10, path)
+    else:
+        sys.exit(f"Unknown command {command!r}; use bench or tail")
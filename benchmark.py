@@ -0,0 +1,824 @@
+"""
+===========================================================
+ LOAD-TESTING AND LATENCY BENCHMARK SUITE
+===========================================================
+
+Measures every deployment target on this machine with
+synthetic data, so no Windows CSV paths or KaggleHub
+download are needed:
+
+1. Synthetic flight and earthquake CSVs are written to a
+   temporary directory, and FLIGHT_DATASET_PATH,
+   EARTHQUAKE_DATASET_PATH and MODEL_ARTIFACT_DIR point
+   the apps at them (huggingface.py then skips KaggleHub).
+2. Raw model paths are timed in-process, separately from
+   any web framework: sklearn `model.predict` /
+   `rf_model.predict`, the old `safe_transform` encoding,
+   and the compiled tree / price table / packed forest
+   that the apps use now.
+3. Each app is started (Flask, Dash, FastAPI and Gradio
+   as subprocesses; Streamlit in-process through its
+   AppTest runner) and driven by N client threads over
+   keep-alive connections. Throughput, p50/p95/p99
+   latency, server CPU and peak RSS are reported.
+4. Cold start: each serving entry point is imported in a
+   fresh `python -X importtime` process with SERVING_ONLY=1
+   (model load included). The run fails (exit status 1)
+   if an import fails, exceeds its budget or pulls in
+   pandas, sklearn or joblib.
+5. Streamlit reruns: streamlitapp.py is rerun after each
+   widget change for flight datasets of increasing size;
+   the rerun latency should not grow with the row count.
+
+Results are printed and written as JSON; pass an earlier
+file with --compare to see the change per measurement.
+
+    python benchmark.py
+    python benchmark.py --targets fastapi,flask --concurrency 1,16 --duration 5
+    python benchmark.py --targets models --output before.json
+    python benchmark.py --compare before.json
+    python benchmark.py --targets imports
+    python benchmark.py --targets streamlit-reruns --streamlit-rows 2000,20000,200000
+===========================================================
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from urllib.parse import urlencode
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HOST = "127.0.0.1"
+
+FLIGHT_REQUEST = {
+    "airline": "indigo", "source": "delhi", "destination": "cochin",
+    "stops": "1 stop", "duration": 5.5, "month": 3,
+}
+EARTHQUAKE_REQUEST = {"magnitude": 7.0, "depth": 10.0, "cdi": 8.0, "mmi": 7.0, "sig": 900.0}
+
+# ===========================================================
+# 1) SYNTHETIC DATA
+# ===========================================================
+AIRLINES = ['IndiGo', 'Air India', 'Jet Airways', 'SpiceJet', 'Multiple carriers', 'GoAir', 'Vistara', 'Air Asia']
+SOURCES = ['Banglore', 'Kolkata', 'Delhi', 'Chennai', 'Mumbai']
+DESTINATIONS = ['New Delhi', 'Banglore', 'Cochin', 'Kolkata', 'Delhi', 'Hyderabad']
+STOPS = ['non-stop', '1 stop', '2 stops', '3 stops', '4 stops']
+
+
+def write_flight_dataset(path, n_rows, seed=0):
+    """
+    Flight CSV with the columns the apps train on and a price that
+    depends on every feature, plus noise.
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    airline = rng.integers(0, len(AIRLINES), n_rows)
+    stops = rng.choice(len(STOPS), n_rows, p=[0.35, 0.4, 0.2, 0.04, 0.01])
+    duration = np.round(rng.uniform(1, 30, n_rows), 2)
+    month = rng.integers(1, 13, n_rows)
+    price = (3000 + 900 * airline + 1500 * stops + 120 * duration
+             + 250 * np.abs(month - 6) + rng.normal(0, 400, n_rows))
+    pd.DataFrame({
+        'Airline': np.array(AIRLINES)[airline],
+        'Source': rng.choice(SOURCES, n_rows),
+        'Destination': rng.choice(DESTINATIONS, n_rows),
+        'Total_Stops': np.array(STOPS)[stops],
+        'Duration_hours': duration,
+        'Month': month,
+        'Price': price,
+    }).to_csv(path, index=False)
+
+
+def write_earthquake_dataset(path, n_rows, seed=0):
+    """
+    Earthquake CSV whose alert level follows significance and MMI.
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    magnitude = rng.uniform(6.5, 9.1, n_rows)
+    mmi = np.clip(np.round(magnitude - 1 + rng.normal(0, 1, n_rows)), 1, 10)
+    sig = np.round(650 + (magnitude - 6.5) * 500 + rng.normal(0, 150, n_rows))
+    score = sig / 400 + mmi / 3 + rng.normal(0, 0.4, n_rows)
+    alert = np.array(['green', 'yellow', 'orange', 'red'])[np.digitize(score, [4.2, 5.0, 5.8])]
+    pd.DataFrame({
+        'magnitude': magnitude,
+        'depth': rng.uniform(2, 670, n_rows),
+        'cdi': np.clip(np.round(mmi + rng.normal(0, 1.5, n_rows)), 0, 9),
+        'mmi': mmi,
+        'sig': sig,
+        'alert': alert,
+    }).to_csv(path, index=False)
+
+
+def prepare_environment(workdir, n_rows):
+    """
+    Writes the synthetic datasets and points the apps at them.
+    Returns the environment for subprocesses.
+    """
+    flight_path = os.path.join(workdir, "flight_dataset.csv")
+    earthquake_path = os.path.join(workdir, "earthquake_alert_balanced_dataset.csv")
+    write_flight_dataset(flight_path, n_rows)
+    write_earthquake_dataset(earthquake_path, max(n_rows // 4, 200))
+    os.environ.update({
+        "FLIGHT_DATASET_PATH": flight_path,
+        "EARTHQUAKE_DATASET_PATH": earthquake_path,
+        "MODEL_ARTIFACT_DIR": os.path.join(workdir, "artifacts"),
+        "DATASET_CACHE_DIR": os.path.join(workdir, "artifacts", "datasets"),
+        "GRADIO_ANALYTICS_ENABLED": "False",
+    })
+    return dict(os.environ)
+
+# ===========================================================
+# 2) RAW MODEL PATHS
+# ===========================================================
+def _per_call(fn, repeat, rounds=5):
+    # Best-of-rounds mean time per call, in seconds
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def _legacy_safe_transform(encoder, value):
+    # The per-request encoding the apps used before encoding.py
+    if value in encoder.classes_:
+        return encoder.transform([value])[0]
+    return -1
+
+
+def benchmark_model_paths(batch_rows=10000):
+    """
+    Times the model and encoding code paths without any web framework.
+    """
+    import pandas as pd
+    import model_store
+    from encoding import FlightEncoder
+    from price_table import PriceTable
+    from tree_engine import CompiledTree, PackedForest
+
+    results = []
+
+    def record(model, path, seconds, rows=1):
+        results.append({"model": model, "path": path, "rows": rows,
+                        "us_per_call": seconds * 1e6, "rows_per_second": rows / seconds})
+
+    flight = model_store.load_artifact("flight")
+    model, encoders = flight["model"], flight["label_encoders"]
+    compiled = CompiledTree.from_sklearn(model)
+    table = PriceTable.materialize(compiled, len(flight["features"]))
+    encoder = FlightEncoder.from_artifact(flight)
+    raw = FLIGHT_REQUEST
+    row = encoder.encode_row(raw["airline"], raw["source"], raw["destination"],
+                             raw["stops"], raw["duration"], raw["month"])
+    X = np.tile(np.asarray(row, dtype=np.float64), (batch_rows, 1))
+    X[:, 4] = np.random.default_rng(0).uniform(1, 30, batch_rows)
+
+    record("flight", "safe_transform x3 + stops_mapping", _per_call(lambda: [
+        _legacy_safe_transform(encoders['Airline'], raw["airline"]),
+        _legacy_safe_transform(encoders['Source'], raw["source"]),
+        _legacy_safe_transform(encoders['Destination'], raw["destination"]),
+        flight["stops_mapping"].get(raw["stops"], 0)], 200))
+    record("flight", "FlightEncoder.encode_row", _per_call(lambda: encoder.encode_row(
+        raw["airline"], raw["source"], raw["destination"], raw["stops"], raw["duration"], raw["month"]), 20000))
+    record("flight", "model.predict (1 row)", _per_call(lambda: model.predict([row]), 200))
+    record("flight", "CompiledTree.predict_one", _per_call(lambda: compiled.predict_one(row), 20000))
+    record("flight", "PriceTable.predict_one", _per_call(lambda: table.predict_one(row), 20000))
+    record("flight", "model.predict (batch)", _per_call(lambda: model.predict(X), 3), batch_rows)
+    record("flight", "CompiledTree.predict (batch)", _per_call(lambda: compiled.predict(X), 3), batch_rows)
+    record("flight", "PriceTable.lookup (batch)", _per_call(lambda: table.lookup(X), 3), batch_rows)
+
+    quake = model_store.load_artifact("earthquake")
+    rf_model = quake["model"]
+    forest = PackedForest.from_sklearn(rf_model)
+    frame = pd.DataFrame([EARTHQUAKE_REQUEST])[quake["features"]]
+    event = frame.to_numpy(dtype=np.float64)
+    events = np.tile(event, (batch_rows, 1)) * np.random.default_rng(0).uniform(0.8, 1.2, (batch_rows, 5))
+
+    # The original app's call: the forest was fitted on arrays, so sklearn
+    # warns about the DataFrame's column names on every call
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X has feature names")
+        record("earthquake", "rf_model.predict (1-row DataFrame)", _per_call(lambda: rf_model.predict(frame), 20))
+    record("earthquake", "PackedForest.predict (1 row)", _per_call(lambda: forest.predict(event), 500))
+    record("earthquake", "PackedForest early exit (1 row)", _per_call(lambda: forest.predict_early_exit(event), 500))
+    record("earthquake", "rf_model.predict (batch)", _per_call(lambda: rf_model.predict(events), 3), batch_rows)
+    record("earthquake", "PackedForest.predict (batch)", _per_call(lambda: forest.predict(events), 3), batch_rows)
+    return results
+
+# ===========================================================
+# 3) APP TARGETS
+# ===========================================================
+def _free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+class HttpTarget:
+    """
+    An app started as a subprocess and called over HTTP.
+    """
+
+    def __init__(self, name, command, method, path, body, headers, env=None, ready_path="/"):
+        self.name = name
+        self.command = command
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers
+        self.env = env or {}
+        self.ready_path = ready_path
+        self.port = None
+        self.process = None
+        self.startup_seconds = None
+
+    def start(self, env, timeout=180):
+        self.port = _free_port()
+        command = [part.replace("{port}", str(self.port)) for part in self.command]
+        extra_env = {key: value.replace("{port}", str(self.port)) for key, value in self.env.items()}
+        # Server logs go to a file: a full pipe would block the server
+        self.log = tempfile.TemporaryFile()
+        start = time.perf_counter()
+        self.process = subprocess.Popen(command, cwd=HERE, env={**env, **extra_env},
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                self.log.seek(0)
+                raise RuntimeError(f"{self.name} exited: {self.log.read().decode(errors='replace')[-2000:]}")
+            try:
+                conn = http.client.HTTPConnection(HOST, self.port, timeout=5)
+                conn.request("GET", self.ready_path)
+                conn.getresponse().read()
+                conn.close()
+                self.startup_seconds = time.perf_counter() - start
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f"{self.name} did not start within {timeout} s")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.log.close()
+
+    def client(self):
+        # One keep-alive connection per client thread
+        conn = http.client.HTTPConnection(HOST, self.port, timeout=30)
+
+        def call():
+            conn.request(self.method, self.path, body=self.body, headers=self.headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+        return call
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+
+class GradioTarget(HttpTarget):
+    """
+    huggingface.py as a subprocess, called through gradio_client.
+    """
+
+    def __init__(self):
+        super().__init__("gradio", [sys.executable, "huggingface.py"], "GET", "/", None, {},
+                         env={"GRADIO_SERVER_PORT": "{port}", "GRADIO_SERVER_NAME": HOST})
+
+    def client(self):
+        from gradio_client import Client
+
+        client = Client(f"http://{HOST}:{self.port}/", verbose=False)
+        values = [EARTHQUAKE_REQUEST[key] for key in ("magnitude", "depth", "cdi", "mmi", "sig")]
+        return lambda: client.predict(*values, api_name="/predict")
+
+
+class StreamlitTarget:
+    """
+    streamlitapp.py run in-process by streamlit's AppTest; every call is
+    one full script rerun with the button clicked.
+    """
+
+    name = "streamlit"
+    startup_seconds = None
+    pid = None
+
+    def start(self, env, timeout=180):
+        from streamlit.testing.v1 import AppTest
+
+        self._app_test = AppTest
+        start = time.perf_counter()
+        self.client()()
+        self.startup_seconds = time.perf_counter() - start
+
+    def stop(self):
+        pass
+
+    def client(self):
+        app = self._app_test.from_file(os.path.join(HERE, "streamlitapp.py"), default_timeout=60)
+        app.run()
+
+        def call():
+            app.number_input[0].set_value(FLIGHT_REQUEST["duration"])
+            app.button[0].click()
+            app.run()
+            if app.exception:
+                raise RuntimeError(str(app.exception[0].message))
+        return call
+
+
+def make_targets():
+    """
+    Every deployment target, keyed by name.
+    """
+    py = sys.executable
+    raw = FLIGHT_REQUEST
+    flask_form = urlencode({
+        "Airline": raw["airline"], "Source": raw["source"], "Destination": raw["destination"],
+        "Total Stops (e.g. 'non-stop', '1 stop')": raw["stops"],
+        "Duration Hours": raw["duration"], "Month (1-12)": raw["month"],
+    })
+    flask_api = json.dumps({
+        "airline": raw["airline"], "source": raw["source"], "destination": raw["destination"],
+        "total_stops": raw["stops"], "duration_hours": float(raw["duration"]), "month": int(raw["month"]),
+    })
+    dash_update = json.dumps({
+        "output": "prediction-output.children",
+        "outputs": {"id": "prediction-output", "property": "children"},
+        "inputs": [{"id": "predict-price-button", "property": "n_clicks", "value": 1}],
+        "changedPropIds": ["predict-price-button.n_clicks"],
+        "state": [
+            {"id": "airline-input", "property": "value", "value": raw["airline"]},
+            {"id": "Source-input", "property": "value", "value": raw["source"]},
+            {"id": "Destination-input", "property": "value", "value": raw["destination"]},
+            {"id": "stops-input", "property": "value", "value": 1},
+            {"id": "duration-input", "property": "value", "value": raw["duration"]},
+            {"id": "month-input", "property": "value", "value": raw["month"]},
+        ],
+    })
+    form = {"Content-Type": "application/x-www-form-urlencoded"}
+    as_json = {"Content-Type": "application/json"}
+    return {
+        "flask": HttpTarget(
+            "flask", [py, "-c", f"import appflask; appflask.serve('{HOST}', {{port}})"],
+            "POST", "/", flask_form, form),
+        "flask-api": HttpTarget(
+            "flask-api", [py, "-c", f"import appflask; appflask.serve('{HOST}', {{port}})"],
+            "POST", "/api/predict", flask_api, as_json),
+        "dash": HttpTarget(
+            "dash", [py, "-c", f"import appdash; appdash.app.run(host='{HOST}', port={{port}}, debug=False)"],
+            "POST", "/_dash-update-component", dash_update, as_json),
+        "fastapi": HttpTarget(
+            "fastapi", [py, "-m", "uvicorn", "modelfastapi:app", "--host", HOST, "--port", "{port}",
+                        "--log-level", "warning"],
+            "POST", "/predict", json.dumps(EARTHQUAKE_REQUEST), as_json),
+        "gradio": GradioTarget(),
+        "streamlit": StreamlitTarget(),
+    }
+
+# ===========================================================
+# 4) LOAD DRIVER
+# ===========================================================
+class ResourceSampler:
+    """
+    Samples CPU time and RSS of a process (and its children) while
+    a load test runs.
+    """
+
+    def __init__(self, pid, interval=0.2):
+        self.process = psutil.Process(pid) if psutil is not None and pid else None
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+
+    def _processes(self):
+        try:
+            return [self.process] + self.process.children(recursive=True)
+        except psutil.Error:
+            return []
+
+    def _cpu_seconds(self):
+        total = 0.0
+        for proc in self._processes():
+            try:
+                times = proc.cpu_times()
+                total += times.user + times.system
+            except psutil.Error:
+                pass
+        return total
+
+    def _sample_rss(self):
+        rss = 0
+        for proc in self._processes():
+            try:
+                rss += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._sample_rss()
+
+    def __enter__(self):
+        if self.process is not None:
+            self._cpu_start = self._cpu_seconds()
+            self._wall_start = time.perf_counter()
+            self._sample_rss()
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.process is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample_rss()
+            wall = time.perf_counter() - self._wall_start
+            self.cpu_percent = 100.0 * (self._cpu_seconds() - self._cpu_start) / wall
+        return False
+
+    def summary(self):
+        if self.process is None:
+            return {"cpu_percent": None, "peak_rss_mb": None}
+        return {"cpu_percent": self.cpu_percent, "peak_rss_mb": self.peak_rss / 2**20}
+
+
+def run_load(target, concurrency, duration, warmup=20):
+    """
+    Drives `target` from `concurrency` threads for `duration` seconds.
+    """
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    clients = [target.client() for _ in range(concurrency)]
+    for call in clients:
+        for _ in range(max(1, warmup // concurrency)):
+            call()
+
+    start_barrier = threading.Barrier(concurrency + 1)
+    stop_at = [0.0]
+
+    def worker(i):
+        call, record = clients[i], latencies[i].append
+        start_barrier.wait()
+        while time.perf_counter() < stop_at[0]:
+            t0 = time.perf_counter()
+            try:
+                call()
+            except Exception:
+                errors[i] += 1
+                continue
+            record(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    with ResourceSampler(target.pid) as sampler:
+        stop_at[0] = time.perf_counter() + duration
+        start = time.perf_counter()
+        start_barrier.wait()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    all_latencies = np.concatenate([np.asarray(l) for l in latencies]) * 1e3
+    n_ok = int(all_latencies.size)
+    p50, p95, p99 = np.percentile(all_latencies, [50, 95, 99]) if n_ok else (None, None, None)
+    return {
+        "target": target.name,
+        "concurrency": concurrency,
+        "duration_seconds": elapsed,
+        "requests": n_ok,
+        "errors": int(sum(errors)),
+        "throughput_rps": n_ok / elapsed,
+        "latency_ms": {
+            "p50": p50 and float(p50), "p95": p95 and float(p95), "p99": p99 and float(p99),
+            "mean": float(all_latencies.mean()) if n_ok else None,
+            "max": float(all_latencies.max()) if n_ok else None,
+        },
+        "startup_seconds": target.startup_seconds,
+        **sampler.summary(),
+    }
+
+# ===========================================================
+# 5) COLD START IMPORT TIME
+# ===========================================================
+# Milliseconds allowed for `import <entry point>`, model load included
+IMPORT_BUDGETS_MS = {"appflask": 1000, "modelfastapi": 1500, "appdash": 2000}
+
+# Training-only modules a serving process must not import
+TRAINING_MODULES = ("pandas", "sklearn", "joblib")
+
+
+def measure_import(module, env, runs=3):
+    """
+    Best-of-`runs` cumulative import time of `module` from
+    `python -X importtime`, and the training modules it loaded.
+    """
+    code = (f"import sys, {module}; "
+            f"print('loaded:' + ','.join(m for m in {TRAINING_MODULES!r} if m in sys.modules))")
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE,
+                              env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+        for line in proc.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == module and parts[2].startswith(" " + module):
+                micros = int(parts[1])
+                best = micros if best is None else min(best, micros)
+        loaded = [m for m in proc.stdout.rsplit("loaded:", 1)[-1].strip().split(",") if m]
+    return best / 1000.0, loaded
+
+
+def benchmark_imports(env, budget_scale=1.0):
+    """
+    Cold-start import time of every serving entry point in serving-only
+    mode, checked against IMPORT_BUDGETS_MS (scaled by `budget_scale`).
+    """
+    # A normal start first builds the artifacts and serving bundles
+    for module in IMPORT_BUDGETS_MS:
+        try:
+            measure_import(module, env, runs=1)
+        except RuntimeError:
+            pass
+    serving_env = {**env, "SERVING_ONLY": "1"}
+    results = []
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        try:
+            import_ms, loaded = measure_import(module, serving_env)
+        except RuntimeError as exc:
+            # An entry point that no longer imports fails the gate
+            results.append({"module": module, "error": str(exc), "ok": False})
+            continue
+        budget_ms = budget * budget_scale
+        results.append({
+            "module": module,
+            "import_ms": import_ms,
+            "budget_ms": budget_ms,
+            "training_modules": loaded,
+            "ok": import_ms <= budget_ms and not loaded,
+        })
+    return results
+
+# ===========================================================
+# 6) STREAMLIT RERUN LATENCY VS DATASET SIZE
+# ===========================================================
+# Runs streamlitapp.py once, then reruns it after each widget change
+STREAMLIT_RERUN_CODE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=300)
+start = time.perf_counter()
+app.run()
+first = time.perf_counter() - start
+reruns = []
+for i in range(int(sys.argv[2])):
+    app.number_input[0].set_value(0.5 * (i % 20 + 1))
+    start = time.perf_counter()
+    app.run()
+    reruns.append(time.perf_counter() - start)
+    if app.exception:
+        raise RuntimeError(str(app.exception[0].message))
+print("reruns:" + json.dumps({"first_run": first, "reruns": reruns}))
+"""
+
+
+def measure_streamlit_reruns(env, reruns=30):
+    """
+    First-run and per-rerun seconds of streamlitapp.py, in a fresh process.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-c", STREAMLIT_RERUN_CODE, os.path.join(HERE, "streamlitapp.py"), str(reruns)],
+        cwd=HERE, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return json.loads(proc.stdout.rsplit("reruns:", 1)[-1])
+
+
+def benchmark_streamlit_reruns(workdir, row_counts):
+    """
+    Median / p95 Streamlit rerun latency for flight datasets of each
+    size in `row_counts`, each with its own artifacts.
+    """
+    results = []
+    for n_rows in row_counts:
+        directory = os.path.join(workdir, f"streamlit-{n_rows}")
+        os.makedirs(directory, exist_ok=True)
+        dataset_path = os.path.join(directory, "flight_dataset.csv")
+        write_flight_dataset(dataset_path, n_rows)
+        env = {
+            **os.environ,
+            "FLIGHT_DATASET_PATH": dataset_path,
+            "MODEL_ARTIFACT_DIR": os.path.join(directory, "artifacts"),
+            "DATASET_CACHE_DIR": os.path.join(directory, "artifacts", "datasets"),
+        }
+        try:
+            timings = measure_streamlit_reruns(env)
+        except RuntimeError as exc:
+            results.append({"rows": n_rows, "skipped": str(exc)})
+            continue
+        reruns_ms = np.array(timings["reruns"]) * 1000.0
+        results.append({
+            "rows": n_rows,
+            "first_run_ms": timings["first_run"] * 1000.0,
+            "rerun_p50_ms": float(np.percentile(reruns_ms, 50)),
+            "rerun_p95_ms": float(np.percentile(reruns_ms, 95)),
+        })
+    return results
+
+# ===========================================================
+# 7) REPORTING
+# ===========================================================
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_model_paths(results):
+    print("\nModel paths (no web framework):")
+    for r in results:
+        print(f"  {r['model']:<11} {r['path']:<38} {r['us_per_call']:12.1f} us/call"
+              f"   {r['rows_per_second']:14,.0f} rows/s")
+
+
+def _print_imports(results):
+    print("\nCold start (python -X importtime, SERVING_ONLY=1):")
+    for r in results:
+        if "error" in r:
+            print(f"  {r['module']:<13} FAIL: {r['error']}")
+            continue
+        extra = f"   imports {', '.join(r['training_modules'])}!" if r["training_modules"] else ""
+        print(f"  {r['module']:<13} {r['import_ms']:8.1f} ms   budget {r['budget_ms']:7.0f} ms"
+              f"   {'ok' if r['ok'] else 'FAIL'}{extra}")
+
+
+def _print_streamlit_reruns(results):
+    print("\nStreamlit reruns by dataset size:")
+    for r in results:
+        if "skipped" in r:
+            print(f"  {r['rows']:>9,} rows   skipped: {r['skipped']}")
+            continue
+        print(f"  {r['rows']:>9,} rows   first run {r['first_run_ms']:8.1f} ms"
+              f"   rerun p50 {r['rerun_p50_ms']:7.2f}  p95 {r['rerun_p95_ms']:7.2f} ms")
+    measured = [r for r in results if "skipped" not in r]
+    if len(measured) > 1:
+        growth = measured[-1]["rerun_p50_ms"] / measured[0]["rerun_p50_ms"]
+        print(f"  rerun p50 at {measured[-1]['rows']:,} rows is {growth:.2f}x "
+              f"the one at {measured[0]['rows']:,} rows")
+
+
+def _print_load(result):
+    if "skipped" in result:
+        print(f"  {result['target']:<10} skipped: {result['skipped']}")
+        return
+    lat = result["latency_ms"]
+    cpu = "n/a" if result["cpu_percent"] is None else f"{result['cpu_percent']:.0f}%"
+    rss = "n/a" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:.0f} MB"
+    print(f"  {result['target']:<10} c={result['concurrency']:<4} {result['throughput_rps']:9.1f} req/s"
+          f"   p50 {lat['p50']:7.2f}  p95 {lat['p95']:7.2f}  p99 {lat['p99']:7.2f} ms"
+          f"   errors {result['errors']:<4} cpu {cpu:>5}  rss {rss}")
+
+
+def _compare(previous_path, current):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\nChange vs {previous_path} (commit {previous['meta'].get('commit')}):")
+    before = {(r["model"], r["path"]): r for r in previous.get("model_paths", [])}
+    for r in current.get("model_paths", []):
+        old = before.get((r["model"], r["path"]))
+        if old:
+            print(f"  {r['model']:<11} {r['path']:<38} {old['us_per_call'] / r['us_per_call']:6.2f}x faster")
+    before = {r["module"]: r for r in previous.get("imports", []) if "import_ms" in r}
+    for r in current.get("imports", []):
+        old = before.get(r["module"])
+        if old and "import_ms" in r:
+            print(f"  import {r['module']:<13} {old['import_ms']:.1f} -> {r['import_ms']:.1f} ms")
+    before = {(r["target"], r.get("concurrency")): r for r in previous.get("load", []) if "skipped" not in r}
+    for r in current.get("load", []):
+        old = before.get((r["target"], r.get("concurrency")))
+        if old and "skipped" not in r:
+            print(f"  {r['target']:<10} c={r['concurrency']:<4} throughput "
+                  f"{r['throughput_rps'] / old['throughput_rps']:6.2f}x   p99 "
+                  f"{old['latency_ms']['p99']:.2f} -> {r['latency_ms']['p99']:.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the model paths and every deployment target.")
+    parser.add_argument("--targets",
+                        default="models,imports,flask,flask-api,dash,fastapi,gradio,streamlit,streamlit-reruns",
+                        help="comma-separated: models, imports and/or app names")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated client thread counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per load test")
+    parser.add_argument("--rows", type=int, default=20000, help="rows in the synthetic flight dataset")
+    parser.add_argument("--streamlit-rows", default="2000,20000,200000",
+                        help="comma-separated flight dataset sizes for streamlit-reruns")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--import-budget-scale", type=float, default=1.0,
+                        help="multiply the cold-start import budgets (slower machines)")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.targets.split(",") if name.strip()]
+    concurrency = [int(c) for c in args.concurrency.split(",")]
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    env = prepare_environment(workdir, args.rows)
+
+    results = {
+        "meta": {
+            "created_at": time.time(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "concurrency": concurrency,
+            "duration_seconds": args.duration,
+            "dataset_rows": args.rows,
+        },
+        "model_paths": [],
+        "imports": [],
+        "streamlit_reruns": [],
+        "load": [],
+    }
+
+    if "models" in names:
+        results["model_paths"] = benchmark_model_paths()
+        _print_model_paths(results["model_paths"])
+
+    if "imports" in names:
+        results["imports"] = benchmark_imports(env, args.import_budget_scale)
+        _print_imports(results["imports"])
+
+    if "streamlit-reruns" in names:
+        row_counts = [int(n) for n in args.streamlit_rows.split(",")]
+        results["streamlit_reruns"] = benchmark_streamlit_reruns(workdir, row_counts)
+        _print_streamlit_reruns(results["streamlit_reruns"])
+
+    targets = make_targets()
+    app_names = [name for name in names if name not in ("models", "imports", "streamlit-reruns")]
+    if app_names:
+        print("\nLoad tests:")
+    for name in app_names:
+        target = targets[name]
+        try:
+            target.start(env)
+        except (ImportError, RuntimeError) as exc:
+            result = {"target": name, "skipped": str(exc).strip().splitlines()[-1]}
+            results["load"].append(result)
+            _print_load(result)
+            continue
+        try:
+            for c in concurrency:
+                result = run_load(target, c, args.duration)
+                results["load"].append(result)
+                _print_load(result)
+        finally:
+            target.stop()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        _compare(args.compare, results)
+    return results
+
+
+if __name__ == "__main__":
+    results = main()
+    # Cold start over budget, training modules imported or an entry point
+    # that fails to import fails the run
+    if any(not r["ok"] for r in results["imports"]):
+        sys.exit(1)
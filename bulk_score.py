@@ -0,0 +1,334 @@
+"""
+===========================================================
+ OFFLINE BULK SCORING (STREAMING, MULTIPROCESS)
+===========================================================
+
+Scores whole files with the flight price model or the
+earthquake forest, without the web apps:
+
+- the input (CSV, or Parquet with pyarrow) is read in
+  chunks of BULK_CHUNK_ROWS rows, never as a whole
+- flight rows are encoded with the same normalization as
+  training and the apps (strip + lowercase categories,
+  stop labels through stops_mapping, unknown → -1 / 0,
+  see encoding.py); earthquake rows use the feature columns
+- chunks are scored on a pool of worker processes that
+  each hold the model once (inherited through fork where
+  available, otherwise loaded from the serving bundle)
+- at most 2 chunks per worker are in flight and results
+  are written in input order as they finish, to CSV or
+  Parquet, so memory stays bounded by the chunk size;
+  for Parquet, CSV columns keep the first chunk's types
+  (integers nullable) so every chunk fits one schema
+- progress (rows and rows/sec) goes to stderr
+
+Run:
+    python bulk_score.py flight INPUT OUTPUT [options]
+    python bulk_score.py earthquake INPUT OUTPUT [options]
+
+Options:
+    --workers N        worker processes (BULK_WORKERS, default: CPU count;
+                       1 scores in this process)
+    --chunk-rows N     rows per chunk (BULK_CHUNK_ROWS, default 100000)
+    --format FORMAT    csv or parquet (default: from OUTPUT's extension)
+    --keep COLUMNS     input columns copied to the output: all (default),
+                       none, or a comma-separated list (e.g. an id column)
+    --probabilities    earthquake: also write one probability per alert
+===========================================================
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from memstats import peak_rss_mb
+
+CHUNK_ROWS = int(os.environ.get("BULK_CHUNK_ROWS", "100000"))
+N_WORKERS = int(os.environ.get("BULK_WORKERS", "0")) or os.cpu_count() or 1
+
+# Raw input columns each model needs
+FLIGHT_COLUMNS = ['Airline', 'Source', 'Destination', 'Total_Stops', 'Duration_hours', 'Month']
+FLIGHT_NUMERIC = ['Duration_hours', 'Month']
+
+# Category text stays text ("1" stays "1", not 1.0) until encoded
+TEXT_DTYPES = {col: str for col in ('Airline', 'Source', 'Destination', 'Total_Stops')}
+
+# Model state of this process (set in the parent, inherited by fork)
+_scorer = {}
+
+# ===========================================================
+# 1) SCORING ONE CHUNK
+# ===========================================================
+def load_scorer(name):
+    """
+    Loads model `name` (from its serving bundle, no sklearn needed)
+    with what score_chunk uses.
+    """
+    import shared_model
+
+    artifact = shared_model.load_model(name)
+    scorer = {"name": name, "version": artifact["version"], "features": artifact["features"]}
+    if name == "flight":
+        from encoding import FlightEncoder
+
+        scorer["encoder"] = FlightEncoder.from_artifact(artifact)
+        scorer["predictor"] = artifact["predictor"]
+    else:
+        forest = artifact["packed_forest"]
+        scorer["forest"] = forest
+        scorer["labels"] = artifact["label_encoder"].classes_
+        scorer["proba_labels"] = artifact["label_encoder"].classes_[forest.classes]
+    return scorer
+
+
+def _init_worker(name):
+    # Forked workers already have the model; spawned ones load it once
+    if _scorer.get("name") != name:
+        _scorer.update(load_scorer(name))
+
+
+def score_chunk(frame, probabilities=False):
+    """
+    Prediction columns for one chunk of raw input rows, plus the
+    unknown-category counts seen while encoding it.
+    """
+    scorer = _scorer
+    if scorer["name"] == "flight":
+        encoder = scorer["encoder"]
+        encoder.unknown_counts.clear()
+        X = encoder.encode_frame(frame)
+        prices = scorer["predictor"].predict(X)
+        return {"Predicted_Price": np.round(prices, 2)}, dict(encoder.unknown_counts)
+
+    X = frame[scorer["features"]].to_numpy(dtype=np.float64)
+    forest = scorer["forest"]
+    if not probabilities:
+        return {"predicted_alert": scorer["labels"][forest.predict(X)]}, {}
+    proba = forest.predict_proba(X)
+    columns = {"predicted_alert": scorer["labels"][forest.classes.take(np.argmax(proba, axis=1))]}
+    for i, label in enumerate(scorer["proba_labels"]):
+        columns[f"proba_{label}"] = proba[:, i]
+    return columns, {}
+
+# ===========================================================
+# 2) STREAMING INPUT / OUTPUT
+# ===========================================================
+def _is_parquet(path):
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+def read_chunks(path, chunk_rows, columns=None, dtype=None):
+    """
+    Yields DataFrames of at most `chunk_rows` rows from a CSV or
+    Parquet file. `dtype` pins CSV column types (see pinned_dtypes).
+    """
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(path, chunksize=chunk_rows, usecols=columns, dtype=dtype or TEXT_DTYPES)
+
+
+def pinned_dtypes(path, chunk_rows, columns=None, numeric=()):
+    """
+    CSV column types that stay the same in every chunk, taken from the
+    first chunk: pandas infers them per chunk, so a missing value in a
+    later chunk would turn int64 into float64. Integers are read as
+    nullable Int64, `numeric` (model feature) columns as float64, and
+    columns that are empty in the first chunk as text.
+    """
+    first = pd.read_csv(path, nrows=chunk_rows, usecols=columns, dtype=TEXT_DTYPES)
+    dtype = {}
+    for col, kind in first.dtypes.items():
+        if col in TEXT_DTYPES:
+            dtype[col] = str
+        elif col in numeric:
+            dtype[col] = np.float64
+        elif first[col].isna().all():
+            dtype[col] = str
+        elif kind.kind in "iu":
+            dtype[col] = "Int64"
+        elif kind.kind == "b":
+            dtype[col] = "boolean"
+        elif kind.kind == "f":
+            dtype[col] = np.float64
+        else:
+            dtype[col] = str
+    return dtype
+
+
+class ChunkWriter:
+    """
+    Appends DataFrames to one CSV or Parquet file.
+    """
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.format = fmt
+        self._parquet = None
+        self._started = False
+
+    def write(self, frame):
+        if self.format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            frame.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+        self._started = True
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        elif not self._started and self.format == "csv":
+            # Empty input: still leave an (empty) output file
+            open(self.path, "w").close()
+
+
+def _output_frame(frame, predictions, keep):
+    if keep == "all":
+        out = frame.reset_index(drop=True)
+    elif keep == "none":
+        out = pd.DataFrame(index=pd.RangeIndex(len(frame)))
+    else:
+        out = frame[keep].reset_index(drop=True)
+    return out.assign(**predictions)
+
+# ===========================================================
+# 3) PIPELINE
+# ===========================================================
+def _make_pool(name, n_workers):
+    # fork: workers inherit the loaded model instead of loading it again
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    return ProcessPoolExecutor(n_workers, mp_context=context, initializer=_init_worker, initargs=(name,))
+
+
+def bulk_score(name, input_path, output_path, n_workers=None, chunk_rows=None, fmt=None,
+               keep="all", probabilities=False, progress=sys.stderr):
+    """
+    Scores every row of `input_path` and writes the input columns in
+    `keep` with the predictions to `output_path`, in input order.
+    Returns a summary dict.
+    """
+    n_workers = n_workers or N_WORKERS
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    fmt = fmt or ("parquet" if _is_parquet(output_path) else "csv")
+    if name not in ("flight", "earthquake"):
+        raise ValueError("Model must be 'flight' or 'earthquake'")
+    if fmt not in ("csv", "parquet"):
+        raise ValueError("Output format must be csv or parquet")
+
+    _init_worker(name)
+    model_columns = FLIGHT_COLUMNS if name == "flight" else list(_scorer["features"])
+    if keep in ("all", "none"):
+        columns = None if keep == "all" else model_columns
+    else:
+        keep = [col for col in keep.split(",") if col]
+        columns = list(dict.fromkeys(model_columns + keep))
+
+    start = time.perf_counter()
+    rows = 0
+    unknown = Counter()
+    writer = ChunkWriter(output_path, fmt)
+
+    def finish(frame, result):
+        # Write one scored chunk and report progress
+        nonlocal rows
+        predictions, unknown_counts = result
+        writer.write(_output_frame(frame, predictions, keep))
+        unknown.update(unknown_counts)
+        rows += len(frame)
+        if progress is not None:
+            rate = rows / max(time.perf_counter() - start, 1e-9)
+            progress.write(f"\r{rows:,} rows scored, {rate:,.0f} rows/s")
+            progress.flush()
+
+    dtype = None
+    if fmt == "parquet" and not _is_parquet(input_path):
+        # A Parquet file has one schema: every chunk must have the same types
+        numeric = FLIGHT_NUMERIC if name == "flight" else list(_scorer["features"])
+        dtype = pinned_dtypes(input_path, chunk_rows, columns, numeric)
+
+    try:
+        chunks = read_chunks(input_path, chunk_rows, columns, dtype)
+        if n_workers <= 1:
+            for frame in chunks:
+                finish(frame, score_chunk(frame, probabilities))
+        else:
+            with _make_pool(name, n_workers) as pool:
+                # Submitted chunks wait here in input order; reading pauses
+                # while 2 per worker are in flight
+                pending = deque()
+                for frame in chunks:
+                    pending.append((frame, pool.submit(score_chunk, frame, probabilities)))
+                    if len(pending) >= 2 * n_workers:
+                        frame, future = pending.popleft()
+                        finish(frame, future.result())
+                while pending:
+                    frame, future = pending.popleft()
+                    finish(frame, future.result())
+    finally:
+        writer.close()
+        if progress is not None and rows:
+            progress.write("\n")
+
+    seconds = time.perf_counter() - start
+    return {
+        "model": name,
+        "model_version": _scorer["version"],
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+        "workers": n_workers,
+        "chunk_rows": chunk_rows,
+        "unknown_categories": dict(unknown),
+        "peak_rss_mb": peak_rss_mb(),
+        "output": output_path,
+    }
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(flag, default=None):
+        if flag in args:
+            i = args.index(flag)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    workers = option("--workers")
+    chunk = option("--chunk-rows")
+    fmt = option("--format")
+    keep = option("--keep", "all")
+    probabilities = "--probabilities" in args
+    if probabilities:
+        args.remove("--probabilities")
+    if len(args) != 3:
+        sys.exit(__doc__)
+
+    summary = bulk_score(args[0], args[1], args[2], n_workers=int(workers) if workers else None,
+                         chunk_rows=int(chunk) if chunk else None, fmt=fmt, keep=keep,
+                         probabilities=probabilities)
+    print(f"Scored {summary['rows']:,} rows with {summary['model']} model {summary['model_version']} "
+          f"in {summary['seconds']:.2f} s ({summary['rows_per_second']:,.0f} rows/s, "
+          f"{summary['workers']} worker(s), chunks of {summary['chunk_rows']:,})")
+    if summary["unknown_categories"]:
+        print(f"Unknown categories (encoded as fallback codes): {summary['unknown_categories']}")
+    if summary["peak_rss_mb"] is not None:
+        print(f"Peak RSS of this process: {summary['peak_rss_mb']:.1f} MB")
+    print(f"Wrote {summary['output']}")
@@ -0,0 +1,168 @@
+"""
+===========================================================
+ FLIGHT TREE EXPORT FOR IN-BROWSER PREDICTION
+===========================================================
+
+Exports the served flight DecisionTreeRegressor and its
+encoders to a compact JSON structure (a few KB) that
+assets/flight_tree.js evaluates in the browser, so the
+Dash app answers "predict Price" without a server call.
+
+The export holds the tree as parallel node arrays (leaf
+children are -1), the float64 thresholds and leaf values
+(exact in JSON), and the category / stops lookup tables.
+
+Check the JavaScript predictions and formatted prices
+against sklearn over every category combination (plus
+unknown and unnormalized values), all stops, all months
+and the durations around each split (needs node):
+    python client_tree.py
+Write the export to a file:
+    python client_tree.py export [path]
+===========================================================
+"""
+
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+
+from encoding import CATEGORICAL_COLUMNS, UNKNOWN_CODE, FlightEncoder
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_PATH = os.path.join(HERE, "assets", "flight_tree.js")
+
+
+def export_flight_tree(artifact):
+    """
+    JSON-ready dict of the flight artifact's compiled tree and encoders.
+    """
+    tree = artifact["compiled_model"]
+    encoder = FlightEncoder.from_artifact(artifact)
+    is_leaf = tree.is_leaf
+    return {
+        "version": artifact["version"],
+        "features": list(artifact["features"]),
+        "categorical": list(CATEGORICAL_COLUMNS),
+        "tables": encoder.tables,
+        "stops": encoder.stops_table,
+        "unknown_code": UNKNOWN_CODE,
+        "left": np.where(is_leaf, -1, tree.children[0::2]).tolist(),
+        "right": np.where(is_leaf, -1, tree.children[1::2]).tolist(),
+        "feature": np.where(is_leaf, 0, tree.feature).tolist(),
+        "threshold": np.where(is_leaf, 0.0, tree.threshold).tolist(),
+        "missing_left": tree.missing_left.astype(int).tolist(),
+        "value": tree.value.tolist(),
+    }
+
+# ===========================================================
+# PARITY CHECK (NODE VS SKLEARN)
+# ===========================================================
+# Runs the browser script under node on rows read from stdin
+NODE_HARNESS = """
+globalThis.window = {dash_clientside: {no_update: null}};
+require(process.argv[1]);
+const chunks = [];
+process.stdin.on('data', (chunk) => chunks.push(chunk));
+process.stdin.on('end', () => {
+    const {model, rows, prices} = JSON.parse(Buffer.concat(chunks).toString());
+    const predict = window.dash_clientside.flight.predictPrice;
+    const tree = window.flightTree;
+    const out = {values: [], texts: [], formatted: prices.map(tree.formatPrice)};
+    for (const row of rows) {
+        const encoded = tree.encode(model, ...row);
+        out.values.push(encoded === null ? null : tree.predict(model, encoded));
+        out.texts.push(predict(1, ...row, model)[0]);
+    }
+    process.stdout.write(JSON.stringify(out));
+});
+"""
+
+
+def parity_rows(artifact, n_random=20000, seed=0):
+    """
+    Raw form values: every category (plus an unnormalized variant and
+    an unknown one) × every stops label and count × every month, with
+    durations on and next to each duration split, plus random rows.
+    """
+    tree = artifact["compiled_model"]
+    categories = []
+    for col, le in artifact["label_encoders"].items():
+        labels = [str(c) for c in le.classes_]
+        categories.append(labels + [f"  {labels[0].upper()} ", f"unknown {col.lower()}"])
+    stops = list(artifact["stops_mapping"]) + [" 1 STOP", "5 stops"] + [0, 1, 2, 3, 4, 1.5]
+    splits = np.asarray(tree.split_points(artifact["features"].index("Duration_hours")), dtype=np.float32)
+    durations = np.unique(np.concatenate([splits, np.nextafter(splits, np.float32(np.inf)),
+                                          [0.0, 0.5, 2.5, 48.0]])).astype(float).tolist()
+
+    rows = []
+    for i, (airline, source, destination, stop, month) in enumerate(
+            itertools.product(*categories, stops, range(1, 13))):
+        # Each combination at a different duration, cycling through them all
+        rows.append([airline, source, destination, stop, durations[i % len(durations)], month])
+
+    rng = np.random.default_rng(seed)
+    for _ in range(n_random):
+        rows.append([str(rng.choice(categories[0])), str(rng.choice(categories[1])),
+                     str(rng.choice(categories[2])), int(rng.integers(0, 5)),
+                     float(rng.uniform(0, 50)), int(rng.integers(1, 13))])
+    return rows
+
+
+def check_parity(node="node"):
+    """
+    Compares flight_tree.js (run by node) with sklearn's predict and
+    Python's price formatting. Returns the number of mismatches.
+    """
+    import model_store
+    from tree_engine import CompiledTree
+
+    # The full artifact, with the fitted sklearn tree to compare against
+    artifact = model_store.load_artifact("flight")
+    artifact["compiled_model"] = CompiledTree.from_sklearn(artifact["model"])
+    model = export_flight_tree(artifact)
+    rows = parity_rows(artifact)
+
+    encoder = FlightEncoder.from_artifact(artifact)
+    X = np.array([encoder.encode_row(*row) for row in rows], dtype=np.float64)
+    expected = artifact["model"].predict(X)
+
+    # Exact ties at the third decimal, where toFixed and Python differ
+    prices = sorted(set(expected.tolist()) | {0.125, 0.375, 2.625, 1234.875, 4859.5, 0.005, 1.005})
+
+    payload = json.dumps({"model": model, "rows": rows, "prices": prices})
+    result = subprocess.run([node, "-e", NODE_HARNESS, SCRIPT_PATH], input=payload,
+                            capture_output=True, text=True, check=True)
+    out = json.loads(result.stdout)
+
+    values = np.array(out["values"], dtype=np.float64)
+    value_mismatches = int(np.count_nonzero(values != expected))
+    texts = ["Estimated Flight Ticket Price: {:.2f}".format(price) for price in expected]
+    text_mismatches = sum(a != b for a, b in zip(out["texts"], texts))
+    format_mismatches = sum(a != "{:.2f}".format(b) for a, b in zip(out["formatted"], prices))
+
+    size = len(json.dumps(model, separators=(",", ":")))
+    print(f"Export: {len(model['value'])} nodes, {size / 1024:.1f} KB of JSON")
+    print(f"Parity: {len(rows)} rows, {value_mismatches} prediction mismatches, "
+          f"{text_mismatches} text mismatches, {format_mismatches} of {len(prices)} prices formatted differently")
+    return value_mismatches + text_mismatches + format_mismatches
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "export":
+        import shared_model
+
+        path = args[1] if len(args) > 1 else "flight_tree.json"
+        with open(path, "w") as f:
+            json.dump(export_flight_tree(shared_model.load_model("flight")), f, separators=(",", ":"))
+        print(f"Wrote {path}")
+    else:
+        node = shutil.which("node")
+        if node is None:
+            sys.exit("node is required to run the JavaScript parity check")
+        sys.exit(1 if check_parity(node) else 0)
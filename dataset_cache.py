@@ -0,0 +1,232 @@
+"""
+===========================================================
+ COLUMNAR ON-DISK DATASET CACHE
+===========================================================
+
+Converts a training CSV once into typed, pre-encoded NumPy
+columns on disk (one .npy file per column) and memory-maps
+them on every later load. Loading is then a few file opens:
+no parsing, no copies, and pages are only read when a
+column is actually used.
+
+Each cache entry records the source file's size, mtime and
+SHA-256. Size and mtime are checked first; the hash is only
+recomputed when they differ, and the entry is rebuilt only
+if the content changed.
+
+Layout, under DATASET_CACHE_DIR (default
+<MODEL_ARTIFACT_DIR>/datasets):
+    <name>.json              pointer to the current entry
+    <name>-<hash12>/         one <column>.npy per column
+
+Measure conversion vs. cached reload time, bytes read and
+RSS with:
+    python dataset_cache.py flight|earthquake [dataset_path]
+===========================================================
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from memstats import read_bytes, rss_mb
+
+# Bump when the cached layout changes so old entries are rebuilt
+CACHE_FORMAT = 1
+
+
+def dataset_hash(path, chunk_size=1 << 20):
+    """
+    SHA-256 of the dataset file, read in 1 MB chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_source(record, path):
+    """
+    Compares `path` with the dataset fingerprint in `record`
+    (dataset_size, dataset_mtime_ns, dataset_hash).
+
+    Returns "same", "changed", or "touched" when only the timestamp
+    moved (e.g. a fresh copy); in that case `record` is updated in
+    place with the new stat and the caller should save it.
+    """
+    stat = os.stat(path)
+    if (stat.st_size, stat.st_mtime_ns) == (record.get("dataset_size"), record.get("dataset_mtime_ns")):
+        return "same"
+    if dataset_hash(path) != record.get("dataset_hash"):
+        return "changed"
+    record["dataset_size"] = stat.st_size
+    record["dataset_mtime_ns"] = stat.st_mtime_ns
+    return "touched"
+
+
+def _write_json(path, data):
+    # Write to a temp file then rename, so readers never see a partial file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class CachedDataset:
+    """
+    A dataset loaded from the cache: memory-mapped columns, category
+    vocabularies for the encoded columns and converter extras.
+    """
+
+    def __init__(self, meta, columns):
+        self.meta = meta
+        self.columns = columns
+        self.categories = meta.get("categories", {})
+        self.extra = meta.get("extra", {})
+        self.rows = meta["rows"]
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+
+def _pointer_path(name, cache_dir):
+    return os.path.join(cache_dir, f"{name}.json")
+
+
+def _open_entry(meta, cache_dir):
+    directory = os.path.join(cache_dir, meta["directory"])
+    columns = {
+        col: np.load(os.path.join(directory, f"{col}.npy"), mmap_mode="r")
+        for col in meta["columns"]
+    }
+    return CachedDataset(meta, columns)
+
+
+def _read_current(name, path, cache_dir):
+    """
+    Meta of the cache entry for `path`, or None if missing or stale.
+    """
+    pointer = _pointer_path(name, cache_dir)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != CACHE_FORMAT:
+        return None
+    if not os.path.isdir(os.path.join(cache_dir, meta["directory"])):
+        return None
+
+    status = check_source(meta, path)
+    if status == "changed":
+        return None
+    if status == "touched":
+        _write_json(pointer, meta)
+    return meta
+
+
+def build_cache(name, path, convert, cache_dir):
+    """
+    Runs `convert(path)` and writes its columns as a new cache entry.
+
+    `convert` returns (columns, categories, extra): a dict of 1-D NumPy
+    arrays, a dict of vocabularies for the encoded columns and any
+    JSON-serializable values to keep alongside them.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    stat = os.stat(path)
+    digest = dataset_hash(path)
+    columns, categories, extra = convert(path)
+
+    directory = f"{name}-{digest[:12]}"
+    final_dir = os.path.join(cache_dir, directory)
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for col, values in columns.items():
+        np.save(os.path.join(tmp_dir, f"{col}.npy"), np.ascontiguousarray(values))
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+
+    meta = {
+        "name": name,
+        "format": CACHE_FORMAT,
+        "directory": directory,
+        "columns": list(columns),
+        "rows": int(len(next(iter(columns.values())))),
+        "categories": categories,
+        "extra": extra,
+        "dataset_hash": digest,
+        "dataset_size": stat.st_size,
+        "dataset_mtime_ns": stat.st_mtime_ns,
+        "created_at": time.time(),
+    }
+    _write_json(_pointer_path(name, cache_dir), meta)
+
+    # Drop entries for older versions of the same dataset
+    for entry in os.listdir(cache_dir):
+        if entry.startswith(f"{name}-") and entry != directory:
+            shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+    return meta
+
+
+def load_dataset(name, path, convert, cache_dir):
+    """
+    Memory-maps the cached columns of dataset `name`, converting the
+    source file at `path` first if there is no current cache entry.
+    """
+    meta = _read_current(name, path, cache_dir)
+    if meta is None:
+        meta = build_cache(name, path, convert, cache_dir)
+    return _open_entry(meta, cache_dir)
+
+
+def measure_load(load):
+    """
+    Calls `load()` and reports wall time, bytes read through read()
+    calls and RSS before/after. Memory-mapped pages are not counted
+    as read until they are touched.
+    """
+    rss_before, read_before = rss_mb(), read_bytes()
+    start = time.perf_counter()
+    dataset = load()
+    seconds = time.perf_counter() - start
+    read_after = read_bytes()
+    return dataset, {
+        "seconds": seconds,
+        "bytes_read": None if read_before is None else read_after - read_before,
+        "rss_before_mb": rss_before,
+        "rss_after_mb": rss_mb(),
+    }
+
+
+if __name__ == "__main__":
+    import model_store
+
+    if len(sys.argv) < 2 or sys.argv[1] not in model_store.DATASET_CONVERTERS:
+        sys.exit(f"usage: python dataset_cache.py {{{'|'.join(model_store.DATASET_CONVERTERS)}}} [dataset_path]")
+    name = sys.argv[1]
+    path = sys.argv[2] if len(sys.argv) > 2 else model_store.DEFAULT_DATASETS[name]
+    cache_dir = model_store.DATASET_CACHE_DIR
+
+    def report(label, stats):
+        read = "n/a" if stats["bytes_read"] is None else f"{stats['bytes_read'] / 2**20:.2f} MB"
+        print(f"  {label:<14} {stats['seconds'] * 1e3:9.1f} ms   read {read:>10}"
+              f"   rss {stats['rss_before_mb']:.1f} -> {stats['rss_after_mb']:.1f} MB")
+
+    print(f"{name}: {path} ({os.path.getsize(path) / 2**20:.1f} MB CSV)")
+    _, stats = measure_load(lambda: build_cache(name, path, model_store.DATASET_CONVERTERS[name], cache_dir))
+    report("convert", stats)
+    dataset, stats = measure_load(lambda: model_store.load_dataset(name, path))
+    report("cached load", stats)
+    start = time.perf_counter()
+    for column in dataset.columns.values():
+        np.asarray(column).sum()
+    print(f"  touch columns  {(time.perf_counter() - start) * 1e3:9.1f} ms   "
+          f"{dataset.rows} rows, {dataset.nbytes / 2**20:.2f} MB mapped, rss {rss_mb():.1f} MB")
@@ -0,0 +1,123 @@
+"""
+===========================================================
+ FLIGHT FEATURE ENCODING TABLES
+===========================================================
+
+Replaces per-request `safe_transform` calls with plain
+dict lookups built once from the fitted LabelEncoders.
+
+- Category text is normalized (strip + lowercase) only
+  when the raw value is not already a known key.
+- Unknown categories map to the fallback code (-1) and are
+  counted in `unknown_counts` instead of being printed.
+- Stop labels ('non-stop', '1 stop', ...) go through the
+  same table lookup; numeric stops pass straight through.
+- `encode_frame` encodes whole DataFrame columns at once.
+===========================================================
+"""
+
+import threading
+from collections import Counter
+
+import numpy as np
+
+CATEGORICAL_COLUMNS = ('Airline', 'Source', 'Destination')
+UNKNOWN_CODE = -1
+
+
+def normalize(value):
+    """
+    Normalizes category text the same way the training data was cleaned.
+    """
+    return str(value).strip().lower()
+
+
+class FlightEncoder:
+    """
+    O(1) encoder for the six flight model features.
+    """
+
+    def __init__(self, label_encoders, stops_mapping):
+        # Category → code, in the same order LabelEncoder assigns codes
+        self.tables = {
+            col: {str(cls): code for code, cls in enumerate(label_encoders[col].classes_)}
+            for col in CATEGORICAL_COLUMNS
+        }
+        self.stops_table = {normalize(label): code for label, code in stops_mapping.items()}
+        self.unknown_counts = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_artifact(cls, artifact):
+        return cls(artifact["label_encoders"], artifact["stops_mapping"])
+
+    def _count_unknown(self, column, n=1):
+        with self._lock:
+            self.unknown_counts[column] += n
+
+    def encode(self, column, value):
+        """
+        Code of one category value, or -1 if it was not seen in training.
+        """
+        table = self.tables[column]
+        code = table.get(value)
+        if code is None:
+            code = table.get(normalize(value))
+            if code is None:
+                self._count_unknown(column)
+                return UNKNOWN_CODE
+        return code
+
+    def encode_stops(self, value):
+        """
+        Numeric stops for a label like '1 stop' (unknown labels → 0),
+        or the number itself when the frontend already sends one.
+        """
+        if isinstance(value, str):
+            code = self.stops_table.get(value)
+            if code is None:
+                code = self.stops_table.get(normalize(value))
+                if code is None:
+                    self._count_unknown('Total_Stops')
+                    return 0
+            return code
+        return value
+
+    def encode_row(self, airline, source, destination, stops, duration, month):
+        """
+        Feature row in model order, ready for the tree evaluator.
+        """
+        return [
+            self.encode('Airline', airline),
+            self.encode('Source', source),
+            self.encode('Destination', destination),
+            self.encode_stops(stops),
+            duration,
+            month,
+        ]
+
+    def encode_frame(self, frame):
+        """
+        Encodes a DataFrame with the raw feature columns into an
+        (n_rows, 6) float64 array, one vectorized lookup per column.
+        """
+        columns = []
+        for col in CATEGORICAL_COLUMNS:
+            codes = frame[col].astype(str).str.strip().str.lower().map(self.tables[col])
+            unknown = int(codes.isna().sum())
+            if unknown:
+                self._count_unknown(col, unknown)
+            columns.append(codes.fillna(UNKNOWN_CODE).to_numpy(dtype=np.float64))
+
+        stops = frame['Total_Stops']
+        if stops.dtype.kind not in 'biuf':
+            codes = stops.astype(str).str.strip().str.lower().map(self.stops_table)
+            unknown = int(codes.isna().sum())
+            if unknown:
+                self._count_unknown('Total_Stops', unknown)
+            stops = codes.fillna(0)
+        columns.append(stops.to_numpy(dtype=np.float64))
+
+        columns.append(frame['Duration_hours'].to_numpy(dtype=np.float64))
+        columns.append(frame['Month'].to_numpy(dtype=np.float64))
+        return np.column_stack(columns)
@@ -0,0 +1,373 @@
+"""
+===========================================================
+ EARTHQUAKE FOREST COMPRESSION
+===========================================================
+
+Shrinks the earthquake RandomForestClassifier into a
+CompactForest (see tree_engine.py) for less memory per
+worker, a smaller serving bundle and faster scoring:
+
+1. Lossless: sibling leaves with the same distribution are
+   merged into their parent, identical leaves share one
+   row of the leaf table, thresholds become float32 (still
+   exact for float32 inputs) and indices 8/16-bit.
+2. Pruning: every subtree whose leaves all vote for the
+   same class is collapsed into one leaf holding the
+   subtree root's class distribution. Each tree's vote is
+   unchanged, only probabilities move; kept only if the
+   test accuracy stays within the tolerance.
+3. Tree selection: trees are ranked by greedy forward
+   selection on the training rows, and the smallest
+   leading subset (of at least MIN_TREES trees) whose test
+   accuracy is within the tolerance of the full forest's
+   is kept.
+
+The tolerance (default 0.005 = 0.5 points of accuracy) is
+measured on the same held-out split as the artifact's
+"accuracy" metric.
+
+Report memory, bundle size, load time, latency and
+accuracy of the original vs compressed forest:
+    python forest_compress.py [--tolerance 0.005]
+Also publish the compressed forest as a new version,
+<version>-c<hash>, through the manifest (running servers
+reload it; roll back to the source version as usual):
+    python forest_compress.py --write
+===========================================================
+"""
+
+import argparse
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import model_store
+from tree_engine import CompactForest, PackedForest, _leaf_probabilities, _time_per_call
+
+# Most training rows used to rank the trees
+SELECTION_ROWS = 5000
+
+# Fewest trees tree selection keeps: an easy test split can be matched
+# by a handful of trees that would not generalize as well
+MIN_TREES = 10
+
+
+# ===========================================================
+# 1) TREE SIMPLIFICATION
+# ===========================================================
+def tree_nodes(estimator, n_classes):
+    """
+    Node arrays of a fitted sklearn tree, with class distributions.
+    """
+    tree = estimator.tree_
+    return {
+        "left": tree.children_left.astype(np.intp),
+        "right": tree.children_right.astype(np.intp),
+        "feature": tree.feature.astype(np.intp),
+        "threshold": tree.threshold,
+        "missing": getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=bool)),
+        "proba": _leaf_probabilities(tree.value[:, 0, :n_classes]),
+    }
+
+
+def simplify_tree(tree, prune=False):
+    """
+    Copy of `tree` (see tree_nodes) with sibling leaves of equal
+    distribution merged into their parent and, with `prune`, every
+    subtree whose leaves vote for one class collapsed into a leaf.
+    """
+    left, right, proba = tree["left"], tree["right"], tree["proba"]
+    votes = proba.argmax(axis=1)
+    leaf_value = {}
+
+    def visit(node):
+        # Returns the class all leaves below `node` vote for, or -1
+        if left[node] < 0:
+            return votes[node]
+        vote_left, vote_right = visit(left[node]), visit(right[node])
+        merged_left = leaf_value.get(left[node], proba[left[node]] if left[left[node]] < 0 else None)
+        merged_right = leaf_value.get(right[node], proba[right[node]] if left[right[node]] < 0 else None)
+        if merged_left is not None and merged_right is not None and np.array_equal(merged_left, merged_right):
+            leaf_value[node] = merged_left
+        elif prune and vote_left == vote_right >= 0:
+            # Weighted mean of the children: still votes for the same class
+            leaf_value[node] = proba[node]
+        return vote_left if vote_left == vote_right else -1
+
+    visit(0)
+    out = {key: [] for key in tree}
+
+    def emit(node):
+        index = len(out["left"])
+        for key in out:
+            out[key].append(None)
+        out["feature"][index] = tree["feature"][node]
+        out["threshold"][index] = tree["threshold"][node]
+        out["missing"][index] = tree["missing"][node]
+        if left[node] < 0 or node in leaf_value:
+            out["left"][index] = out["right"][index] = -1
+            out["proba"][index] = leaf_value.get(node, proba[node])
+        else:
+            out["proba"][index] = proba[node]
+            out["left"][index] = emit(left[node])
+            out["right"][index] = emit(right[node])
+        return index
+
+    emit(0)
+    return {
+        "left": np.array(out["left"], dtype=np.intp),
+        "right": np.array(out["right"], dtype=np.intp),
+        "feature": np.array(out["feature"], dtype=np.intp),
+        "threshold": np.array(out["threshold"], dtype=np.float64),
+        "missing": np.array(out["missing"], dtype=bool),
+        "proba": np.array(out["proba"], dtype=np.float64),
+    }
+
+
+# ===========================================================
+# 2) TREE SELECTION
+# ===========================================================
+def tree_probabilities(forest, X):
+    """
+    Class probabilities of every tree of an evaluator on X,
+    as an (n_trees, n_rows, n_classes) array.
+    """
+    return np.stack([forest.leaf_values(leaves) for leaves in forest.apply(X)]).astype(np.float64)
+
+
+def greedy_order(proba, y):
+    """
+    Tree order of greedy forward selection: each step adds the tree
+    that makes the running vote most accurate on (proba, y), ties
+    broken by the probability given to the true classes.
+    """
+    remaining = list(range(proba.shape[0]))
+    rows = np.arange(y.shape[0])
+    total = np.zeros(proba.shape[1:])
+    order = []
+    while remaining:
+        candidates = total + proba[remaining]
+        correct = (candidates.argmax(axis=2) == y).sum(axis=1)
+        true_proba = candidates[:, rows, y].sum(axis=1)
+        best = np.lexsort((-true_proba, -correct))[0]
+        order.append(remaining.pop(best))
+        total = candidates[best]
+    return order
+
+
+def smallest_subset(proba, y, order, target):
+    """
+    Number of leading trees of `order` whose vote on (proba, y)
+    first reaches accuracy `target`.
+    """
+    totals = np.cumsum(proba[order], axis=0)
+    accuracy = (totals.argmax(axis=2) == y).mean(axis=1)
+    reached = np.flatnonzero(accuracy >= target - 1e-12)
+    return int(reached[0]) + 1 if reached.size else len(order)
+
+
+def _accuracy(forest, X, y):
+    return float(np.mean(forest.predict(X) == y))
+
+
+def compress_forest(rf_model, X_train, y_train, X_test, y_test, tolerance=0.005,
+                    prune=True, select=True, min_trees=MIN_TREES, seed=0):
+    """
+    CompactForest for `rf_model` and a summary of each step.
+    Pruning and tree selection are only kept when the test accuracy
+    stays within `tolerance` of the original forest's; selection
+    keeps at least `min_trees` trees.
+    """
+    n_classes = rf_model.n_classes_
+    baseline = float(rf_model.score(X_test, y_test))
+    target = baseline - tolerance
+    steps = []
+
+    trees = [simplify_tree(tree_nodes(estimator, n_classes)) for estimator in rf_model.estimators_]
+    forest = CompactForest.from_trees(trees, rf_model.classes_)
+    steps.append(("lossless", forest.n_trees, forest.n_nodes, _accuracy(forest, X_test, y_test)))
+
+    if prune:
+        pruned = [simplify_tree(tree, prune=True) for tree in trees]
+        candidate = CompactForest.from_trees(pruned, rf_model.classes_)
+        accuracy = _accuracy(candidate, X_test, y_test)
+        if accuracy >= target:
+            trees, forest = pruned, candidate
+        steps.append(("prune" if accuracy >= target else "prune (rejected)",
+                      candidate.n_trees, candidate.n_nodes, accuracy))
+
+    if select:
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(y_train), min(len(y_train), SELECTION_ROWS), replace=False)
+        # Class indices, as in the probability arrays
+        train_index = np.searchsorted(rf_model.classes_, y_train[rows])
+        test_index = np.searchsorted(rf_model.classes_, y_test)
+        order = greedy_order(tree_probabilities(forest, X_train[rows]), train_index)
+        n_keep = smallest_subset(tree_probabilities(forest, X_test), test_index, order, target)
+        n_keep = min(max(n_keep, min_trees), len(order))
+        # Confirm with the float32 runtime, adding trees if rounding cost accuracy
+        while True:
+            keep = sorted(order[:n_keep])
+            candidate = CompactForest.from_trees([trees[i] for i in keep], rf_model.classes_)
+            accuracy = _accuracy(candidate, X_test, y_test)
+            if accuracy >= target or n_keep == len(order):
+                break
+            n_keep += 1
+        forest = candidate
+        steps.append(("select", forest.n_trees, forest.n_nodes, accuracy))
+
+    summary = {
+        "tolerance": tolerance,
+        "baseline_accuracy": baseline,
+        "accuracy": _accuracy(forest, X_test, y_test),
+        "n_trees": int(forest.n_trees),
+        "n_nodes": int(forest.n_nodes),
+        "source_trees": len(rf_model.estimators_),
+        "source_nodes": int(sum(e.tree_.node_count for e in rf_model.estimators_)),
+    }
+    return forest, summary, steps
+
+
+# ===========================================================
+# 3) REPORT
+# ===========================================================
+def _nbytes(arrays):
+    return sum(np.asarray(value).nbytes for value in arrays.values())
+
+
+def _sklearn_nbytes(rf_model):
+    # Node and value arrays held by the fitted sklearn trees
+    total = 0
+    for estimator in rf_model.estimators_:
+        state = estimator.tree_.__getstate__()
+        total += state["nodes"].nbytes + state["values"].nbytes
+    return total
+
+
+def _load_seconds(load, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        load()
+    return (time.perf_counter() - start) / repeat
+
+
+def _bundle_sizes(engines):
+    # Saves each evaluator like a serving bundle; returns {label: (bytes, load seconds)}
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for label, (cls, engine) in engines.items():
+            path = os.path.join(directory, f"{cls.__name__}.npz")
+            np.savez(path, **engine.to_arrays())
+
+            def load(path=path, cls=cls):
+                with np.load(path) as data:
+                    return cls.from_arrays({key: data[key] for key in data.files})
+
+            results[label] = (os.path.getsize(path), _load_seconds(load))
+    return results
+
+
+def report(artifact, forest, summary, steps, X_test, y_test):
+    """
+    Prints memory, size, load time, latency and accuracy of the
+    sklearn forest, its PackedForest and the CompactForest.
+    """
+    rf_model = artifact["model"]
+    packed = PackedForest.from_sklearn(rf_model)
+    pickled = pickle.dumps(rf_model, protocol=pickle.HIGHEST_PROTOCOL)
+
+    print(f"Source forest: {summary['source_trees']} trees, {summary['source_nodes']} nodes, "
+          f"test accuracy {summary['baseline_accuracy']:.4f}")
+    for step, n_trees, n_nodes, accuracy in steps:
+        print(f"  {step:<17} {n_trees:4d} trees {n_nodes:7d} nodes   accuracy {accuracy:.4f}")
+
+    sizes = _bundle_sizes({"packed": (PackedForest, packed), "compact": (type(forest), forest)})
+    pickle_load = _load_seconds(lambda: pickle.loads(pickled))
+    print("Memory and load time:")
+    print(f"  {'':<28} {'in memory':>10} {'on disk':>10} {'load':>10}")
+    print(f"  {'sklearn forest (pickle)':<28} {_sklearn_nbytes(rf_model) / 1024:8.1f}kB "
+          f"{len(pickled) / 1024:8.1f}kB {pickle_load * 1e3:8.2f}ms")
+    for label, engine in (("PackedForest", packed), ("CompactForest", forest)):
+        size, load = sizes["packed" if engine is packed else "compact"]
+        print(f"  {label:<28} {_nbytes(engine.to_arrays()) / 1024:8.1f}kB "
+              f"{size / 1024:8.1f}kB {load * 1e3:8.2f}ms")
+
+    rng = np.random.default_rng(0)
+    batch = X_test[rng.integers(0, len(X_test), 10000)]
+    row = batch[:1]
+    print("Latency:")
+    print(f"  {'':<28} {'1 row':>10} {'10k rows':>10}")
+    for label, predict, repeat in (("rf_model.predict", rf_model.predict, 200),
+                                   ("PackedForest.predict", packed.predict, 2000),
+                                   ("CompactForest.predict", forest.predict, 2000)):
+        print(f"  {label:<28} {_time_per_call(predict, row, repeat) * 1e6:8.1f}us "
+              f"{_time_per_call(predict, batch, 3) * 1e3:8.1f}ms")
+
+    agreement = float(np.mean(forest.predict(X_test) == rf_model.predict(X_test)))
+    delta = summary["accuracy"] - summary["baseline_accuracy"]
+    print(f"Accuracy: {summary['accuracy']:.4f} ({delta:+.4f} vs source, tolerance "
+          f"{summary['tolerance']}); predictions agree on {agreement:.2%} of test rows")
+
+
+def compressed_artifact(artifact, forest, summary):
+    """
+    Copy of `artifact` serving `forest`, with its own version: the
+    source version plus a digest of the compressed arrays, so the
+    audit log and model_version labels tell the two apart.
+    """
+    source = artifact.get("compressed_from", artifact["version"])
+    digest = hashlib.sha256()
+    for key, value in sorted(forest.to_arrays().items()):
+        digest.update(key.encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    return {
+        **artifact,
+        "version": f"{source}-c{digest.hexdigest()[:6]}",
+        "compressed_from": source,
+        "packed_forest": forest,
+        "compression": summary,
+        "metrics": {**artifact["metrics"], "accuracy": summary["accuracy"]},
+        "created_at": time.time(),
+    }
+
+
+# ===========================================================
+# 4) COMMAND LINE
+# ===========================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compress the earthquake forest.")
+    parser.add_argument("--tolerance", type=float, default=0.005,
+                        help="accepted test accuracy loss (default 0.005)")
+    parser.add_argument("--no-prune", action="store_true", help="skip subtree pruning")
+    parser.add_argument("--no-select", action="store_true", help="keep every tree")
+    parser.add_argument("--min-trees", type=int, default=MIN_TREES,
+                        help=f"fewest trees to keep (default {MIN_TREES})")
+    parser.add_argument("--write", action="store_true",
+                        help="publish the compressed forest as a new model version")
+    args = parser.parse_args()
+
+    artifact = model_store.load_artifact("earthquake")
+    X_train, X_test, y_train, y_test = model_store.earthquake_split()
+    forest, summary, steps = compress_forest(
+        artifact["model"], X_train, y_train, X_test, y_test, args.tolerance,
+        prune=not args.no_prune, select=not args.no_select, min_trees=args.min_trees,
+    )
+    report(artifact, forest, summary, steps, X_test, y_test)
+
+    if summary["accuracy"] < summary["baseline_accuracy"] - args.tolerance:
+        print("Compressed forest is outside the accuracy tolerance")
+        sys.exit(1)
+    if args.write:
+        import shared_model
+
+        compressed = compressed_artifact(artifact, forest, summary)
+        # Bundle first: servers reload as soon as the manifest changes
+        print(f"Wrote {shared_model.save_bundle(compressed)}")
+        model_store.publish_derived(compressed)
+        print(f"Published 'earthquake' version {compressed['version']} "
+              f"(compressed from {compressed['compressed_from']})")
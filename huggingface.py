@@ -1,68 +1,207 @@
-import kagglehub
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
-from sklearn.ensemble import RandomForestClassifier
+"""
+===========================================================
+ EARTHQUAKE ALERT PREDICTION - GRADIO DEPLOYMENT
+===========================================================
+
+Serves the earthquake Random Forest through a Gradio
+interface mounted on a FastAPI app (run with uvicorn).
+
+- Batch mode (default): Gradio's queue groups waiting
+  requests into batches of up to GRADIO_MAX_BATCH_SIZE
+  and the forest predicts each batch in one vectorized
+  call. GRADIO_CONCURRENCY batches run at the same time.
+- Offline start: the KaggleHub download only happens when
+  there is neither a local dataset nor a built model
+  artifact (and never with SERVING_ONLY=1 or
+  GRADIO_OFFLINE=1).
+- Batch sizes, the queue wait of the oldest request in
+  each batch and predict time are served at /metrics
+  (Prometheus text) and /batch/stats (JSON).
+
+Environment settings:
+    GRADIO_BATCH           1 (default) batched, 0 one row per call
+    GRADIO_MAX_BATCH_SIZE  largest batch (default 32)
+    GRADIO_CONCURRENCY     batches running at once (default 2)
+    GRADIO_OFFLINE         1 to fail instead of downloading
+    GRADIO_SERVER_NAME / GRADIO_SERVER_PORT  (127.0.0.1:7860)
+
+Run:
+    python huggingface.py
+===========================================================
+"""
+
 import os
+import threading
+import time
+
 import gradio as gr
+import numpy as np
+from fastapi import FastAPI
 
-# Download the dataset from KaggleHub
-print("📥 Downloading dataset from KaggleHub...")
-path = kagglehub.dataset_download("ahmeduzaki/earthquake-alert-prediction-dataset")
+import model_store
+import shared_model
+from metrics import AppMetrics, Histogram, instrument_fastapi
 
-# List CSV files in the downloaded dataset folder
-csv_files = [f for f in os.listdir(path) if f.endswith(".csv")]
+BATCH_MODE = os.environ.get("GRADIO_BATCH", "1") == "1"
+MAX_BATCH_SIZE = int(os.environ.get("GRADIO_MAX_BATCH_SIZE", "32"))
+CONCURRENCY = int(os.environ.get("GRADIO_CONCURRENCY", "2"))
+OFFLINE = os.environ.get("GRADIO_OFFLINE", "0") == "1"
 
-# Raise an error if no CSV file is found
-if not csv_files:
-    raise FileNotFoundError("❌ No CSV file found in the downloaded dataset folder")
+# ===========================================================
+# 1) DATASET / ARTIFACT (OFFLINE-CAPABLE STARTUP)
+# ===========================================================
+def resolve_dataset():
+    """
+    Dataset file to train from, or None when the built artifact is
+    served as is. KaggleHub is only used when neither exists.
+    """
+    # Use a local copy of the dataset when EARTHQUAKE_DATASET_PATH points to one
+    if os.path.exists(model_store.EARTHQUAKE_DATASET_PATH):
+        return model_store.EARTHQUAKE_DATASET_PATH
 
-# Construct the full path to the CSV file
-filepath = os.path.join(path, csv_files[0])
-print(f"✅ Using dataset file: {filepath}")
+    # A model was already built (e.g. from an earlier download): serve it
+    if model_store.SERVING_ONLY or model_store.read_manifest("earthquake") is not None:
+        print("✅ Using the cached model artifact, no dataset download")
+        return None
+    if OFFLINE:
+        raise FileNotFoundError("GRADIO_OFFLINE=1 but there is no local dataset or model artifact")
 
-# Load the dataset into a pandas DataFrame
-data = pd.read_csv(filepath)
-print("✅ Dataset loaded successfully")
-print("📊 Columns:", data.columns.tolist())
+    # Download the dataset from KaggleHub (imported only when needed)
+    import kagglehub
+    print("📥 Downloading dataset from KaggleHub...")
+    path = kagglehub.dataset_download("ahmeduzaki/earthquake-alert-prediction-dataset")
 
-# Select features and target
-X = data[['magnitude', 'depth', 'cdi', 'mmi', 'sig']]
-y = data['alert']
+    # List CSV files in the downloaded dataset folder
+    csv_files = [f for f in os.listdir(path) if f.endswith(".csv")]
 
-# Encode target labels into numerical format
-label_encoder = LabelEncoder()
-y_encoded = label_encoder.fit_transform(y)
+    # Raise an error if no CSV file is found
+    if not csv_files:
+        raise FileNotFoundError("❌ No CSV file found in the downloaded dataset folder")
 
-# Split the dataset into training and testing sets
-X_train, X_test, y_train, y_test = train_test_split(X, y_encoded, test_size=0.2, random_state=42)
+    # Construct the full path to the CSV file
+    return os.path.join(path, csv_files[0])
 
-# Initialize and train the Random Forest Classifier
-rf_model = RandomForestClassifier(
-    n_estimators=100,
-    random_state=42,
-    max_depth=8
-)
-rf_model.fit(X_train, y_train)
 
-# Evaluate and display model accuracy
-accuracy = rf_model.score(X_test, y_test)
+filepath = resolve_dataset()
+if filepath:
+    print(f"✅ Using dataset file: {filepath}")
+
+# Load the trained model artifact; it is rebuilt only when the dataset
+# changes and served from its array bundle without importing sklearn
+artifact = shared_model.load_model("earthquake", filepath)
+label_encoder = artifact["label_encoder"]
+
+# Packed NumPy copy of the forest, evaluated a whole batch at a time
+packed_forest = artifact["packed_forest"]
+print(f"✅ Model artifact version {artifact['version']} loaded")
+
+# Display model accuracy measured at training time
+accuracy = artifact["metrics"]["accuracy"]
 print(f"🎯 Model Accuracy: {accuracy * 100:.2f}%")
 
+# ===========================================================
+# 2) BATCH METRICS
+# ===========================================================
+metrics = AppMetrics("gradio", "earthquake", artifact["version"])
+batch_sizes = metrics.registry.register(Histogram(
+    "gradio_batch_size", "Rows per Gradio predict call.", ("app",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)))
+
+# Running totals for /batch/stats
+_stats_lock = threading.Lock()
+_stats = {"batches": 0, "rows": 0, "queue_wait_seconds": 0.0, "queue_wait_max_seconds": 0.0,
+          "queue_wait_batches": 0, "predict_seconds": 0.0}
+
+
+class ArrivalTime:
+    """
+    Pure ASGI middleware stamping when each request reached the
+    server, so the queue wait can be measured when Gradio runs it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["received_at"] = time.perf_counter()
+        await self.app(scope, receive, send)
+
+
+def _queue_wait(request, started):
+    # Seconds the (oldest) request of this call waited in Gradio's queue,
+    # or None when the server did not stamp it
+    if isinstance(request, list):
+        request = request[0] if request else None
+    raw = getattr(request, "request", None)
+    received = getattr(raw, "scope", {}).get("state", {}).get("received_at") if raw is not None else None
+    return None if received is None else started - received
+
+
+def _record_batch(rows, queue_wait, predict_seconds):
+    batch_sizes.observe(rows, "gradio")
+    metrics.observe("predict", predict_seconds)
+    if queue_wait is not None:
+        metrics.observe("queue_wait", queue_wait)
+    with _stats_lock:
+        _stats["batches"] += 1
+        _stats["rows"] += rows
+        _stats["predict_seconds"] += predict_seconds
+        if queue_wait is not None:
+            _stats["queue_wait_batches"] += 1
+            _stats["queue_wait_seconds"] += queue_wait
+            _stats["queue_wait_max_seconds"] = max(_stats["queue_wait_max_seconds"], queue_wait)
+
+
+def batch_stats():
+    """
+    Batch counters, mean batch size and queue wait so far.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    waited = stats.pop("queue_wait_batches")
+    return {
+        "batch_mode": BATCH_MODE,
+        "max_batch_size": MAX_BATCH_SIZE if BATCH_MODE else 1,
+        "concurrency_limit": CONCURRENCY,
+        "batches": stats["batches"],
+        "rows": stats["rows"],
+        "mean_batch_size": stats["rows"] / stats["batches"] if stats["batches"] else 0.0,
+        "mean_queue_wait_ms": stats["queue_wait_seconds"] / waited * 1000.0 if waited else None,
+        "max_queue_wait_ms": stats["queue_wait_max_seconds"] * 1000.0 if waited else None,
+        "mean_predict_ms": stats["predict_seconds"] / stats["batches"] * 1000.0 if stats["batches"] else 0.0,
+    }
+
+# ===========================================================
+# 3) PREDICTION FUNCTIONS
+# ===========================================================
+def predict_earthquake_alerts(magnitude, depth, cdi, mmi, sig, request: gr.Request = None):
+    """
+    Batched prediction: every argument is a list with one value per
+    queued request; returns one list of outputs (Gradio batch format).
+    """
+    started = time.perf_counter()
+    queue_wait = _queue_wait(request, started)
+    # One feature row per request, in training order (empty inputs → NaN)
+    features = np.array([magnitude, depth, cdi, mmi, sig], dtype=np.float64).T
+    # Predict encoded classes, then convert them back to labels
+    pred_encoded = packed_forest.predict(features)
+    labels = label_encoder.classes_[pred_encoded]
+    _record_batch(len(labels), queue_wait, time.perf_counter() - started)
+    return [[f"Predicted Earthquake Alert Level: {label}" for label in labels]]
+
+
 # Define a prediction function for Gradio interface
-def predict_earthquake_alert(magnitude, depth, cdi, mmi, sig):
-    # Prepare input as DataFrame
-    user_input = pd.DataFrame([[magnitude, depth, cdi, mmi, sig]],
-                              columns=['magnitude', 'depth', 'cdi', 'mmi', 'sig'])
-    # Predict encoded class
-    pred_encoded = rf_model.predict(user_input)[0]
-    # Convert encoded class back to original label
-    pred_label = label_encoder.inverse_transform([pred_encoded])[0]
-    return f"Predicted Earthquake Alert Level: {pred_label}"
+def predict_earthquake_alert(magnitude, depth, cdi, mmi, sig, request: gr.Request = None):
+    # Single-row variant of predict_earthquake_alerts
+    return predict_earthquake_alerts([magnitude], [depth], [cdi], [mmi], [sig], request)[0][0]
 
+# ===========================================================
+# 4) INTERFACE AND SERVER
+# ===========================================================
 # Build Gradio interface
 interface = gr.Interface(
-    fn=predict_earthquake_alert,
+    fn=predict_earthquake_alerts if BATCH_MODE else predict_earthquake_alert,
     inputs=[
         gr.Number(label="Magnitude"),
         gr.Number(label="Depth"),
@@ -72,9 +211,33 @@ interface = gr.Interface(
     ],
     outputs=gr.Textbox(label="Prediction"),
     title="🌍 Earthquake Alert Prediction",
-    description="Enter earthquake parameters to predict the alert level using a Random Forest Classifier model."
+    description="Enter earthquake parameters to predict the alert level using a Random Forest Classifier model.",
+    batch=BATCH_MODE,
+    max_batch_size=MAX_BATCH_SIZE,
+    concurrency_limit=CONCURRENCY,
+    api_name="predict",
 )
 
+# FastAPI host app: /metrics and /batch/stats next to the Gradio UI
+server = FastAPI()
+instrument_fastapi(server, metrics)
+server.add_middleware(ArrivalTime)
+
+
+@server.get("/batch/stats")
+def get_batch_stats():
+    return batch_stats()
+
+
+app = gr.mount_gradio_app(server, interface, path="/")
+
 # Launch the Gradio interface
 if __name__ == "__main__":
-    interface.launch()
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host=os.environ.get("GRADIO_SERVER_NAME", "127.0.0.1"),
+        port=int(os.environ.get("GRADIO_SERVER_PORT", "7860")),
+        log_level="warning",
+    )
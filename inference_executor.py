@@ -0,0 +1,241 @@
+"""
+===========================================================
+ ASYNC INFERENCE EXECUTOR WITH BACKPRESSURE
+===========================================================
+
+Runs model calls for the FastAPI app on a dedicated, sized
+pool instead of the shared starlette/asyncio default
+executor, so request handling never competes with model
+work for threadpool slots.
+
+- At most `max_in_flight` calls may be queued or running;
+  beyond that `run` raises `Overloaded` at once (the app
+  answers 503) instead of letting requests pile up.
+- Each call can have a timeout; when it expires the caller
+  gets `InferenceTimeout` (504). A call still waiting for a
+  worker is cancelled; a running one finishes in its worker,
+  keeping its in-flight slot until then, and its result is
+  discarded.
+- Pool wait time, run time and in-flight depth are kept in
+  `stats()` as p50/p95/p99 over a recent window; run times
+  are also passed to `on_run` in this process, whatever
+  the pool kind.
+- Process pool workers are forked, so they start with this
+  process's state (e.g. the served model). `restart()`
+  replaces them after that state changes; calls already
+  submitted finish on the old workers.
+
+Environment settings read by `executor_from_env`:
+    INFERENCE_POOL          thread (default) or process
+    INFERENCE_WORKERS       pool size (default 2)
+    INFERENCE_MAX_IN_FLIGHT calls queued or running (default 32)
+    INFERENCE_TIMEOUT_MS    per-call timeout (default 1000, 0 = none)
+===========================================================
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is refused because the queue is full.
+    """
+
+
+class InferenceTimeout(Exception):
+    """
+    Raised when a model call does not finish within its timeout.
+    """
+
+
+class LatencyWindow:
+    """
+    Thread-safe record of the last `size` durations with percentiles.
+    """
+
+    def __init__(self, size=2048):
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._values.append(seconds)
+            self.count += 1
+
+    def summary(self):
+        """
+        Count plus p50/p95/p99/max in milliseconds over the window.
+        """
+        with self._lock:
+            values = np.array(self._values, dtype=np.float64)
+            count = self.count
+        if values.size == 0:
+            return {"count": count}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1e3
+        return {
+            "count": count,
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "max_ms": float(values.max() * 1e3),
+        }
+
+
+def _timed_call(fn, *args):
+    # Runs in the pool; CLOCK_MONOTONIC is shared by all processes on Linux,
+    # so start/end can be compared with the submit time in the event loop
+    started = time.monotonic()
+    result = fn(*args)
+    return started, time.monotonic(), result
+
+
+class InferenceExecutor:
+    """
+    Bounded async front end to a thread or process pool.
+    """
+
+    def __init__(self, max_workers=2, max_in_flight=32, timeout=None, kind="thread",
+                 initializer=None, on_run=None):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        if kind not in ("thread", "process"):
+            raise ValueError("kind must be 'thread' or 'process'")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout or None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.wait = LatencyWindow()
+        self.run_time = LatencyWindow()
+        self.latency = LatencyWindow()
+        # initializer() runs once in each process worker; on_run(seconds)
+        # here, after every completed call
+        self.initializer = initializer
+        self.on_run = on_run
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._in_flight_lock = threading.Lock()
+
+    def _release(self, _future):
+        # Done callback of the pool future (runs in a pool thread)
+        with self._in_flight_lock:
+            self.in_flight -= 1
+
+    def _ensure_pool(self):
+        # Created on first use so importing the app never starts workers
+        with self._pool_lock:
+            if self._pool is None:
+                if self.kind == "process":
+                    # fork: workers inherit the served model instead of loading one
+                    methods = multiprocessing.get_all_start_methods()
+                    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+                    self._pool = ProcessPoolExecutor(self.max_workers, mp_context=context,
+                                                     initializer=self.initializer)
+                else:
+                    self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="inference")
+            return self._pool
+
+    def restart(self):
+        """
+        Replaces the process pool, so later calls run in workers forked
+        from the current state; no-op for a thread pool, which shares it.
+        """
+        if self.kind != "process":
+            return
+        with self._pool_lock:
+            old, self._pool = self._pool, None
+        if old is not None:
+            # Submitted calls still finish (and release their slots)
+            old.shutdown(wait=False)
+
+    async def run(self, fn, *args, timeout=None):
+        """
+        Runs `fn(*args)` on the pool and returns its result.
+
+        Raises Overloaded when `max_in_flight` calls are already pending,
+        and InferenceTimeout when the call takes longer than `timeout`
+        seconds (default: the executor's timeout).
+        """
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            raise Overloaded(f"{self.in_flight} inference calls pending (limit {self.max_in_flight})")
+
+        timeout = timeout if timeout is not None else self.timeout
+        submitted = time.monotonic()
+        future = self._ensure_pool().submit(_timed_call, fn, *args)
+        with self._in_flight_lock:
+            self.in_flight += 1
+        # The slot is freed when the pool call ends, not when the caller
+        # stops waiting, so timed-out calls still hold back new ones
+        future.add_done_callback(self._release)
+        try:
+            started, finished, result = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise InferenceTimeout(f"Inference did not finish within {timeout * 1000:.0f} ms") from None
+        except Exception:
+            self.errors += 1
+            raise
+
+        self.completed += 1
+        self.wait.record(started - submitted)
+        self.run_time.record(finished - started)
+        if self.on_run is not None:
+            self.on_run(finished - started)
+        self.latency.record(time.monotonic() - submitted)
+        return result
+
+    def stats(self):
+        """
+        Pool configuration, counters and wait/run/total latency.
+        """
+        return {
+            "pool": self.kind,
+            "workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "timeout_ms": self.timeout * 1000.0 if self.timeout else None,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "pool_wait": self.wait.summary(),
+            "run": self.run_time.summary(),
+            "total": self.latency.summary(),
+        }
+
+    def shutdown(self, wait=True):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def executor_from_env(**kwargs):
+    """
+    Builds the executor configured by the INFERENCE_* variables;
+    `kwargs` (initializer, on_run) are passed on.
+    """
+    timeout_ms = float(os.environ.get("INFERENCE_TIMEOUT_MS", "1000"))
+    return InferenceExecutor(
+        max_workers=int(os.environ.get("INFERENCE_WORKERS", "2")),
+        max_in_flight=int(os.environ.get("INFERENCE_MAX_IN_FLIGHT", "32")),
+        timeout=timeout_ms / 1000.0 if timeout_ms > 0 else None,
+        kind=os.environ.get("INFERENCE_POOL", "thread"),
+        **kwargs,
+    )
@@ -0,0 +1,193 @@
+"""
+===========================================================
+ STREAMING CHUNKED FLIGHT DATASET INGESTION
+===========================================================
+
+Reads flight_dataset.csv in chunks instead of loading the
+whole file, so peak memory stays near the size of the
+encoded columns rather than several times the CSV.
+
+Per chunk:
+- only the model columns are parsed, with explicit dtypes
+  (text columns straight into pandas categoricals)
+- category text is normalized once per distinct value and
+  mapped to an int code from a vocabulary that grows
+  chunk by chunk (the incremental encoder)
+- codes and numbers are appended to a columnar buffer of
+  compact NumPy arrays
+
+At the end, codes are renumbered to sorted order so they
+match what LabelEncoder would have produced on the full
+column, and fitted LabelEncoders are rebuilt from the
+vocabularies without another pass over the data.
+
+Report per-stage time and peak RSS with:
+    python ingest.py [dataset_path]
+===========================================================
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+
+from memstats import StageTimer
+
+CATEGORICAL_COLUMNS = ['Airline', 'Source', 'Destination']
+
+# Explicit dtypes for every column we read; everything else is skipped
+FLIGHT_DTYPES = {
+    'Airline': 'category',
+    'Source': 'category',
+    'Destination': 'category',
+    'Total_Stops': 'category',
+    'Duration_hours': 'float64',
+    'Month': 'float64',
+    'Price': 'float64',
+}
+
+# Compact storage dtypes for the columnar buffer
+BUFFER_DTYPES = {
+    'Airline': np.int32,
+    'Source': np.int32,
+    'Destination': np.int32,
+    'Total_Stops': np.int8,
+    'Duration_hours': np.float32,
+    'Month': np.float32,
+    'Price': np.float64,
+}
+
+CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", "200000"))
+
+
+class ColumnBuffer:
+    """
+    Growable set of typed NumPy columns (capacity doubles when full).
+    """
+
+    def __init__(self, dtypes, capacity=1 << 16):
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in dtypes.items()}
+        self.size = 0
+
+    def append(self, values):
+        n = len(next(iter(values.values())))
+        capacity = len(next(iter(self.columns.values())))
+        if self.size + n > capacity:
+            new_capacity = max(capacity * 2, self.size + n)
+            for name, column in self.columns.items():
+                grown = np.empty(new_capacity, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                self.columns[name] = grown
+        for name, column in values.items():
+            self.columns[name][self.size:self.size + n] = column
+        self.size += n
+
+    def finish(self):
+        """
+        Returns the filled columns, trimmed to size (copies only if
+        the buffer has spare capacity).
+        """
+        return {name: column[:self.size].copy() if len(column) != self.size else column
+                for name, column in self.columns.items()}
+
+
+class IncrementalEncoder:
+    """
+    Category → int code map that grows as new categories appear.
+    Codes follow first appearance until `finish()` renumbers them
+    in sorted order, matching LabelEncoder.
+    """
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode_categorical(self, series):
+        # Normalize each distinct category once, then map the chunk's
+        # categorical codes through a small lookup array
+        categories = series.cat.categories
+        chunk_codes = series.cat.codes.to_numpy()
+        lookup = np.zeros(len(categories) + 1, dtype=np.int32)
+        for i, category in enumerate(categories):
+            lookup[i] = self._code(str(category).strip().lower())
+        # Missing values (code -1) became 'nan' after astype(str)
+        # in the original cleaning
+        if (chunk_codes < 0).any():
+            lookup[-1] = self._code('nan')
+        return lookup[chunk_codes]
+
+    def _code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.codes)
+        return code
+
+    def finish(self, codes):
+        """
+        Renumbers `codes` in sorted category order and returns them
+        together with a fitted LabelEncoder for the same classes.
+        """
+        classes = sorted(self.codes)
+        remap = np.empty(len(classes), dtype=np.int32)
+        for sorted_code, value in enumerate(classes):
+            remap[self.codes[value]] = sorted_code
+        encoder = LabelEncoder()
+        encoder.classes_ = np.array(classes, dtype=object)
+        return remap[codes], encoder
+
+
+def read_flight_columns(path, stops_mapping, chunk_rows=None, stages=None):
+    """
+    Streams the flight CSV into encoded columns.
+
+    Returns (columns, label_encoders, stops_values) where `columns`
+    maps each feature and 'Price' to a NumPy array.
+    """
+    stages = stages if stages is not None else StageTimer()
+    encoders = {col: IncrementalEncoder() for col in CATEGORICAL_COLUMNS}
+    stops_values = set()
+    buffer = ColumnBuffer(BUFFER_DTYPES)
+
+    with stages("parse+encode"):
+        reader = pd.read_csv(
+            path,
+            usecols=list(FLIGHT_DTYPES),
+            dtype=FLIGHT_DTYPES,
+            chunksize=chunk_rows or CHUNK_ROWS,
+        )
+        for chunk in reader:
+            values = {col: encoders[col].encode_categorical(chunk[col]) for col in CATEGORICAL_COLUMNS}
+
+            # Stop labels map exactly as in training (unknown → 0)
+            stops = chunk['Total_Stops']
+            stops_values.update(str(c) for c in stops.cat.categories)
+            lookup = np.array([stops_mapping.get(c, 0) for c in stops.cat.categories] + [0], dtype=np.int8)
+            values['Total_Stops'] = lookup[stops.cat.codes.to_numpy()]
+
+            for col in ('Duration_hours', 'Month', 'Price'):
+                values[col] = chunk[col].to_numpy()
+            buffer.append(values)
+
+    with stages("finalize encoders"):
+        columns = buffer.finish()
+        label_encoders = {}
+        for col in CATEGORICAL_COLUMNS:
+            columns[col], label_encoders[col] = encoders[col].finish(columns[col])
+
+    return columns, label_encoders, sorted(stops_values)
+
+
+if __name__ == "__main__":
+    import model_store
+
+    path = sys.argv[1] if len(sys.argv) > 1 else model_store.FLIGHT_DATASET_PATH
+    stages = StageTimer()
+    columns, label_encoders, _ = read_flight_columns(path, model_store.STOPS_MAPPING, stages=stages)
+    n_rows = len(columns['Price'])
+    n_bytes = sum(column.nbytes for column in columns.values())
+    print(f"Read {n_rows} rows from {path} ({os.path.getsize(path) / 2**20:.1f} MB CSV) "
+          f"into {n_bytes / 2**20:.1f} MB of columns")
+    for col, le in label_encoders.items():
+        print(f"  {col}: {len(le.classes_)} categories")
+    stages.print_report()
@@ -0,0 +1,149 @@
+"""
+===========================================================
+ PROCESS MEMORY / TIMING HELPERS
+===========================================================
+
+Small, dependency-optional helpers to report resident
+memory (RSS) and peak RSS of the current process, and to
+time named stages of a pipeline.
+
+psutil is used when installed; otherwise /proc (Linux) or
+the `resource` module is used. Values that cannot be
+measured on the current platform are reported as None.
+===========================================================
+"""
+
+import os
+import sys
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def rss_mb():
+    """
+    Current resident set size in MB, or None if unavailable.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size in MB since start (or the last reset_peak).
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS reports bytes
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2**20
+    return None
+
+
+def read_bytes():
+    """
+    Bytes this process has read through read()-style calls so far
+    (page-cache hits included), or None if unavailable.
+    """
+    if psutil is not None:
+        try:
+            counters = psutil.Process().io_counters()
+            return getattr(counters, "read_chars", counters.read_bytes)
+        except (AttributeError, psutil.Error):
+            pass
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak():
+    """
+    Resets the peak RSS counter where the OS allows it (Linux only),
+    so the next peak_rss_mb() covers a single stage.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class StageTimer:
+    """
+    Records wall time, RSS and peak RSS of named pipeline stages.
+
+        stages = StageTimer()
+        with stages("parse"):
+            ...
+        stages.report  # list of dicts, one per stage
+    """
+
+    def __init__(self):
+        self.report = []
+
+    def __call__(self, name):
+        return _Stage(self, name)
+
+    def print_report(self):
+        print_report(self.report)
+
+
+def print_report(report):
+    """
+    Prints a stage report (as produced by StageTimer) one line per stage.
+    """
+    for stage in report:
+        print(f"  {stage['stage']:<20} {stage['seconds']:8.2f} s"
+              f"   rss {_mb(stage['rss_mb'])} MB   peak {_mb(stage['peak_rss_mb'])} MB")
+
+
+def _mb(value):
+    return "     n/a" if value is None else f"{value:8.1f}"
+
+
+class _Stage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.report.append({
+            "stage": self.name,
+            "seconds": time.perf_counter() - self.start,
+            "rss_mb": rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+        })
+        return False
@@ -0,0 +1,159 @@
+"""
+===========================================================
+ MICRO-BATCHING SCHEDULER FOR SINGLE-ROW PREDICTIONS
+===========================================================
+
+Coalesces concurrent single-row prediction requests into
+one model call. Requests are collected for up to
+`max_wait_ms` milliseconds or `max_batch_size` rows, the
+rows are stacked into one array, the model runs once in a
+worker thread, and each waiting request gets its own row
+of the result back.
+
+With an `InferenceExecutor`, batches run on its dedicated
+pool (up to `max_concurrent_batches` at once, while the
+next batch keeps filling), a full queue refuses new rows
+with `Overloaded`, and `submit` can time out with
+`InferenceTimeout`.
+===========================================================
+"""
+
+import asyncio
+
+import numpy as np
+
+from inference_executor import InferenceTimeout, Overloaded
+
+
+class MicroBatcher:
+    """
+    Asyncio request coalescer in front of a vectorized predict function.
+
+    `predict_fn` receives an (n_rows, n_features) array and must return
+    a sequence with one result per row.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=64, max_wait_ms=2.0,
+                 executor=None, max_queue=None, max_concurrent_batches=1):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must not be negative")
+        if max_concurrent_batches < 1:
+            raise ValueError("max_concurrent_batches must be at least 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.max_queue = max_queue or None
+        self.max_concurrent_batches = max_concurrent_batches
+        self.batches = 0
+        self.rows = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._queue = None
+        self._worker = None
+
+    async def submit(self, row, timeout=None):
+        """
+        Queues one feature row and waits for its prediction.
+
+        Raises Overloaded if `max_queue` rows are already waiting, and
+        InferenceTimeout if no result arrives within `timeout` seconds.
+        """
+        self._ensure_worker()
+        if self.max_queue is not None and self._queue.qsize() >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"{self._queue.qsize()} predictions queued (limit {self.max_queue})")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, future))
+        if timeout is None:
+            return await future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # The cancelled future is skipped when its batch is scored
+            self.timeouts += 1
+            raise InferenceTimeout(f"Prediction did not finish within {timeout * 1000:.0f} ms") from None
+
+    def _ensure_worker(self):
+        # The queue and worker are bound to the running event loop, so
+        # they are created lazily on the first request instead of import.
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _collect(self):
+        # Block for the first request, then gather more until the batch
+        # is full or the wait window closes.
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if len(batch) >= self.max_batch_size:
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        # A free slot is taken before collecting, so while every slot is
+        # busy new requests keep accumulating into the next batch
+        slots = asyncio.Semaphore(self.max_concurrent_batches)
+        while True:
+            await slots.acquire()
+            batch = await self._collect()
+
+            # Drop requests whose callers already gave up
+            batch = [(row, future) for row, future in batch if not future.done()]
+            if not batch:
+                slots.release()
+                continue
+
+            task = loop.create_task(self._score(batch))
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _score(self, batch):
+        features = np.asarray([row for row, _ in batch], dtype=np.float64)
+        try:
+            if self.executor is not None:
+                results = await self.executor.run(self.predict_fn, features)
+            else:
+                results = await asyncio.get_running_loop().run_in_executor(None, self.predict_fn, features)
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        self.batches += 1
+        self.rows += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        """
+        Returns batch counters and the average batch size so far.
+        """
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
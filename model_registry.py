@@ -0,0 +1,282 @@
+"""
+===========================================================
+ HOT MODEL RELOAD AND ROLLBACK
+===========================================================
+
+Keeps the model a server process is using behind one
+reference that can be replaced while requests are running.
+
+- A background thread polls the artifact manifest (see
+  model_store.py). When it points at a new version, the
+  artifact is loaded, its evaluators are built and a
+  warm-up batch is run, all off the request path; only
+  then is `registry.current` replaced, in one assignment.
+- Requests read `registry.current` once and use that
+  model until they finish, so requests already running
+  complete on the old version.
+- A version that fails to load or warm up is never
+  swapped in; the old model keeps serving and the error
+  is reported in `status()`.
+- `rollback()` swaps back to a recently served version
+  (kept warm in memory) or any version still on disk.
+
+Retraining (`python model_store.py flight`) writes a new
+manifest and every running worker picks it up. Rolling the
+whole fleet back pins an older version in the manifest:
+    python model_registry.py versions flight|earthquake
+    python model_registry.py rollback flight|earthquake [version]
+
+Environment settings:
+    MODEL_RELOAD_SECONDS  manifest poll interval (default 5, 0 = off)
+    MODEL_ADMIN           1 to enable the POST /model/reload and
+                          /model/rollback routes
+===========================================================
+"""
+
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+import model_store
+import shared_model
+
+RELOAD_SECONDS = float(os.environ.get("MODEL_RELOAD_SECONDS", "5"))
+ADMIN_ENABLED = os.environ.get("MODEL_ADMIN", "0") == "1"
+
+
+class ModelRegistry:
+    """
+    The served version of model `name`, swapped atomically on reload.
+
+    `prepare(artifact)` adds the app's serving objects (encoders,
+    caches...) to an artifact that already has its evaluators, and
+    `warmup(model)` runs a batch through it and raises if the output
+    is wrong. `on_swap(model)` is called after every swap.
+    """
+
+    def __init__(self, name, prepare=None, warmup=None, on_swap=None,
+                 poll_seconds=None, keep=3, artifact_dir=None):
+        self.name = name
+        self.prepare = prepare or (lambda artifact: artifact)
+        self.warmup = warmup
+        self.on_swap = on_swap
+        self.poll_seconds = RELOAD_SECONDS if poll_seconds is None else poll_seconds
+        self.artifact_dir = artifact_dir
+        self.current = None
+        # Recently served models, most recent last, kept warm for rollback
+        self.history = deque(maxlen=keep)
+        self.swaps = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_check = None
+        self._manifest_stat = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if hasattr(os, "register_at_fork"):
+            # Threads do not survive fork (e.g. gunicorn --preload)
+            os.register_at_fork(after_in_child=self._restart_after_fork)
+
+    # -------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------
+    def load_initial(self):
+        """
+        Loads the current version (from shared memory when published)
+        and makes it the served model.
+        """
+        self._manifest_stat = self._stat_manifest()
+        self._activate(shared_model.load_model(self.name), "startup")
+        return self.current
+
+    def _stat_manifest(self):
+        try:
+            stat = os.stat(model_store.manifest_path(self.name, self.artifact_dir))
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _activate(self, artifact, source):
+        # Builds and warms the serving model, then swaps it in
+        start = time.perf_counter()
+        model = self.prepare(artifact)
+        prepared = time.perf_counter()
+        if self.warmup is not None:
+            self.warmup(model)
+        finished = time.perf_counter()
+        model["registry"] = {
+            "source": source,
+            "activated_at": time.time(),
+            "prepare_seconds": prepared - start,
+            "warmup_seconds": finished - prepared,
+        }
+
+        self._swap(model)
+        return model
+
+    def _swap(self, model):
+        # The previous model stays warm in the history for rollback
+        if self.current is not None:
+            for old in [m for m in self.history if m["version"] == self.current["version"]]:
+                self.history.remove(old)
+            self.history.append(self.current)
+        self.current = model
+        self.swaps += 1
+        if self.on_swap is not None:
+            self.on_swap(model)
+
+    def _swap_to_warm(self, version):
+        # Swaps to a version still held in the history; False if there is none
+        for model in self.history:
+            if model["version"] == version:
+                self.history.remove(model)
+                self._swap(model)
+                return True
+        return False
+
+    def _load_version(self, manifest, source):
+        # From the serving bundle when there is one (see shared_model.py)
+        return self._activate(shared_model.load_version(manifest, self.artifact_dir), source)
+
+    def check(self, force=False):
+        """
+        Swaps in the manifest's version if it differs from the served one.
+        Returns True if a new model was swapped in.
+
+        The manifest is only re-read when its size or mtime changed
+        (or with `force`), so a version that failed, or that was rolled
+        back locally, is not retried on every poll.
+        """
+        with self._lock:
+            self.last_check = time.time()
+            stat = self._stat_manifest()
+            if stat is None or (stat == self._manifest_stat and not force):
+                return False
+            self._manifest_stat = stat
+            manifest = model_store.read_manifest(self.name, self.artifact_dir)
+            if manifest is None or manifest["version"] == self.current["version"]:
+                return False
+            try:
+                if not self._swap_to_warm(manifest["version"]):
+                    self._load_version(manifest, "reload")
+            except Exception as exc:
+                # Keep serving the old model
+                self.failures += 1
+                self.last_error = {
+                    "version": manifest["version"],
+                    "time": time.time(),
+                    "error": f"{type(exc).__name__}: {exc}",
+                }
+                traceback.print_exc()
+                return False
+            self.last_error = None
+            print(f"Model '{self.name}' reloaded: now serving version {self.current['version']}")
+            return True
+
+    def rollback(self, version=None):
+        """
+        Swaps back to `version` (default: the previously served one).
+        Recently served versions are still warm and swap instantly;
+        others are loaded from disk and warmed first.
+        """
+        with self._lock:
+            if version is None:
+                if not self.history:
+                    raise LookupError(f"No earlier '{self.name}' version to roll back to")
+                version = self.history[-1]["version"]
+            if version == self.current["version"]:
+                return self.current
+
+            if not self._swap_to_warm(version):
+                if version not in model_store.list_versions(self.name, self.artifact_dir):
+                    raise LookupError(f"No '{self.name}' artifact with version {version}")
+                manifest = {"name": self.name, "version": version, "artifact": f"{self.name}-{version}.joblib"}
+                self._load_version(manifest, "rollback")
+            print(f"Model '{self.name}' rolled back: now serving version {self.current['version']}")
+            return self.current
+
+    # -------------------------------------------------------
+    # Watcher thread
+    # -------------------------------------------------------
+    def start(self):
+        """
+        Starts polling the manifest every `poll_seconds` (if > 0).
+        """
+        if self.poll_seconds <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name=f"model-registry-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.check()
+            except Exception:
+                traceback.print_exc()
+
+    def _restart_after_fork(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if self._thread is not None:
+            self._thread = None
+            self.start()
+
+    def status(self):
+        """
+        Served version, warm rollback versions, reload counters and the
+        last reload error.
+        """
+        current = self.current or {}
+        return {
+            "name": self.name,
+            "version": current.get("version"),
+            **current.get("registry", {}),
+            "previous_versions": [model["version"] for model in reversed(self.history)],
+            "swaps": self.swaps,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_check": self.last_check,
+            "poll_seconds": self.poll_seconds,
+            "watching": self._thread is not None and self._thread.is_alive(),
+        }
+
+
+# ===========================================================
+# COMMAND LINE
+# ===========================================================
+if __name__ == "__main__":
+    usage = ("usage: python model_registry.py versions flight|earthquake\n"
+             "       python model_registry.py rollback flight|earthquake [version]")
+    if len(sys.argv) < 3 or sys.argv[1] not in ("versions", "rollback") or sys.argv[2] not in model_store.TRAINERS:
+        sys.exit(usage)
+    command, name = sys.argv[1], sys.argv[2]
+    manifest = model_store.read_manifest(name) or {}
+    versions = model_store.list_versions(name)
+
+    if command == "versions":
+        for version in versions:
+            marker = "*" if version == manifest.get("version") else " "
+            pinned = " (pinned)" if marker == "*" and manifest.get("pinned") else ""
+            print(f"{marker} {version}{pinned}")
+        sys.exit(0)
+
+    if len(sys.argv) > 3:
+        target = sys.argv[3]
+    else:
+        older = [v for v in versions if v != manifest.get("version")]
+        if not older:
+            sys.exit(f"No earlier '{name}' version on disk to roll back to")
+        target = older[0]
+    pinned = model_store.pin_version(name, target)
+    print(f"Pinned '{name}' version {pinned['version']}; running servers swap to it "
+          f"within MODEL_RELOAD_SECONDS")
@@ -0,0 +1,474 @@
+"""
+===========================================================
+ SHARED TRAINING / MODEL ARTIFACT STORE
+===========================================================
+
+Trains the flight price and earthquake alert models once
+and exports each one as a single versioned artifact:
+fitted model, encoders, stops mapping, feature order and
+the hash of the dataset it was trained on.
+
+Every app loads its artifact at startup instead of reading
+the CSV and refitting. The artifact is rebuilt only when
+the dataset hash changes, unless an older version has been
+pinned (see model_registry.py for rollback).
+
+pandas, sklearn and joblib are only imported on the paths
+that train or unpickle a model, so serving processes that
+load the array bundles (see shared_model.py) never pay for
+them. With SERVING_ONLY=1 the dataset is not even checked:
+the artifact in the manifest is served as is and nothing
+is ever retrained.
+
+Build artifacts ahead of time with:
+    python model_store.py flight
+    python model_store.py earthquake
+===========================================================
+"""
+
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import dataset_cache
+from dataset_cache import check_source, dataset_hash
+from memstats import StageTimer, print_report
+
+# ===========================================================
+# 1) LOCATIONS (override with environment variables)
+# ===========================================================
+FLIGHT_DATASET_PATH = os.environ.get(
+    "FLIGHT_DATASET_PATH",
+    r"C:\Users\Fluxtech\Downloads\archive (1)\flight_dataset.csv"
+)
+EARTHQUAKE_DATASET_PATH = os.environ.get(
+    "EARTHQUAKE_DATASET_PATH",
+    r"C:\Users\Fluxtech\Downloads\archive\earthquake_alert_balanced_dataset.csv"
+)
+ARTIFACT_DIR = os.environ.get(
+    "MODEL_ARTIFACT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts")
+)
+DATASET_CACHE_DIR = os.environ.get(
+    "DATASET_CACHE_DIR",
+    os.path.join(ARTIFACT_DIR, "datasets")
+)
+
+# Bump when the artifact layout changes so old files are rebuilt
+ARTIFACT_FORMAT = 1
+
+# Serve the manifest's artifact without checking the dataset or retraining
+SERVING_ONLY = os.environ.get("SERVING_ONLY", "0") == "1"
+
+# ===========================================================
+# 2) FEATURE DEFINITIONS SHARED BY ALL APPS
+# ===========================================================
+FLIGHT_FEATURES = ['Airline', 'Source', 'Destination', 'Total_Stops',
+                   'Duration_hours', 'Month']
+FLIGHT_CATEGORICAL = ['Airline', 'Source', 'Destination']
+FLIGHT_TARGET = "Price"
+
+# Mapping for total stops (string → numeric)
+STOPS_MAPPING = {
+    'non-stop': 0,
+    '1 stop': 1,
+    '2 stops': 2,
+    '3 stops': 3,
+    '4 stops': 4
+}
+
+EARTHQUAKE_FEATURES = ['magnitude', 'depth', 'cdi', 'mmi', 'sig']
+EARTHQUAKE_TARGET = 'alert'
+
+# ===========================================================
+# 3) DATASETS (columnar cache, see dataset_cache.py)
+# ===========================================================
+def convert_flight(dataset_path):
+    """
+    Flight CSV → encoded columns, category vocabularies and stop labels.
+    """
+    from ingest import read_flight_columns
+
+    columns, label_encoders, stops_values = read_flight_columns(dataset_path, STOPS_MAPPING)
+    categories = {col: [str(c) for c in le.classes_] for col, le in label_encoders.items()}
+    return columns, categories, {"stops_values": stops_values}
+
+
+def convert_earthquake(dataset_path):
+    """
+    Earthquake CSV → float64 feature columns and encoded alert labels.
+    """
+    import pandas as pd
+    from sklearn.preprocessing import LabelEncoder
+
+    data = pd.read_csv(dataset_path, usecols=EARTHQUAKE_FEATURES + [EARTHQUAKE_TARGET])
+    label_encoder = LabelEncoder()
+    columns = {col: data[col].to_numpy(dtype=np.float64) for col in EARTHQUAKE_FEATURES}
+    columns[EARTHQUAKE_TARGET] = label_encoder.fit_transform(data[EARTHQUAKE_TARGET].astype(str)).astype(np.int8)
+    return columns, {EARTHQUAKE_TARGET: [str(c) for c in label_encoder.classes_]}, {}
+
+
+DATASET_CONVERTERS = {
+    "flight": convert_flight,
+    "earthquake": convert_earthquake,
+}
+
+
+def load_dataset(name, dataset_path=None):
+    """
+    Memory-mapped columns of dataset `name`, converted from the CSV
+    only when the cache is missing or the file changed.
+    """
+    return dataset_cache.load_dataset(
+        name, dataset_path or DEFAULT_DATASETS[name], DATASET_CONVERTERS[name], DATASET_CACHE_DIR
+    )
+
+
+def label_encoder_from_classes(classes):
+    """
+    Fitted LabelEncoder rebuilt from a stored vocabulary.
+    """
+    from sklearn.preprocessing import LabelEncoder
+
+    encoder = LabelEncoder()
+    encoder.classes_ = np.array(classes, dtype=object)
+    return encoder
+
+# ===========================================================
+# 4) TRAINING
+# ===========================================================
+def train_flight(dataset_path, stages=None):
+    """
+    Fits the flight price DecisionTreeRegressor and its encoders.
+    Encoded columns come from the dataset cache; the CSV is only
+    streamed in (see ingest.py) when it changed. Returns the artifact
+    contents (without version metadata).
+    """
+    from sklearn.model_selection import train_test_split
+    from sklearn.tree import DecisionTreeRegressor
+
+    stages = stages if stages is not None else StageTimer()
+    with stages("load dataset"):
+        dataset = load_dataset("flight", dataset_path)
+        label_encoders = {col: label_encoder_from_classes(dataset.categories[col]) for col in FLIGHT_CATEGORICAL}
+        stops_values = dataset.extra["stops_values"]
+
+    with stages("split"):
+        X = np.column_stack([dataset.columns[col] for col in FLIGHT_FEATURES]).astype(np.float32)
+        y = np.asarray(dataset.columns[FLIGHT_TARGET])
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42
+        )
+        del X, y
+
+    with stages("train"):
+        model = DecisionTreeRegressor(max_depth=6, random_state=42)
+        model.fit(X_train, y_train)
+
+    with stages("evaluate"):
+        r2 = float(model.score(X_test, y_test))
+
+    return {
+        "model": model,
+        "label_encoders": label_encoders,
+        "stops_mapping": dict(STOPS_MAPPING),
+        "stops_values": stops_values,
+        "features": list(FLIGHT_FEATURES),
+        "metrics": {"r2": r2},
+        "training_report": stages.report,
+    }
+
+
+def earthquake_split(dataset_path=None):
+    """
+    Train / test split of the earthquake dataset:
+    (X_train, X_test, y_train, y_test), labels encoded.
+    """
+    from sklearn.model_selection import train_test_split
+
+    # Target labels are already encoded in the dataset cache
+    dataset = load_dataset("earthquake", dataset_path)
+    X = np.column_stack([dataset.columns[col] for col in EARTHQUAKE_FEATURES])
+    y_encoded = dataset.columns[EARTHQUAKE_TARGET].astype(np.int64)
+    return train_test_split(X, y_encoded, test_size=0.2, random_state=42)
+
+
+def train_earthquake(dataset_path, stages=None, warm_start=None):
+    """
+    Fits the earthquake alert RandomForestClassifier and its label encoder.
+    The trees are fitted in parallel (see parallel_training.py); with
+    `warm_start=(previous_artifact, n_trees)` the previous forest is kept
+    and `n_trees` trees fitted on the current data are added to it.
+    Returns the artifact contents (without version metadata).
+    """
+    import parallel_training
+
+    dataset = load_dataset("earthquake", dataset_path)
+    label_encoder = label_encoder_from_classes(dataset.categories[EARTHQUAKE_TARGET])
+    X_train, X_test, y_train, y_test = earthquake_split(dataset_path)
+
+    if warm_start is None:
+        # Same forest as RandomForestClassifier(...).fit, on all cores
+        rf_model = parallel_training.fit_forest(
+            X_train, y_train,
+            n_estimators=100,  # number of trees in the forest
+            random_state=42,   # ensures reproducibility
+            max_depth=8,       # maximum depth of each tree
+            checkpoint_dir=parallel_training.CHECKPOINT_DIR,
+            name="earthquake",
+        )
+        warm_started_from = None
+    else:
+        previous, n_trees = warm_start
+        if list(previous["label_encoder"].classes_) != list(label_encoder.classes_):
+            raise ValueError("Alert labels changed; retrain the earthquake model from scratch")
+        rf_model = parallel_training.extend_forest(
+            previous["model"], X_train, y_train, n_trees,
+            checkpoint_dir=parallel_training.CHECKPOINT_DIR, name="earthquake",
+        )
+        warm_started_from = previous["version"]
+
+    return {
+        "model": rf_model,
+        "label_encoder": label_encoder,
+        "features": list(EARTHQUAKE_FEATURES),
+        "metrics": {"accuracy": float(rf_model.score(X_test, y_test))},
+        "warm_started_from": warm_started_from,
+    }
+
+
+TRAINERS = {
+    "flight": train_flight,
+    "earthquake": train_earthquake,
+}
+
+DEFAULT_DATASETS = {
+    "flight": FLIGHT_DATASET_PATH,
+    "earthquake": EARTHQUAKE_DATASET_PATH,
+}
+
+# ===========================================================
+# 5) VERSIONING
+# ===========================================================
+def manifest_path(name, artifact_dir=None):
+    return os.path.join(artifact_dir or ARTIFACT_DIR, f"{name}.json")
+
+
+def read_manifest(name, artifact_dir=None):
+    """
+    Returns the manifest of the current artifact, or None if none exists.
+    """
+    path = manifest_path(name, artifact_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(name, manifest, artifact_dir=None):
+    # Write to a temp file then rename, so readers never see a partial file
+    path = manifest_path(name, artifact_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _is_current(name, manifest, dataset_path, artifact_dir=None):
+    """
+    True if the artifact in `manifest` was built from the dataset as it is now.
+    File size and mtime are checked first so the hash is only computed
+    when the file may have changed.
+    """
+    if manifest is None or manifest.get("format") != ARTIFACT_FORMAT:
+        return False
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    if not os.path.exists(os.path.join(artifact_dir, manifest["artifact"])):
+        return False
+    if manifest.get("pinned"):
+        # Rolled back on purpose: keep serving it until the next build
+        return True
+
+    status = check_source(manifest, dataset_path)
+    if status == "touched":
+        # Same content, new timestamp (e.g. a fresh copy): remember the new stat
+        _write_manifest(name, manifest, artifact_dir)
+    return status != "changed"
+
+# ===========================================================
+# 6) BUILD / LOAD
+# ===========================================================
+def build_artifact(name, dataset_path=None, artifact_dir=None, trainer=None):
+    """
+    Trains model `name` from its dataset and writes a new artifact version.
+    `trainer(dataset_path)` replaces the default trainer of the model
+    (e.g. to warm-start it, see parallel_training.py).
+    """
+    import joblib
+
+    dataset_path = dataset_path or DEFAULT_DATASETS[name]
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    os.makedirs(artifact_dir, exist_ok=True)
+
+    stat = os.stat(dataset_path)
+    digest = dataset_hash(dataset_path)
+    artifact = (trainer or TRAINERS[name])(dataset_path)
+    artifact.update({
+        "name": name,
+        "format": ARTIFACT_FORMAT,
+        "version": digest[:12],
+        "dataset_hash": digest,
+        "created_at": time.time(),
+    })
+
+    filename = f"{name}-{artifact['version']}.joblib"
+    joblib.dump(artifact, os.path.join(artifact_dir, filename))
+
+    _write_manifest(name, {
+        "name": name,
+        "format": ARTIFACT_FORMAT,
+        "version": artifact["version"],
+        "artifact": filename,
+        "dataset_hash": digest,
+        "dataset_size": stat.st_size,
+        "dataset_mtime_ns": stat.st_mtime_ns,
+        "created_at": artifact["created_at"],
+        "metrics": artifact["metrics"],
+    }, artifact_dir)
+    return artifact
+
+
+def current_manifest(name, dataset_path=None, artifact_dir=None):
+    """
+    Manifest of the artifact to serve for model `name`, or None when it
+    has to be (re)built first: there is none yet, or the dataset file is
+    available and changed since. With SERVING_ONLY=1 the dataset is not
+    checked.
+    """
+    dataset_path = dataset_path or DEFAULT_DATASETS[name]
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    manifest = read_manifest(name, artifact_dir)
+    if manifest is None or manifest.get("format") != ARTIFACT_FORMAT:
+        return None
+    if SERVING_ONLY or not os.path.exists(dataset_path):
+        return manifest
+    return manifest if _is_current(name, manifest, dataset_path, artifact_dir) else None
+
+
+def load_artifact(name, dataset_path=None, artifact_dir=None):
+    """
+    Loads the current artifact for model `name`.
+
+    If the dataset file is available and its hash differs from the one
+    the artifact was built from, the artifact is rebuilt first. Without
+    the dataset (or with SERVING_ONLY=1), the last built artifact is
+    used as is.
+    """
+    dataset_path = dataset_path or DEFAULT_DATASETS[name]
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    manifest = current_manifest(name, dataset_path, artifact_dir)
+
+    if manifest is None:
+        if SERVING_ONLY:
+            raise FileNotFoundError(f"No '{name}' model artifact in {artifact_dir} (SERVING_ONLY=1 never trains)")
+        if not os.path.exists(dataset_path):
+            raise FileNotFoundError(
+                f"No '{name}' model artifact in {artifact_dir} and dataset not found at {dataset_path}"
+            )
+        print(f"Building '{name}' model artifact from {dataset_path}")
+        return build_artifact(name, dataset_path, artifact_dir)
+
+    return load_manifest_artifact(manifest, artifact_dir)
+
+
+def load_manifest_artifact(manifest, artifact_dir=None):
+    """
+    Loads the artifact file a manifest points to, without rebuilding.
+    """
+    import joblib
+
+    return joblib.load(os.path.join(artifact_dir or ARTIFACT_DIR, manifest["artifact"]))
+
+
+def list_versions(name, artifact_dir=None):
+    """
+    Versions of model `name` with an artifact file on disk, newest first.
+    """
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    if not os.path.isdir(artifact_dir):
+        return []
+    files = [f for f in os.listdir(artifact_dir) if f.startswith(f"{name}-") and f.endswith(".joblib")]
+    files.sort(key=lambda f: os.path.getmtime(os.path.join(artifact_dir, f)), reverse=True)
+    return [f[len(name) + 1:-len(".joblib")] for f in files]
+
+
+def pin_version(name, version, artifact_dir=None):
+    """
+    Points the manifest of model `name` at an existing artifact version
+    and marks it pinned, so it is served even though the dataset has
+    moved on. The next build_artifact replaces the pin.
+    """
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    filename = f"{name}-{version}.joblib"
+    artifact = load_manifest_artifact({"artifact": filename}, artifact_dir)
+    if artifact.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"Artifact {filename} has an old format and cannot be served")
+    manifest = {
+        "name": name,
+        "format": ARTIFACT_FORMAT,
+        "version": version,
+        "artifact": filename,
+        "dataset_hash": artifact["dataset_hash"],
+        "created_at": artifact["created_at"],
+        "metrics": artifact["metrics"],
+        "pinned": True,
+    }
+    _write_manifest(name, manifest, artifact_dir)
+    return manifest
+
+
+def publish_derived(artifact, artifact_dir=None):
+    """
+    Writes `artifact`, a variant of the served version with a version
+    of its own (e.g. its compressed forest, see forest_compress.py),
+    and points the manifest at it so running servers reload it. The
+    dataset fields are kept: it stays current until the dataset changes.
+    """
+    import joblib
+
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    name = artifact["name"]
+    source = read_manifest(name, artifact_dir)
+    if source is None:
+        raise FileNotFoundError(f"No '{name}' manifest in {artifact_dir} to derive a version from")
+    filename = f"{name}-{artifact['version']}.joblib"
+    joblib.dump(artifact, os.path.join(artifact_dir, filename))
+    manifest = {
+        **source,
+        "version": artifact["version"],
+        "artifact": filename,
+        "created_at": artifact["created_at"],
+        "metrics": artifact["metrics"],
+    }
+    _write_manifest(name, manifest, artifact_dir)
+    return manifest
+
+# ===========================================================
+# 7) COMMAND LINE
+# ===========================================================
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in TRAINERS:
+        sys.exit(f"usage: python model_store.py {{{'|'.join(TRAINERS)}}} [dataset_path]")
+
+    artifact = build_artifact(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"Built '{artifact['name']}' artifact version {artifact['version']} "
+          f"in {ARTIFACT_DIR} (metrics: {artifact['metrics']})")
+
+    # Serving bundle, so servers start without sklearn (see shared_model.py)
+    import shared_model
+    print(f"Wrote {shared_model.save_bundle(shared_model.build_evaluators(artifact))}")
+    if "training_report" in artifact:
+        print_report(artifact["training_report"])
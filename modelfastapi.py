@@ -1,43 +1,117 @@
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
-from sklearn.ensemble import RandomForestClassifier
-from fastapi import FastAPI
+import os
+import numpy as np
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import uvicorn
+from typing import List, Optional
+import shared_model
+from metrics import AppMetrics, elapsed, instrument_fastapi, mark
+from audit_log import add_audit_gauges, audit_from_env
+from inference_executor import InferenceTimeout, Overloaded, executor_from_env
+from microbatch import MicroBatcher
+from model_registry import ADMIN_ENABLED, ModelRegistry
 
-# Load the dataset from CSV file
-file_path = r"C:\Users\Fluxtech\Downloads\archive\earthquake_alert_balanced_dataset.csv"
-data = pd.read_csv(file_path)
+# Request counts, per-stage latency histograms and pool gauges,
+# served in Prometheus text format at /metrics; the model_version
+# label follows the served version
+metrics = AppMetrics("fastapi", "earthquake", version=None)
 
-# Select features (X) and target (y)
-X = data[['magnitude', 'depth', 'cdi', 'mmi', 'sig']]
-y = data[['alert']]
+def warmup_model(model, rows=256):
+    """
+    Scores a batch of random events and fails unless every row gets
+    a probability distribution over the known alerts.
+    """
+    rng = np.random.default_rng(0)
+    features = rng.uniform([4, 0, 0, 0, 0], [9, 700, 9, 10, 3000], (rows, len(model["features"])))
+    proba = model["packed_forest"].predict_proba(features)
+    if proba.shape != (rows, len(model["label_encoder"].classes_)) or not np.allclose(proba.sum(axis=1), 1.0):
+        raise ValueError(f"Earthquake model {model['version']} failed its warm-up check")
+    model["packed_forest"].predict_early_exit(features)
 
-# Encode target labels to numerical values
-label_encoder = LabelEncoder()
-y_encoded = label_encoder.fit_transform(y)
+def init_pool_worker():
+    # INFERENCE_POOL=process: a worker serves the model it was forked with
+    # and the pool is replaced on every swap, so it never polls on its own
+    registry.stop()
 
-# Split dataset into training and testing sets
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y_encoded, test_size=0.2, random_state=42
+def on_swap(model):
+    metrics.version = model["version"]
+    # Process pool workers hold a copy of the previous model
+    executor.restart()
+
+# Dedicated pool for model calls, with in-flight limit and per-call
+# timeout (INFERENCE_* variables, see inference_executor.py); model
+# call time is recorded here, even when the call ran in another process
+executor = executor_from_env(
+    initializer=init_pool_worker,
+    on_run=lambda seconds: metrics.observe("model_call", seconds)
 )
 
-# Initialize and train Random Forest Classifier
-rf_model = RandomForestClassifier(
-    n_estimators=100,  # number of trees in the forest
-    random_state=42,   # ensures reproducibility
-    max_depth=8        # maximum depth of each tree
+# Load the trained model artifact (rebuilt only when the dataset changes).
+# Under `python shared_model.py serve earthquake -- uvicorn ...` every
+# worker attaches the forest arrays from shared memory instead. Its
+# "packed_forest" holds all 100 trees in shared arrays, evaluated
+# together and bit-identical to the RandomForestClassifier (see
+# tree_engine.py). New versions written by `python model_store.py
+# earthquake` are loaded, warmed and swapped in by a background thread
+# (see model_registry.py); each model call reads registry.current once.
+registry = ModelRegistry(
+    "earthquake",
+    warmup=warmup_model,
+    on_swap=on_swap
 )
-rf_model.fit(X_train, y_train)
+registry.load_initial()
+registry.start()
+
+# Feature order used for training and for every prediction path
+FEATURES = registry.current["features"]
+
+# Largest number of events accepted by POST /predict/batch
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "10000"))
+
+# Micro-batching of concurrent POST /predict calls: how long to wait for
+# more requests (milliseconds) and how many rows to score together at most
+PREDICT_MAX_WAIT_MS = float(os.environ.get("PREDICT_MAX_WAIT_MS", "2"))
+PREDICT_MAX_BATCH = int(os.environ.get("PREDICT_MAX_BATCH", "128"))
+
+# Rows allowed to wait for a micro-batch before POST /predict answers 503
+PREDICT_MAX_QUEUE = int(os.environ.get("PREDICT_MAX_QUEUE", "1024"))
 
-# Evaluate model accuracy on the test set
-accuracy = rf_model.score(X_test, y_test)
+# Model accuracy on the held-out test set, measured at training time
+accuracy = registry.current["metrics"]["accuracy"]
 print(f"Model Accuracy: {accuracy*100:.2f}%")
 
 # Create a FastAPI app
 app = FastAPI(title="Earth Alert Predictor API")
 
+metrics.add_gauge(
+    "inference_in_flight", "Model calls queued or running on the inference pool.", ("app",),
+    lambda: [(("fastapi",), executor.in_flight)]
+)
+metrics.add_gauge(
+    "microbatch_queue_depth", "Single-event predictions waiting for a micro-batch.", ("app",),
+    lambda: [(("fastapi",), batcher.stats()["queue_depth"])]
+)
+metrics.add_gauge(
+    "inference_rejected_total", "Requests refused with 503 because a queue was full.", ("app", "queue"),
+    lambda: [(("fastapi", "executor"), executor.rejected), (("fastapi", "microbatch"), batcher.rejected)],
+    kind="counter"
+)
+
+# Inputs, features, alerts, version and latency of every prediction,
+# written to SQLite by a background thread (see audit_log.py)
+audit = audit_from_env("fastapi", "earthquake")
+add_audit_gauges(metrics, audit)
+instrument_fastapi(app, metrics)
+
+# Full queues answer 503 and slow model calls 504, instead of waiting forever
+@app.exception_handler(Overloaded)
+def overloaded_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(InferenceTimeout)
+def timeout_handler(request, exc):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
 # Root endpoint to provide basic API information
 @app.get("/")
 def root():
@@ -51,27 +125,169 @@ class EarthquakeInput(BaseModel):
     mmi: float
     sig: float
 
+# Batch input: either a list of events or one list per feature (columnar)
+class EarthquakeBatchInput(BaseModel):
+    events: Optional[List[EarthquakeInput]] = None
+    magnitude: Optional[List[float]] = None
+    depth: Optional[List[float]] = None
+    cdi: Optional[List[float]] = None
+    mmi: Optional[List[float]] = None
+    sig: Optional[List[float]] = None
+    return_probabilities: bool = False
+    # Stop adding trees once the leading alert can no longer be overtaken
+    early_exit: bool = False
+
+def batch_to_array(batch):
+    """
+    Converts a batch payload into an (n_events, 5) float64 array
+    in training feature order, without building a DataFrame.
+    """
+    columns = [getattr(batch, name) for name in FEATURES]
+
+    if batch.events is not None:
+        if any(col is not None for col in columns):
+            raise HTTPException(status_code=422, detail="Send either 'events' or feature columns, not both")
+        rows = [[e.magnitude, e.depth, e.cdi, e.mmi, e.sig] for e in batch.events]
+        return np.array(rows, dtype=np.float64).reshape(len(rows), len(FEATURES))
+
+    if any(col is None for col in columns):
+        raise HTTPException(status_code=422, detail=f"Columnar payload needs all of {FEATURES}")
+    if len({len(col) for col in columns}) != 1:
+        raise HTTPException(status_code=422, detail="All feature columns must have the same length")
+    return np.column_stack([np.asarray(col, dtype=np.float64) for col in columns])
+
+def predict_array(features, return_probabilities=False, early_exit=False):
+    """
+    Scores a 2-D feature array in one vectorized forest pass and maps
+    the winning classes straight to alert labels. Runs on the inference
+    pool, which times each call (one may serve a whole micro-batch).
+    """
+    # One version for the whole call, even if a reload swaps it meanwhile;
+    # it is returned with the result so the audit log records that one
+    model = registry.current
+    packed_forest = model["packed_forest"]
+    label_encoder = model["label_encoder"]
+    if early_exit and not return_probabilities:
+        # Same labels as the full forest, usually from far fewer trees
+        pred_encoded, trees_used = packed_forest.predict_early_exit(features)
+        return {
+            "predicted_alerts": label_encoder.classes_[pred_encoded].tolist(),
+            "trees_used": trees_used.tolist(),
+            "model_version": model["version"],
+        }
+
+    proba = packed_forest.predict_proba(features)
+    pred_encoded = packed_forest.classes.take(np.argmax(proba, axis=1))
+    result = {"predicted_alerts": label_encoder.classes_[pred_encoded].tolist(), "model_version": model["version"]}
+    if return_probabilities:
+        result["classes"] = label_encoder.classes_[packed_forest.classes].tolist()
+        result["probabilities"] = proba.tolist()
+    return result
+
+def predict_labels(features):
+    """
+    Returns one (alert label, model version) pair per row of a 2-D
+    feature array.
+    """
+    result = predict_array(features)
+    return [(label, result["model_version"]) for label in result["predicted_alerts"]]
+
+# Concurrent single-event requests are coalesced into one predict_proba call,
+# scored on the inference pool (one batch per pool worker at a time)
+batcher = MicroBatcher(
+    predict_labels,
+    max_batch_size=PREDICT_MAX_BATCH,
+    max_wait_ms=PREDICT_MAX_WAIT_MS,
+    executor=executor,
+    max_queue=PREDICT_MAX_QUEUE,
+    max_concurrent_batches=executor.max_workers
+)
+
 # Prediction endpoint: accepts JSON input and returns predicted alert level
 @app.post("/predict")
-def predict(input_data: EarthquakeInput):
-    # Convert input JSON to a DataFrame for model prediction
-    df = pd.DataFrame([[
+async def predict(input_data: EarthquakeInput):
+    # Feature row in training order
+    row = [
         input_data.magnitude,
         input_data.depth,
         input_data.cdi,
         input_data.mmi,
         input_data.sig
-    ]], columns=['magnitude', 'depth', 'cdi', 'mmi', 'sig'])
-    
-    # Predict encoded class
-    pred_encoded = rf_model.predict(df)[0]
-    
-    # Convert encoded prediction back to original alert label
-    pred_label = label_encoder.inverse_transform([pred_encoded])[0]
-    
+    ]
+    mark("parse")
+
+    # Wait for the micro-batch containing this row to be scored
+    pred_label, model_version = await batcher.submit(row, timeout=executor.timeout)
+    mark("predict")
+
+    # Logged with the version of the model that scored the row
+    audit.record("/predict", model_version, input_data, row, pred_label, elapsed())
+
     # Return prediction as JSON
     return {"predicted_alert": pred_label}
 
+# Batch prediction endpoint: scores many events in one vectorized call
+@app.post("/predict/batch")
+async def predict_batch(batch: EarthquakeBatchInput):
+    features = batch_to_array(batch)
+    mark("parse")
+
+    if features.shape[0] == 0:
+        raise HTTPException(status_code=422, detail="Batch is empty")
+    if features.shape[0] > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {features.shape[0]} events exceeds the limit of {MAX_BATCH_SIZE}"
+        )
+
+    # Scored on the inference pool, not the event loop or starlette's threadpool
+    result = await executor.run(predict_array, features, batch.return_probabilities, batch.early_exit)
+    mark("predict")
+
+    # One audit record per batch; its inputs are the feature rows
+    audit.record("/predict/batch", result["model_version"], None, features, result, elapsed())
+    return result
+
+# Queue depth, rejections, timeouts and latency percentiles of the model path
+@app.get("/inference/stats")
+def inference_stats():
+    return {"executor": executor.stats(), "microbatch": batcher.stats()}
+
+# Audit log counters: recorded, written, spilled and dropped records
+@app.get("/audit/stats")
+def audit_stats():
+    return audit.stats()
+
+# Per-worker stats: how the model was loaded, startup time and memory use
+@app.get("/worker/stats")
+def worker_stats():
+    return {**shared_model.worker_stats(), "microbatch": batcher.stats()}
+
+# Served model version, warm rollback versions and the last reload error
+@app.get("/model/status")
+def model_status():
+    return registry.status()
+
+# Check the manifest now instead of waiting for the next poll
+@app.post("/model/reload")
+def model_reload():
+    if not ADMIN_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    swapped = registry.check(force=True)
+    return {"swapped": swapped, **registry.status()}
+
+# Swap back to ?version=... (default: the previously served version)
+@app.post("/model/rollback")
+def model_rollback(version: Optional[str] = None):
+    if not ADMIN_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    try:
+        registry.rollback(version)
+    except LookupError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    return registry.status()
+
 # Run the FastAPI server using uvicorn
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,301 @@
+"""
+===========================================================
+ PARALLEL, INCREMENTAL AND RESUMABLE FOREST TRAINING
+===========================================================
+
+Fits the trees of a RandomForestClassifier on a pool of
+worker processes (or threads), chunk by chunk, and gives
+the same forest as the serial `fit`:
+
+- Each chunk of trees is fitted by sklearn's own forest
+  `fit` with `warm_start`, skipping the trees before the
+  chunk: tree i gets the i-th seed of the random_state
+  stream, and bootstrap, max_samples and class_weight
+  act exactly as in the serial fit, so the result does
+  not depend on the number of workers.
+- `extend_forest` adds trees to a fitted forest, with the
+  seeds the next trees of the stream would get (sklearn's
+  `warm_start`), e.g. when new earthquake rows arrive.
+- Every finished chunk of trees is checkpointed to disk;
+  re-running an interrupted fit with the same data and
+  parameters only fits the missing chunks.
+
+Environment settings:
+    TRAIN_POOL            process (default) or thread
+    TRAIN_WORKERS         pool size (default: CPU count)
+    TRAIN_CHUNK_TREES     trees per task / checkpoint (default 10)
+    TRAIN_CHECKPOINT_DIR  default <MODEL_ARTIFACT_DIR>/checkpoints
+
+Compare wall time and CPU utilization with the serial fit
+(and check that both forests predict the same):
+    python parallel_training.py compare [--workers N] [--rows N]
+Add trees to the current earthquake model for new rows:
+    python parallel_training.py extend [n_trees]
+===========================================================
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+import model_store
+
+CHECKPOINT_DIR = os.environ.get(
+    "TRAIN_CHECKPOINT_DIR",
+    os.path.join(model_store.ARTIFACT_DIR, "checkpoints")
+)
+
+
+# Training data of this worker, set once by the pool initializer
+_data = {}
+
+
+def _init_worker(X, y):
+    _data["X"], _data["y"] = X, y
+
+
+def _fit_trees(params, first, count):
+    # Fits trees first .. first + count - 1 of the forest on the worker's
+    # data: a warm start past `first` placeholder trees draws the same
+    # seeds, bootstrap samples and class weights as the serial fit
+    forest = RandomForestClassifier(**params).set_params(
+        n_estimators=first + count, warm_start=True, oob_score=False, n_jobs=1, verbose=0)
+    forest.estimators_ = [None] * first
+    with warnings.catch_warnings():
+        # sklearn's note on balanced class weights with warm_start: the
+        # data is the same for every chunk here
+        warnings.simplefilter("ignore", UserWarning)
+        forest.fit(_data["X"], _data["y"])
+    return forest.estimators_[first:]
+
+
+class Checkpoint:
+    """
+    Finished chunks of one training run, one joblib file per chunk,
+    in a directory named after the data and parameters of the run.
+    """
+
+    def __init__(self, directory, name, fingerprint):
+        self.path = os.path.join(directory, f"{name}-{fingerprint[:16]}")
+
+    def load(self):
+        """
+        {index of first tree: trees} of every chunk saved so far.
+        """
+        if not os.path.isdir(self.path):
+            return {}
+        chunks = {}
+        for filename in os.listdir(self.path):
+            if filename.startswith("trees-") and filename.endswith(".joblib"):
+                chunks[int(filename[6:-7])] = joblib.load(os.path.join(self.path, filename))
+        return chunks
+
+    def save(self, first, trees):
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, f"trees-{first:05d}.joblib")
+        joblib.dump(trees, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _fingerprint(X, y, params, start, n_new):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X).tobytes())
+    digest.update(np.ascontiguousarray(y).tobytes())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    digest.update(f"{start}:{n_new}".encode())
+    return digest.hexdigest()
+
+
+def _make_pool(kind, n_workers, X, y):
+    if kind == "thread":
+        # Tree fitting releases the GIL, so threads share the data instead
+        _init_worker(X, y)
+        return ThreadPoolExecutor(n_workers, thread_name_prefix="train")
+    # fork: workers inherit the data and never re-import the app that
+    # triggered training (spawn would run its module-level code again)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    return ProcessPoolExecutor(n_workers, mp_context=context, initializer=_init_worker, initargs=(X, y))
+
+
+def extend_forest(forest, X, y, n_new, n_workers=None, chunk_trees=None, pool=None,
+                  checkpoint_dir=None, name="forest"):
+    """
+    Fits `n_new` more trees on (X, y) and appends them to the fitted
+    `forest`, giving the trees `fit` with warm_start=True would add.
+    Labels in `y` must all be classes the forest already knows.
+
+    Trees are fitted `chunk_trees` at a time on `n_workers` processes
+    (or threads with pool="thread"); with `checkpoint_dir`, finished
+    chunks are saved there and reused by a rerun after a crash.
+    """
+    n_workers = n_workers or int(os.environ.get("TRAIN_WORKERS", os.cpu_count() or 1))
+    chunk_trees = chunk_trees or int(os.environ.get("TRAIN_CHUNK_TREES", "10"))
+    pool = pool or os.environ.get("TRAIN_POOL", "process")
+    if pool not in ("process", "thread"):
+        raise ValueError("pool must be 'process' or 'thread'")
+    if n_new <= 0:
+        return forest
+
+    if forest.oob_score:
+        raise ValueError("oob_score is not supported; score the fitted forest on held-out data")
+    y = np.asarray(y)
+    if not np.isin(y, forest.classes_).all():
+        raise ValueError("New labels not seen by the forest; retrain it from scratch")
+    if np.unique(y).size != forest.classes_.size:
+        raise ValueError("Every class must occur in the data the new trees are fitted on")
+    # The forest fits on float32 rows; converted once, not per chunk
+    X = np.ascontiguousarray(X, dtype=np.float32)
+
+    params = {key: value for key, value in forest.get_params().items()
+              if key not in ("n_estimators", "warm_start", "n_jobs", "verbose")}
+    start = len(forest.estimators_)
+    chunks = [(start + i, min(chunk_trees, n_new - i)) for i in range(0, n_new, chunk_trees)]
+
+    checkpoint = None
+    done = {}
+    if checkpoint_dir:
+        checkpoint = Checkpoint(checkpoint_dir, name, _fingerprint(X, y, params, start, n_new))
+        done = checkpoint.load()
+        if done:
+            print(f"Resuming '{name}' training: {sum(len(t) for t in done.values())} of {n_new} trees checkpointed")
+    pending = [(first, count) for first, count in chunks if first not in done]
+
+    if pending and (n_workers == 1 or len(pending) == 1):
+        # Not worth starting a pool
+        _init_worker(X, y)
+        for first, count in pending:
+            done[first] = _fit_trees(params, first, count)
+            if checkpoint is not None:
+                checkpoint.save(first, done[first])
+    elif pending:
+        with _make_pool(pool, min(n_workers, len(pending)), X, y) as executor:
+            futures = {executor.submit(_fit_trees, params, first, count): first for first, count in pending}
+            for future in as_completed(futures):
+                first = futures[future]
+                done[first] = future.result()
+                if checkpoint is not None:
+                    checkpoint.save(first, done[first])
+    _data.clear()
+
+    for first in sorted(done):
+        forest.estimators_.extend(done[first])
+    forest.n_estimators = len(forest.estimators_)
+    if checkpoint is not None:
+        checkpoint.clear()
+    return forest
+
+
+def fit_forest(X, y, n_estimators=100, n_workers=None, chunk_trees=None, pool=None,
+               checkpoint_dir=None, name="forest", **params):
+    """
+    RandomForestClassifier(n_estimators, **params).fit(X, y), with the
+    trees fitted in parallel; see extend_forest. `params` must include
+    an integer random_state so the trees can be reproduced; oob_score
+    is not supported.
+    """
+    if not isinstance(params.get("random_state"), (int, np.integer)):
+        raise ValueError("fit_forest needs an integer random_state")
+    if params.get("oob_score"):
+        raise ValueError("oob_score is not supported; score the fitted forest on held-out data")
+    # The first tree is fitted by sklearn itself, which also sets up
+    # the forest's classes and other fitted attributes
+    forest = RandomForestClassifier(n_estimators=1, **params)
+    forest.fit(X, y)
+    return extend_forest(forest, X, y, n_estimators - 1, n_workers, chunk_trees, pool,
+                         checkpoint_dir, name)
+
+
+# ===========================================================
+# COMMAND LINE
+# ===========================================================
+def _cpu_seconds():
+    # CPU time of this process and of its finished child processes
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _timed(fit):
+    wall, cpu = time.perf_counter(), _cpu_seconds()
+    forest = fit()
+    return forest, time.perf_counter() - wall, _cpu_seconds() - cpu
+
+
+def _compare(args):
+    dataset = model_store.load_dataset("earthquake")
+    X = np.column_stack([dataset.columns[col] for col in model_store.EARTHQUAKE_FEATURES])
+    y = dataset.columns[model_store.EARTHQUAKE_TARGET].astype(np.int64)
+    if args.rows and args.rows > len(y):
+        # Resample with a little noise to get a bigger training set
+        rng = np.random.default_rng(0)
+        rows = rng.integers(0, len(y), args.rows)
+        X = X[rows] * rng.normal(1.0, 0.01, (args.rows, X.shape[1]))
+        y = y[rows]
+    params = {"random_state": 42, "max_depth": 8}
+    cores = os.cpu_count() or 1
+    workers = args.workers or int(os.environ.get("TRAIN_WORKERS", cores))
+
+    print(f"{len(y)} rows, {args.trees} trees, {cores} CPU cores, {workers} workers ({args.pool} pool)")
+    serial, serial_wall, serial_cpu = _timed(
+        lambda: RandomForestClassifier(n_estimators=args.trees, **params).fit(X, y))
+    parallel, parallel_wall, parallel_cpu = _timed(
+        lambda: fit_forest(X, y, args.trees, workers, pool=args.pool, **params))
+    for label, wall, cpu in (("serial fit", serial_wall, serial_cpu),
+                             ("parallel fit", parallel_wall, parallel_cpu)):
+        print(f"  {label:<13} {wall:8.2f} s wall   {cpu:8.2f} s CPU   "
+              f"{cpu / wall / cores * 100:5.1f}% of {cores} cores")
+    print(f"  speedup       {serial_wall / parallel_wall:8.2f}x")
+
+    mismatches = int(np.count_nonzero(serial.predict_proba(X) != parallel.predict_proba(X)))
+    print(f"  predict_proba differences: {mismatches}")
+    return 1 if mismatches else 0
+
+
+def _extend(args):
+    # Warm start: keep the served forest and add trees fitted on the new rows
+    manifest = model_store.read_manifest("earthquake")
+    if manifest is None:
+        sys.exit("No earthquake artifact to extend; build one with: python model_store.py earthquake")
+    previous = model_store.load_manifest_artifact(manifest)
+    dataset_path = model_store.EARTHQUAKE_DATASET_PATH
+    if model_store.dataset_hash(dataset_path) == manifest["dataset_hash"]:
+        sys.exit("The dataset has not changed since the current artifact was built; nothing to add")
+
+    def trainer(path):
+        return model_store.train_earthquake(path, warm_start=(previous, args.trees))
+
+    artifact = model_store.build_artifact("earthquake", dataset_path, trainer=trainer)
+    print(f"Built 'earthquake' artifact version {artifact['version']} with "
+          f"{artifact['model'].n_estimators} trees (metrics: {artifact['metrics']})")
+
+    # Serving bundle, so servers start without sklearn (see shared_model.py)
+    import shared_model
+    print(f"Wrote {shared_model.save_bundle(shared_model.build_evaluators(artifact))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel / incremental forest training.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compare = commands.add_parser("compare", help="serial vs parallel fit of the earthquake forest")
+    compare.add_argument("--workers", type=int, help="worker count (default TRAIN_WORKERS or CPU count)")
+    compare.add_argument("--rows", type=int, help="resample the dataset to this many rows")
+    compare.add_argument("--trees", type=int, default=100)
+    compare.add_argument("--pool", choices=("process", "thread"), default=os.environ.get("TRAIN_POOL", "process"))
+    extend = commands.add_parser("extend", help="add trees for new rows to the earthquake model")
+    extend.add_argument("trees", type=int, nargs="?", default=20)
+    args = parser.parse_args()
+    sys.exit(_compare(args) if args.command == "compare" else _extend(args))
@@ -0,0 +1,203 @@
+"""
+===========================================================
+ PREDICTION RESULT CACHE
+===========================================================
+
+Bounded LRU cache with optional time-to-live, keyed on the
+encoded feature row. The Flask and Dash apps check it
+before calling the model when it is enabled.
+
+It is off by default: with the compiled tree a prediction
+takes about as long as a cache hit (lock, key, LRU move),
+so caching only pays off for slow predictors such as the
+sklearn model itself. Compare both with:
+    python prediction_cache.py
+
+With `threshold_key`, continuous features are replaced in
+the key by the interval between the tree's split points
+they fall into. Every value in one interval reaches the
+same leaf, so e.g. 5.0 h and 5.2 h share a cache entry
+when no split separates them.
+
+The cache is tagged with the model artifact version and
+clears itself when a different version is passed in.
+
+Environment settings read by `cache_from_env`:
+    PRICE_CACHE_SIZE      max entries (default 0 = disabled)
+    PRICE_CACHE_TTL       seconds an entry lives (0 = forever)
+    PRICE_CACHE_QUANTIZE  1 to key on split intervals (default)
+===========================================================
+"""
+
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+NAN = float("nan")
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU/TTL cache for model predictions.
+    """
+
+    def __init__(self, maxsize=4096, ttl=None, key_fn=tuple):
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self.key_fn = key_fn
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, row, compute, version=None):
+        """
+        Returns the cached prediction for `row`, calling `compute()` on a miss.
+        Passing a different model `version` than last time clears the cache.
+        """
+        if self.maxsize <= 0:
+            return compute()
+
+        key = self.key_fn(row)
+        now = time.monotonic()
+        with self._lock:
+            if version != self.version:
+                self._invalidate(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+
+        # Compute outside the lock so slow predictions don't serialize
+        value = compute()
+        expires_at = now + self.ttl if self.ttl else None
+        with self._lock:
+            if version == self.version:
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def _invalidate(self, version):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._invalidate(self.version)
+
+    def stats(self):
+        """
+        Hit/miss/eviction counters and current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def threshold_key(compiled_tree, features):
+    """
+    Key function that replaces each feature index in `features` by the
+    index of the split interval its value falls into. Values are rounded
+    to float32 first, exactly as the tree compares them; missing values
+    (None / NaN) share one interval.
+    """
+    splits = {f: compiled_tree.split_points(f) for f in features}
+
+    def key(row):
+        key = list(row)
+        for f, points in splits.items():
+            value = key[f]
+            x = NAN if value is None else array('f', (value,))[0]
+            key[f] = ('nan',) if x != x else bisect_left(points, x)
+        return tuple(key)
+
+    return key
+
+
+def cache_from_env(compiled_tree, quantized_features):
+    """
+    Builds the prediction cache configured by the PRICE_CACHE_* variables.
+    """
+    key_fn = tuple
+    if os.environ.get("PRICE_CACHE_QUANTIZE", "1") == "1":
+        key_fn = threshold_key(compiled_tree, quantized_features)
+    return PredictionCache(
+        maxsize=int(os.environ.get("PRICE_CACHE_SIZE", "0")),
+        ttl=float(os.environ.get("PRICE_CACHE_TTL", "0")),
+        key_fn=key_fn,
+    )
+
+
+def _us_per_call(fn, repeat):
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        seconds = (time.perf_counter() - start) / repeat
+        best = seconds if best is None else min(best, seconds)
+    return best * 1e6
+
+
+def benchmark_cache():
+    """
+    Cost of a cache hit (tuple and split-interval keys) against
+    computing the prediction with the compiled tree and with sklearn.
+    """
+    import numpy as np
+
+    import model_store
+    from tree_engine import CompiledTree
+
+    artifact = model_store.load_artifact("flight")
+    model = artifact["model"]
+    compiled = CompiledTree.from_sklearn(model)
+    row = [3, 1, 2, 0, 2.83, 3]
+    X = np.array([row], dtype=np.float64)
+    duration = artifact["features"].index("Duration_hours")
+
+    computes = {"compiled tree": (lambda: compiled.predict_one(row), 20000),
+                "sklearn": (lambda: model.predict(X)[0], 200)}
+    keys = {"tuple key": tuple, "split-interval key": threshold_key(compiled, [duration])}
+    for name, (compute, repeat) in computes.items():
+        miss_us = _us_per_call(compute, repeat)
+        print(f"{name}: predict {miss_us:.2f} us")
+        for key_name, key_fn in keys.items():
+            cache = PredictionCache(key_fn=key_fn)
+            cache.get_or_compute(row, compute, "v")
+            hit_us = _us_per_call(lambda: cache.get_or_compute(row, compute, "v"), repeat)
+            print(f"  cache hit ({key_name}) {hit_us:.2f} us, "
+                  f"{'faster' if hit_us < miss_us else 'slower'} than predicting")
+
+
+if __name__ == "__main__":
+    benchmark_cache()
@@ -0,0 +1,190 @@
+"""
+===========================================================
+ FLIGHT PRICE SWEEPS ("WHAT-IF" CURVES)
+===========================================================
+
+Prices one base flight while one or two of its fields vary
+(e.g. all 12 months × 0-4 stops, or a duration range), in
+a single batched predictor call instead of one request and
+one prediction per point.
+
+A sweep dimension is a field name with its default values
+(every month, stop count or known category, or durations
+from 1 to 48 hours), or a dict naming the field with
+explicit "values", or "start" / "stop" / "step" for
+numeric fields. The result is the price surface:
+    {"axes": [{"name": ..., "values": [...]}, ...],
+     "prices": [...]}          # nested: first axis outermost
+
+Check the batched surface against per-point predictions
+and compare their latency with:
+    python price_sweep.py
+===========================================================
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from encoding import CATEGORICAL_COLUMNS
+
+# Request field → position in the model's feature row
+FIELDS = {
+    "airline": 0,
+    "source": 1,
+    "destination": 2,
+    "total_stops": 3,
+    "duration_hours": 4,
+    "month": 5,
+}
+NUMERIC_FIELDS = ("total_stops", "duration_hours", "month")
+
+# Accepted types of sweep values (stops also take labels like "1 stop")
+VALUE_TYPES = {
+    "airline": str,
+    "source": str,
+    "destination": str,
+    "total_stops": (str, int, float),
+    "duration_hours": (int, float),
+    "month": (int, float),
+}
+
+# Largest grid one sweep may price
+MAX_POINTS = int(os.environ.get("PRICE_SWEEP_MAX_POINTS", "10000"))
+
+
+def default_values(encoder, name):
+    """
+    Values a dimension takes when the sweep does not list them.
+    """
+    if name == "month":
+        return list(range(1, 13))
+    if name == "total_stops":
+        return sorted(set(encoder.stops_table.values()))
+    if name == "duration_hours":
+        return [float(hours) for hours in range(1, 49)]
+    return list(encoder.tables[CATEGORICAL_COLUMNS[FIELDS[name]]])
+
+
+def _axis(encoder, spec):
+    # (name, values) of one sweep dimension; ValueError if it is invalid
+    if isinstance(spec, str):
+        spec = {"name": spec}
+    if not isinstance(spec, dict) or not isinstance(spec.get("name"), str) or spec["name"] not in FIELDS:
+        raise ValueError(f"Sweep dimensions must be one of {', '.join(FIELDS)}")
+    name = spec["name"]
+
+    if "values" in spec:
+        values = spec["values"]
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"'{name}' values must be a non-empty list")
+    elif "start" in spec:
+        if name not in NUMERIC_FIELDS:
+            raise ValueError(f"'{name}' is not numeric; list its values instead")
+        try:
+            start, stop = float(spec["start"]), float(spec["stop"])
+            step = float(spec.get("step", 1))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"'{name}' range needs numeric start, stop and step") from None
+        if step <= 0 or stop < start or (stop - start) / step > MAX_POINTS:
+            raise ValueError(f"'{name}' range is empty or too long")
+        values = np.arange(start, stop + step / 2, step).round(6).tolist()
+    else:
+        values = default_values(encoder, name)
+
+    for value in values:
+        if isinstance(value, bool) or not isinstance(value, VALUE_TYPES[name]):
+            raise ValueError(f"'{name}' has an invalid value: {value!r}")
+    return name, values
+
+
+def _encode(encoder, name, value):
+    # Model feature value of one sweep value
+    if name in NUMERIC_FIELDS:
+        return encoder.encode_stops(value) if name == "total_stops" else float(value)
+    return encoder.encode(CATEGORICAL_COLUMNS[FIELDS[name]], value)
+
+
+def sweep_grid(encoder, base, dimensions, max_points=None):
+    """
+    Axes of the sweep and its (n_points, 6) feature matrix, the
+    first dimension varying slowest. Fields of `base` that are
+    swept may be omitted.
+    """
+    if not isinstance(dimensions, list) or not 1 <= len(dimensions) <= 2:
+        raise ValueError("Sweep one or two dimensions")
+    axes = [_axis(encoder, spec) for spec in dimensions]
+    if len({name for name, _ in axes}) != len(axes):
+        raise ValueError("Sweep dimensions must be different fields")
+    n_points = int(np.prod([len(values) for _, values in axes]))
+    if n_points > (max_points or MAX_POINTS):
+        raise ValueError(f"Sweep has {n_points} points (limit {max_points or MAX_POINTS})")
+
+    fields = dict(base)
+    for name, values in axes:
+        fields.setdefault(name, values[0])
+    row = encoder.encode_row(
+        fields["airline"], fields["source"], fields["destination"],
+        fields["total_stops"], float(fields["duration_hours"]), fields["month"]
+    )
+
+    X = np.tile(np.asarray(row, dtype=np.float64), (n_points, 1))
+    codes = [np.array([_encode(encoder, name, value) for value in values], dtype=np.float64)
+             for name, values in axes]
+    for (name, _), grid in zip(axes, np.meshgrid(*codes, indexing="ij")):
+        X[:, FIELDS[name]] = grid.ravel()
+    return axes, X
+
+
+def price_surface(predictor, encoder, base, dimensions, max_points=None):
+    """
+    Prices of `base` over the sweep `dimensions` in one predictor call.
+    """
+    axes, X = sweep_grid(encoder, base, dimensions, max_points)
+    prices = predictor.predict(X).round(2).reshape([len(values) for _, values in axes])
+    return {
+        "axes": [{"name": name, "values": values} for name, values in axes],
+        "prices": prices.tolist(),
+    }
+
+
+if __name__ == "__main__":
+    import shared_model
+    from encoding import FlightEncoder
+
+    artifact = shared_model.load_model("flight")
+    encoder = FlightEncoder.from_artifact(artifact)
+    predictor = artifact["predictor"]
+    base = {
+        "airline": default_values(encoder, "airline")[0],
+        "source": default_values(encoder, "source")[0],
+        "destination": default_values(encoder, "destination")[-1],
+        "total_stops": 0,
+        "duration_hours": 2.5,
+        "month": 1,
+    }
+
+    mismatches = 0
+    for dimensions in (["month", "total_stops"], [{"name": "duration_hours", "start": 0.5, "stop": 48, "step": 0.5}],
+                       ["airline", "month"]):
+        axes, X = sweep_grid(encoder, base, dimensions)
+        repeat = 200
+        start = time.perf_counter()
+        for _ in range(repeat):
+            surface = price_surface(predictor, encoder, base, dimensions)
+        batched = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        single = [predictor.predict_one(row) for row in X.tolist()]
+        per_point = time.perf_counter() - start
+
+        expected = np.round(single, 2)
+        got = np.ravel(surface["prices"])
+        mismatches += int(np.count_nonzero(got != expected))
+        names = " × ".join(f"{name} ({len(values)})" for name, values in axes)
+        print(f"{names}: {len(X)} points, batched {batched * 1e3:.2f} ms, "
+              f"one predict_one per point {per_point * 1e3:.2f} ms")
+
+    print(f"Parity: {mismatches} mismatches")
+    sys.exit(1 if mismatches else 0)
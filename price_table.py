@@ -0,0 +1,352 @@
+"""
+===========================================================
+ PRECOMPUTED FLIGHT PRICE LOOKUP TABLE
+===========================================================
+
+A DecisionTreeRegressor only compares each feature with a
+finite set of thresholds, so every feature splits into a
+few intervals and the model is constant on each cell of
+their product (airline × source × destination × stops ×
+duration × month intervals). This module evaluates the
+tree once per cell ("materialize") and stores the leaf of
+every cell in a compact array. A prediction is then one
+dict lookup (integer values of small domains such as the
+category codes, stops and month) or one bisect per
+feature and one array read, with no sklearn. Batches go
+through the tree's block descent, which is faster than a
+vectorized lookup.
+
+Unknown categories (-1) and out-of-range values land in
+the outer intervals, so the table gives exactly the tree's
+answer for any input. Missing (None / NaN) inputs fall back
+to the tree.
+
+Materialize, verify against the tree and report table
+size, build time and lookup latency with:
+    python price_table.py
+===========================================================
+"""
+
+import os
+import sys
+import time
+from bisect import bisect_left
+
+import numpy as np
+
+import model_store
+
+# Refuse to build tables with more cells than this
+MAX_CELLS = int(os.environ.get("PRICE_TABLE_MAX_CELLS", "50000000"))
+
+# Features whose split points span at most this many integers get a
+# value -> interval dict for predict_one
+MAX_LOOKUP_SPAN = 1024
+
+
+def _interval_representatives(points, lower=False):
+    """
+    One float32 value inside each interval defined by sorted split points:
+    the largest float32 <= each point, plus +inf for the last interval.
+    With `lower=True`, the smallest float32 > the previous point instead.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if lower:
+        above = points.astype(np.float32)
+        above = np.where(above <= points, np.nextafter(above, np.float32(np.inf)), above)
+        return np.concatenate([[np.float32(-np.inf)], above]).astype(np.float32)
+    below = points.astype(np.float32)
+    below = np.where(below > points, np.nextafter(below, np.float32(-np.inf)), below)
+    return np.concatenate([below, [np.float32(np.inf)]]).astype(np.float32)
+
+
+def _rounding_bounds(representatives):
+    """
+    Largest float64 that rounds to at most each float32 representative,
+    so float32(x) > representative exactly when x > bound: predict_one
+    can bisect Python floats without converting them to float32.
+    """
+    r = np.asarray(representatives, dtype=np.float32)
+    with np.errstate(over="ignore"):
+        up = np.nextafter(r, np.float32(np.inf)).astype(np.float64)
+        up = np.where(np.isinf(up), 2.0 ** 128, up)
+        middle = (r.astype(np.float64) + up) / 2
+        # Ties round to the even neighbour, which may be the one above
+        return np.where(middle.astype(np.float32) == r, middle, np.nextafter(middle, -np.inf))
+
+
+def _integer_lookup(bounds):
+    # Interval of every integer around the split points (empty for wide spans)
+    if not bounds:
+        return {}
+    low, high = int(np.floor(bounds[0])) - 1, int(np.ceil(bounds[-1])) + 1
+    if high - low > MAX_LOOKUP_SPAN:
+        return {}
+    return {value: bisect_left(bounds, value) for value in range(low, high + 1)}
+
+
+class PriceTable:
+    """
+    Lookup-based predictor equivalent to a CompiledTree.
+    """
+
+    def __init__(self, split_points, leaf_index, leaf_values, fallback=None):
+        self.split_points = [list(points) for points in split_points]
+        self.shape = tuple(len(points) + 1 for points in self.split_points)
+        self.leaf_index = np.asarray(leaf_index).reshape(-1)
+        self.leaf_values = np.asarray(leaf_values, dtype=np.float64)
+        self.fallback = fallback
+        self.build_seconds = None
+
+        # Mixed-radix strides, last feature varies fastest
+        strides = np.ones(len(self.shape), dtype=np.int64)
+        for i in range(len(self.shape) - 2, -1, -1):
+            strides[i] = strides[i + 1] * self.shape[i + 1]
+        self.strides = strides
+        self._strides = strides.tolist()
+        # For float32 inputs, `x <= t` equals `x <= largest float32 <= t`,
+        # so the batch path can search float32 arrays without upcasting
+        self._point_arrays = [_interval_representatives(points)[:-1] for points in self.split_points]
+        self._bounds = [_rounding_bounds(points).tolist() for points in self._point_arrays]
+        self._lookups = [_integer_lookup(bounds) for bounds in self._bounds]
+        # A memoryview indexes almost as fast as a list without a private
+        # copy of every cell (the table can be shared between workers)
+        self._leaf_index = memoryview(np.ascontiguousarray(self.leaf_index))
+        self._leaf_values = self.leaf_values.tolist()
+
+    @classmethod
+    def materialize(cls, compiled_tree, n_features, max_cells=None, chunk_size=1 << 20):
+        """
+        Evaluates `compiled_tree` once in every cell of the threshold grid.
+        """
+        start = time.perf_counter()
+        max_cells = max_cells or MAX_CELLS
+        split_points = [compiled_tree.split_points(f) for f in range(n_features)]
+        shape = tuple(len(points) + 1 for points in split_points)
+        n_cells = int(np.prod(shape, dtype=np.float64))
+        if n_cells > max_cells:
+            raise ValueError(f"Price table would need {n_cells} cells (limit {max_cells})")
+
+        # Compact leaf numbering so the table fits in uint8/uint16
+        leaf_nodes = np.flatnonzero(compiled_tree.is_leaf)
+        leaf_number = np.full(compiled_tree.n_nodes, -1, dtype=np.int64)
+        leaf_number[leaf_nodes] = np.arange(leaf_nodes.size)
+        dtype = np.uint8 if leaf_nodes.size <= 1 << 8 else np.uint16 if leaf_nodes.size <= 1 << 16 else np.uint32
+
+        representatives = [_interval_representatives(points) for points in split_points]
+        leaf_index = np.empty(n_cells, dtype=dtype)
+        for first in range(0, n_cells, chunk_size):
+            cells = np.arange(first, min(first + chunk_size, n_cells))
+            digits = np.unravel_index(cells, shape)
+            X = np.column_stack([rep[d] for rep, d in zip(representatives, digits)])
+            leaf_index[cells] = leaf_number[compiled_tree.apply(X)]
+
+        table = cls(split_points, leaf_index, compiled_tree.value[leaf_nodes], compiled_tree)
+        table.build_seconds = time.perf_counter() - start
+        return table
+
+    def predict_one(self, row):
+        """
+        Predicts a single feature row with one dict lookup or bisect
+        per feature.
+        """
+        index = 0
+        for value, lookup, bounds, stride in zip(row, self._lookups, self._bounds, self._strides):
+            position = lookup.get(value)
+            if position is None:
+                if value is None or value != value:
+                    return self.fallback.predict_one(row)
+                position = bisect_left(bounds, value)
+            index += position * stride
+        return self._leaf_values[self._leaf_index[index]]
+
+    def predict(self, X):
+        """
+        Predicts every row of a 2-D array: the tree's block descent when
+        the table has its tree, otherwise `lookup`.
+        """
+        if self.fallback is not None:
+            return self.fallback.predict(X)
+        return self.lookup(X)
+
+    def lookup(self, X):
+        """
+        Predicts every row of a 2-D array with vectorized searchsorted.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2:
+            raise ValueError("X must be a 2-D array")
+        index = np.zeros(X.shape[0], dtype=np.int64)
+        for f, (points, stride) in enumerate(zip(self._point_arrays, self.strides)):
+            index += np.searchsorted(points, X[:, f], side='left') * stride
+        result = self.leaf_values[self.leaf_index[index]]
+
+        missing = np.isnan(X).any(axis=1)
+        if missing.any():
+            result[missing] = self.fallback.predict(X[missing])
+        return result
+
+    def stats(self):
+        """
+        Table size and build time.
+        """
+        return {
+            "shape": list(self.shape),
+            "cells": int(self.leaf_index.size),
+            "leaves": int(self.leaf_values.size),
+            "bytes": int(self.leaf_index.nbytes + self.leaf_values.nbytes),
+            "build_seconds": self.build_seconds,
+        }
+
+    def verify(self, compiled_tree, X=None):
+        """
+        Checks the table against the tree at both ends of every cell
+        (largest and smallest float32 inside it) and on optional rows X.
+        Returns the number of mismatches (0 means exactly equivalent).
+        """
+        mismatches = 0
+        for lower in (False, True):
+            representatives = [_interval_representatives(points, lower) for points in self.split_points]
+            for first in range(0, self.leaf_index.size, 1 << 20):
+                cells = np.arange(first, min(first + (1 << 20), self.leaf_index.size))
+                digits = np.unravel_index(cells, self.shape)
+                X_cells = np.column_stack([rep[d] for rep, d in zip(representatives, digits)])
+                expected = compiled_tree.predict(X_cells)
+                mismatches += int(np.count_nonzero(self.leaf_values[self.leaf_index[cells]] != expected))
+        if X is not None:
+            mismatches += int(np.count_nonzero(self.lookup(X) != compiled_tree.predict(X)))
+        return mismatches
+
+    def to_arrays(self):
+        """
+        The table's arrays by name, as saved to disk or shared memory.
+        """
+        return {
+            "leaf_index": self.leaf_index,
+            "leaf_values": self.leaf_values,
+            "split_offsets": np.cumsum([0] + [len(p) for p in self.split_points]),
+            "split_values": np.concatenate([np.asarray(p, dtype=np.float64) for p in self.split_points]),
+            "build_seconds": np.float64(self.build_seconds or 0.0),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, fallback=None):
+        """
+        Rebuilds a table from `to_arrays()` output; the leaf arrays are
+        used as given, without copying.
+        """
+        offsets = arrays["split_offsets"]
+        values = arrays["split_values"]
+        split_points = [values[offsets[i]:offsets[i + 1]].tolist() for i in range(len(offsets) - 1)]
+        table = cls(split_points, arrays["leaf_index"], arrays["leaf_values"], fallback)
+        table.build_seconds = float(arrays["build_seconds"])
+        return table
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, **self.to_arrays())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, fallback=None):
+        with np.load(path) as data:
+            return cls.from_arrays({name: data[name] for name in data.files}, fallback)
+
+
+def table_path(artifact, artifact_dir=None):
+    return os.path.join(artifact_dir or model_store.ARTIFACT_DIR, f"flight-{artifact['version']}.table.npz")
+
+
+def load_or_materialize(artifact, compiled_tree, artifact_dir=None):
+    """
+    Loads the table saved for this artifact version, building it first
+    if needed. The tree is kept as the fallback for NaN inputs.
+    """
+    path = table_path(artifact, artifact_dir)
+    if os.path.exists(path):
+        return PriceTable.load(path, fallback=compiled_tree)
+    table = PriceTable.materialize(compiled_tree, len(artifact["features"]))
+    table.save(path)
+    return table
+
+
+def build_predictor(artifact, compiled_tree):
+    """
+    Predictor the flight apps should use: the compiled tree itself by
+    default (its predict_one measures faster than the table's), or the
+    lookup table when FLIGHT_PRICE_TABLE=1 and it fits in
+    PRICE_TABLE_MAX_CELLS. Both have predict_one/predict.
+    """
+    if os.environ.get("FLIGHT_PRICE_TABLE", "0") != "1":
+        return compiled_tree
+    try:
+        return load_or_materialize(artifact, compiled_tree)
+    except ValueError as exc:
+        print(f"Price table disabled: {exc}")
+        return compiled_tree
+
+
+if __name__ == "__main__":
+    from tree_engine import CompiledTree, _flight_check_rows
+
+    artifact = model_store.load_artifact("flight")
+    compiled = CompiledTree.from_sklearn(artifact["model"])
+    table = PriceTable.materialize(compiled, len(artifact["features"]))
+    table.save(table_path(artifact))
+
+    stats = table.stats()
+    print(f"Table shape {stats['shape']}: {stats['cells']} cells, {stats['leaves']} leaves, "
+          f"{stats['bytes'] / 1024:.1f} KB, built in {stats['build_seconds'] * 1e3:.1f} ms")
+
+    X = _flight_check_rows(artifact)
+    mismatches = table.verify(compiled, X)
+    print(f"Equivalence: every cell plus {len(X)} rows checked, {mismatches} mismatches")
+
+    # A missing input (None) takes the tree's missing-value path
+    none_row = X[0].tolist()
+    none_row[artifact["features"].index("Duration_hours")] = None
+    expected = artifact["model"].predict(np.array([none_row], dtype=np.float64))[0]
+    missing = int(table.predict_one(none_row) != expected)
+    print(f"Missing value: {missing} mismatches")
+    mismatches += missing
+
+    # predict_one on the check rows, on float64 values at and next to every
+    # rounding bound, and with integral values passed as Python ints
+    edges = [X]
+    for f, bounds in enumerate(table._bounds):
+        bounds = np.asarray(bounds)
+        values = np.concatenate([bounds, np.nextafter(bounds, np.inf), np.nextafter(bounds, -np.inf)])
+        edge = np.repeat(X[:1], len(values), axis=0)
+        edge[:, f] = values
+        edges.append(edge)
+    rows = np.vstack(edges)
+    expected = artifact["model"].predict(rows).tolist()
+    rows = rows.tolist()
+    rows += [[int(v) if v.is_integer() else v for v in row] for row in rows[-20000:]]
+    expected += expected[-20000:]
+    single = sum(table.predict_one(row) != value for row, value in zip(rows, expected))
+    print(f"predict_one: {len(rows)} rows checked, {single} mismatches")
+    mismatches += single
+
+    row = X[0].tolist()
+    n = 20000
+    start = time.perf_counter()
+    for _ in range(n):
+        table.predict_one(row)
+    table_us = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    for _ in range(n):
+        compiled.predict_one(row)
+    tree_us = (time.perf_counter() - start) / n * 1e6
+    print(f"Single row lookup: table {table_us:.2f} us, compiled tree {tree_us:.2f} us")
+
+    batch = np.resize(X[-20000:], (1_000_000, X.shape[1]))
+    timings = []
+    for fn in (table.lookup, compiled.predict):
+        start = time.perf_counter()
+        fn(batch)
+        timings.append((time.perf_counter() - start) * 1e3)
+    print(f"Batch of {len(batch)} rows: table lookup {timings[0]:.1f} ms, "
+          f"compiled tree {timings[1]:.1f} ms (PriceTable.predict uses the tree)")
+
+    sys.exit(1 if mismatches else 0)
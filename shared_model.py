@@ -0,0 +1,395 @@
+"""
+===========================================================
+ PRE-FORK SERVING WITH SHARED-MEMORY MODEL WEIGHTS
+===========================================================
+
+Running several uvicorn / gunicorn workers normally means
+every worker loads the artifact and builds its own copy of
+the evaluator arrays. In pre-fork mode the launcher loads
+(or trains) the model once, copies the evaluator arrays
+(CompiledTree, plus the price table when enabled, for
+flights; PackedForest for earthquakes) into one
+`multiprocessing.shared_memory` block, and passes its
+layout to the workers through the SHARED_MODEL_SPEC
+environment variable. Each worker then
+attaches the block read-only: no unpickling, no training,
+and one physical copy of the weights for all workers.
+
+Without SHARED_MODEL_SPEC, `load_model` falls back to
+loading the model privately, so the apps run unchanged as
+single processes. Private loads read the same arrays from
+a serving bundle (<name>-<version>.serving.npz, written
+next to the artifact on first use), so serving a trained
+model needs neither sklearn, joblib nor pandas; only a
+missing bundle or a stale artifact goes through the full
+training stack in model_store.py.
+
+Run a server in pre-fork mode:
+    python shared_model.py serve earthquake -- uvicorn modelfastapi:app --workers 4
+    python shared_model.py serve flight -- gunicorn -w 4 appflask:app
+
+Compare per-worker RSS / PSS and startup time of private
+vs. shared loading:
+    python shared_model.py report flight|earthquake [n_workers]
+===========================================================
+"""
+
+import atexit
+import json
+import os
+import subprocess
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import model_store
+from price_table import PriceTable, build_predictor
+from tree_engine import CompactForest, CompiledTree, PackedForest
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+ENV_VAR = "SHARED_MODEL_SPEC"
+
+# Arrays are placed at multiples of this many bytes in the block
+ALIGNMENT = 64
+
+# Filled by load_model, reported by worker_stats
+_load_info = {}
+
+
+# ===========================================================
+# 1) PUBLISH (launcher process)
+# ===========================================================
+class FittedClasses:
+    """
+    Stand-in for a fitted LabelEncoder holding only `classes_`, which
+    is all the serving code reads, so sklearn is not imported.
+    """
+
+    def __init__(self, classes):
+        self.classes_ = np.array(classes, dtype=object)
+
+
+def _model_arrays(artifact):
+    """
+    Evaluator arrays of a full artifact and the JSON metadata needed
+    to serve it.
+    """
+    meta = {
+        "name": artifact["name"],
+        "version": artifact["version"],
+        "features": artifact["features"],
+        "metrics": artifact["metrics"],
+    }
+    if artifact["name"] == "flight":
+        compiled = artifact.get("compiled_model") or CompiledTree.from_sklearn(artifact["model"])
+        arrays = {f"tree.{key}": value for key, value in compiled.to_arrays().items()}
+        meta["label_encoders"] = {col: [str(c) for c in le.classes_]
+                                  for col, le in artifact["label_encoders"].items()}
+        meta["stops_mapping"] = artifact["stops_mapping"]
+        meta["stops_values"] = artifact["stops_values"]
+    else:
+        forest = artifact.get("packed_forest") or PackedForest.from_sklearn(artifact["model"])
+        arrays = {f"forest.{key}": value for key, value in forest.to_arrays().items()}
+        meta["label_encoder"] = [str(c) for c in artifact["label_encoder"].classes_]
+        if "compression" in artifact:
+            # Set by forest_compress.py when packed_forest is a CompactForest
+            meta["compression"] = artifact["compression"]
+    return arrays, meta
+
+
+def _engine_arrays(name):
+    """
+    Loads the model and returns (arrays to share, JSON metadata),
+    including the flight price table.
+    """
+    artifact = _private_artifact(name)
+    arrays, meta = _model_arrays(artifact)
+    if isinstance(artifact.get("predictor"), PriceTable):
+        arrays.update({f"table.{key}": value for key, value in artifact["predictor"].to_arrays().items()})
+    return arrays, meta
+
+
+def publish(name):
+    """
+    Copies the evaluator arrays of model `name` into a new shared
+    memory block and returns (block, spec). The block is unlinked
+    when this process exits.
+    """
+    arrays, meta = _engine_arrays(name)
+
+    layout = {}
+    offset = 0
+    for key, value in arrays.items():
+        value = np.require(value, requirements="C")
+        arrays[key] = value
+        layout[key] = [offset, value.dtype.str, list(value.shape)]
+        offset += -(-max(value.nbytes, 1) // ALIGNMENT) * ALIGNMENT
+
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for key, value in arrays.items():
+        np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf, offset=layout[key][0])[...] = value
+
+    def _release():
+        block.close()
+        block.unlink()
+    atexit.register(_release)
+
+    return block, {"shm": block.name, "size": offset, "arrays": layout, "meta": meta}
+
+
+# ===========================================================
+# 2) ATTACH (worker processes)
+# ===========================================================
+def _attach_block(shm_name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=shm_name, track=False)
+    # Before 3.13 every attach registers the block with the resource
+    # tracker, which would unlink it when this worker exits (or, when the
+    # tracker is shared with the launcher, drop the launcher's record),
+    # so registration is skipped while attaching
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=shm_name)
+    finally:
+        resource_tracker.register = register
+
+
+def attach(spec):
+    """
+    Maps the block described by `spec` and returns (block, arrays),
+    where every array is a read-only view into shared memory.
+    """
+    block = _attach_block(spec["shm"])
+    arrays = {}
+    for key, (offset, dtype, shape) in spec["arrays"].items():
+        view = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=block.buf, offset=offset)
+        view.flags.writeable = False
+        arrays[key] = view
+    return block, arrays
+
+
+def _prefixed(arrays, prefix):
+    return {key[len(prefix):]: value for key, value in arrays.items() if key.startswith(prefix)}
+
+
+def _artifact_from_arrays(arrays, meta):
+    # Artifact-like dict with ready evaluators built from arrays + metadata
+    artifact = {key: meta[key] for key in ("name", "version", "features", "metrics")}
+    if meta["name"] == "flight":
+        compiled = CompiledTree.from_arrays(_prefixed(arrays, "tree."))
+        table_arrays = _prefixed(arrays, "table.")
+        artifact["compiled_model"] = compiled
+        artifact["label_encoders"] = {col: FittedClasses(classes)
+                                      for col, classes in meta["label_encoders"].items()}
+        artifact["stops_mapping"] = meta["stops_mapping"]
+        artifact["stops_values"] = meta["stops_values"]
+        if table_arrays:
+            artifact["predictor"] = PriceTable.from_arrays(table_arrays, compiled)
+        else:
+            artifact["predictor"] = build_predictor(artifact, compiled)
+    else:
+        forest_arrays = _prefixed(arrays, "forest.")
+        engine = CompactForest if "leaf_table" in forest_arrays else PackedForest
+        artifact["packed_forest"] = engine.from_arrays(forest_arrays)
+        artifact["label_encoder"] = FittedClasses(meta["label_encoder"])
+        if "compression" in meta:
+            artifact["compression"] = meta["compression"]
+    return artifact
+
+
+def _shared_artifact(spec):
+    # Artifact-like dict built from the shared block and the spec metadata
+    block, arrays = attach(spec)
+    artifact = _artifact_from_arrays(arrays, spec["meta"])
+    artifact["shared_block"] = block
+    return artifact
+
+
+def build_evaluators(artifact):
+    """
+    Adds the fast evaluators to a loaded artifact in place and returns it.
+    """
+    if artifact["name"] == "flight":
+        artifact["compiled_model"] = CompiledTree.from_sklearn(artifact["model"])
+        artifact["predictor"] = build_predictor(artifact, artifact["compiled_model"])
+    elif "compression" not in artifact:
+        # A compressed version keeps its CompactForest (forest_compress.py)
+        artifact["packed_forest"] = PackedForest.from_sklearn(artifact["model"])
+    return artifact
+
+
+# ===========================================================
+# 3) SERVING BUNDLES (private loading without sklearn)
+# ===========================================================
+def bundle_path(name, version, artifact_dir=None):
+    return os.path.join(artifact_dir or model_store.ARTIFACT_DIR, f"{name}-{version}.serving.npz")
+
+
+def save_bundle(artifact, artifact_dir=None):
+    """
+    Writes the evaluator arrays and serving metadata of a full artifact
+    to its serving bundle.
+    """
+    arrays, meta = _model_arrays(artifact)
+    path = bundle_path(artifact["name"], artifact["version"], artifact_dir)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_bundle(name, version, artifact_dir=None):
+    """
+    Artifact-like dict with ready evaluators read from the serving
+    bundle of `version`, or None if no bundle was written yet.
+    """
+    path = bundle_path(name, version, artifact_dir)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        arrays = {key: data[key] for key in data.files if key != "meta"}
+    return _artifact_from_arrays(arrays, meta)
+
+
+def load_version(manifest, artifact_dir=None):
+    """
+    Artifact with ready evaluators for the version a manifest points
+    to: from its serving bundle, or from the full artifact file (which
+    then writes the bundle for the next load).
+    """
+    artifact = load_bundle(manifest["name"], manifest["version"], artifact_dir)
+    if artifact is None:
+        artifact = model_store.load_manifest_artifact(manifest, artifact_dir)
+        if artifact.get("format") != model_store.ARTIFACT_FORMAT:
+            raise ValueError(f"Artifact {manifest['artifact']} has an old format")
+        build_evaluators(artifact)
+        save_bundle(artifact, artifact_dir)
+    return artifact
+
+
+def _private_artifact(name, dataset_path=None):
+    # Loads the model in this process; training imports only happen
+    # when the artifact is missing or stale
+    manifest = model_store.current_manifest(name, dataset_path)
+    if manifest is not None:
+        return load_version(manifest)
+    artifact = build_evaluators(model_store.load_artifact(name, dataset_path))
+    save_bundle(artifact)
+    return artifact
+
+
+def load_model(name, dataset_path=None):
+    """
+    Artifact for model `name` with ready evaluators: "compiled_model" and
+    "predictor" for flights, "packed_forest" for earthquakes.
+
+    Attached from shared memory when a launcher published the model in
+    SHARED_MODEL_SPEC; otherwise loaded privately from the serving
+    bundle (or from the full artifact, which also has the fitted
+    sklearn "model", when the bundle is missing or the model is
+    retrained first).
+    """
+    start = time.perf_counter()
+    specs = json.loads(os.environ.get(ENV_VAR, "{}"))
+    if name in specs:
+        artifact = _shared_artifact(specs[name])
+        mode = "shared"
+    else:
+        artifact = _private_artifact(name, dataset_path)
+        mode = "private"
+    _load_info[name] = {"mode": mode, "load_seconds": time.perf_counter() - start}
+    return artifact
+
+
+def worker_stats():
+    """
+    Per-process serving stats: how each model was loaded, how long that
+    took, time since the process started, and memory use. PSS / USS
+    (Linux, with psutil) split shared pages fairly between workers.
+    """
+    stats = {"pid": os.getpid(), "models": dict(_load_info)}
+    if psutil is not None:
+        process = psutil.Process()
+        stats["uptime_seconds"] = time.time() - process.create_time()
+        try:
+            memory = process.memory_full_info()
+        except psutil.Error:
+            memory = process.memory_info()
+        for field in ("rss", "pss", "uss"):
+            if hasattr(memory, field):
+                stats[f"{field}_mb"] = getattr(memory, field) / 2**20
+    return stats
+
+
+# ===========================================================
+# 4) COMMAND LINE
+# ===========================================================
+def _report_worker(name, queue, done):
+    # Started with the spawn method, like uvicorn workers
+    artifact = load_model(name)
+    engine = artifact.get("predictor") or artifact["packed_forest"]
+    engine.predict(np.zeros((1, len(artifact["features"]))))
+    queue.put(worker_stats())
+    # Stay alive until every worker is measured, so shared pages are split
+    done.wait()
+
+
+def _report(name, n_workers):
+    import multiprocessing
+
+    context = multiprocessing.get_context("spawn")
+    for mode in ("private", "shared"):
+        if mode == "shared":
+            _, spec = publish(name)
+            os.environ[ENV_VAR] = json.dumps({name: spec})
+        queue, done = context.Queue(), context.Event()
+        workers = [context.Process(target=_report_worker, args=(name, queue, done)) for _ in range(n_workers)]
+        for worker in workers:
+            worker.start()
+        results = [queue.get(timeout=300) for _ in workers]
+        done.set()
+        for worker in workers:
+            worker.join()
+
+        print(f"{mode} mode, {n_workers} workers:")
+        for stats in sorted(results, key=lambda s: s["pid"]):
+            memory = "   ".join(f"{field} {stats[f'{field}_mb']:7.1f} MB"
+                                for field in ("rss", "pss", "uss") if f"{field}_mb" in stats)
+            load = stats["models"][name]
+            print(f"  pid {stats['pid']:>7}  startup {stats['uptime_seconds'] * 1e3:7.1f} ms"
+                  f"  (model {load['load_seconds'] * 1e3:6.1f} ms)   {memory}")
+        os.environ.pop(ENV_VAR, None)
+
+
+if __name__ == "__main__":
+    usage = ("usage: python shared_model.py serve flight|earthquake -- <server command...>\n"
+             "       python shared_model.py report flight|earthquake [n_workers]")
+    if len(sys.argv) < 3 or sys.argv[1] not in ("serve", "report") or sys.argv[2] not in model_store.TRAINERS:
+        sys.exit(usage)
+    command, name = sys.argv[1], sys.argv[2]
+
+    if command == "report":
+        _report(name, int(sys.argv[3]) if len(sys.argv) > 3 else 4)
+        sys.exit(0)
+
+    server = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    if not server:
+        sys.exit(usage)
+    block, spec = publish(name)
+    print(f"Published '{name}' model {spec['meta']['version']} in shared memory "
+          f"{block.name} ({spec['size'] / 1024:.1f} KB)")
+    env = dict(os.environ)
+    env[ENV_VAR] = json.dumps({**json.loads(env.get(ENV_VAR, "{}")), name: spec})
+    try:
+        sys.exit(subprocess.call(server, env=env))
+    except KeyboardInterrupt:
+        sys.exit(130)
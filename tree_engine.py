@@ -0,0 +1,755 @@
+"""
+===========================================================
+ COMPILED DECISION-TREE INFERENCE ENGINE
+===========================================================
+
+Flattens a fitted scikit-learn decision tree into plain
+arrays so a prediction skips sklearn's input validation
+and array conversion.
+
+- `predict_one(row)` walks the tree in pure Python and is
+  meant for single requests (a few microseconds).
+- `predict(X)` evaluates a whole batch with NumPy, moving
+  every row down one level per step, in cache-sized blocks
+  of rows. Trees up to HEAP_MAX_DEPTH levels are laid out
+  as a complete binary tree (children of node i at 2i+1
+  and 2i+2), so a step needs no child lookup.
+- Missing values (None or NaN) follow the tree's
+  missing-value direction, like sklearn.
+
+Both paths round inputs to float32 before comparing with
+the split thresholds, exactly as sklearn does, so outputs
+are bit-identical to `model.predict`.
+
+`PackedForest` does the same for a random forest
+classifier: all trees are packed into shared arrays and
+evaluated together over a batch, one level per step. An
+optional early-exit mode stops adding trees once the
+leading class can no longer be overtaken.
+
+`CompactForest` is the same evaluator over narrow arrays
+(float32 thresholds, 8/16-bit indices, one shared table
+of distinct leaf distributions); forest_compress.py
+builds it from a pruned / reduced forest.
+
+Check parity and latency against the flight model, or
+benchmark the earthquake forest, with:
+    python tree_engine.py
+    python tree_engine.py forest
+===========================================================
+"""
+
+import sys
+import time
+from array import array
+
+import numpy as np
+
+NAN = float("nan")
+
+# Rows per block of the single-tree batch path: small enough for the
+# per-level temporaries to stay in cache
+BLOCK_ROWS = 16384
+
+# Deepest tree laid out as a complete binary tree for the batch path
+# (2 ** (depth + 1) slots); deeper trees follow child indices
+HEAP_MAX_DEPTH = 16
+
+# Fewest rows predict_early_exit stops early for: below this the checks
+# and working-set compaction cost more than the trees they skip (about
+# 256 rows on the earthquake forest; see `python tree_engine.py forest`)
+EARLY_EXIT_MIN_ROWS = 256
+
+
+def _float32_row(row):
+    # Round each feature to float32 like sklearn's tree does; None is a
+    # missing value (NaN), as in sklearn's input conversion
+    try:
+        return array('f', row)
+    except TypeError:
+        return array('f', [NAN if v is None else v for v in row])
+
+
+def _as_float32_2d(X):
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    if X.ndim != 2:
+        raise ValueError("X must be a 2-D array")
+    return X
+
+
+def _self_looping_children(children_left, children_right):
+    # Interleaved [left, right] child pairs where leaves point to
+    # themselves, so every row can take exactly `max_depth` steps
+    # without checking whether it already reached a leaf
+    node_ids = np.arange(children_left.shape[0], dtype=np.intp)
+    is_leaf = children_left < 0
+    children = np.empty(2 * children_left.shape[0], dtype=np.intp)
+    children[0::2] = np.where(is_leaf, node_ids, children_left)
+    children[1::2] = np.where(is_leaf, node_ids, children_right)
+    return children
+
+
+def _float32_at_most(threshold):
+    # Largest float32 <= each threshold: for a float32 x, `x <= t` equals
+    # `x <= _float32_at_most(t)`, so comparisons stay in float32
+    threshold = np.asarray(threshold, dtype=np.float64)
+    below = threshold.astype(np.float32)
+    return np.where(below > threshold, np.nextafter(below, np.float32(-np.inf)), below).astype(np.float32)
+
+
+def _descend(engine, X, start_nodes):
+    """
+    Moves every row of float32 array X from `start_nodes` (one root
+    per output row) down to a leaf, one tree level per step.
+    """
+    n_rows, n_features = X.shape
+    flat = X.ravel()
+    row_start = np.arange(n_rows, dtype=np.intp) * n_features
+    check_missing = bool(np.isnan(flat).any())
+
+    nodes = np.repeat(np.asarray(start_nodes, dtype=np.intp)[:, None], n_rows, axis=1)
+    for _ in range(engine.max_depth):
+        x = flat.take(row_start + engine.feature.take(nodes))
+        go_right = ~(x <= engine.threshold.take(nodes))
+        if check_missing:
+            go_right &= ~(np.isnan(x) & engine.missing_left.take(nodes))
+        # Narrow child indices are widened so 2 * node cannot overflow
+        nodes = engine.children.take(2 * nodes + go_right).astype(np.intp, copy=False)
+    return nodes
+
+
+def _max_depth(children_left, children_right):
+    depth = np.zeros(children_left.shape[0], dtype=np.intp)
+    # sklearn numbers nodes depth-first, so parents precede children
+    # and every root (no parent) stays at depth 0
+    for node in range(children_left.shape[0]):
+        if children_left[node] >= 0:
+            depth[children_left[node]] = depth[node] + 1
+            depth[children_right[node]] = depth[node] + 1
+    return int(depth.max()) if depth.size else 0
+
+
+class CompiledTree:
+    """
+    Array-backed evaluator for a single-output regression tree.
+    """
+
+    def __init__(self, children_left, children_right, feature, threshold,
+                 value, missing_go_to_left=None):
+        children_left = np.asarray(children_left, dtype=np.intp)
+        children_right = np.asarray(children_right, dtype=np.intp)
+        n_nodes = children_left.shape[0]
+
+        if missing_go_to_left is None:
+            missing_go_to_left = np.zeros(n_nodes, dtype=bool)
+
+        # Batch arrays
+        self.is_leaf = children_left < 0
+        self.children = _self_looping_children(children_left, children_right)
+        self.feature = np.where(children_left < 0, 0, feature).astype(np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.missing_left = np.asarray(missing_go_to_left, dtype=bool)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.n_nodes = n_nodes
+        self.max_depth = _max_depth(children_left, children_right)
+        self._build_scalar_path()
+        self._build_block_path()
+
+    def _build_scalar_path(self):
+        # Scalar path works on Python lists, which index faster than arrays
+        self._left = np.where(self.is_leaf, -1, self.children[0::2]).tolist()
+        self._right = self.children[1::2].tolist()
+        self._feature = self.feature.tolist()
+        self._threshold = self.threshold.tolist()
+        self._missing_left = self.missing_left.tolist()
+        self._value = self.value.tolist()
+
+    def _build_block_path(self):
+        # Batch path without NaN. Shallow trees: complete binary tree where
+        # a leaf above the last level repeats down its own subtree (its
+        # threshold is +inf, so rows keep going left to a copy of it)
+        if self.max_depth <= HEAP_MAX_DEPTH:
+            levels = [np.zeros(1, dtype=np.intp)]
+            for _ in range(self.max_depth):
+                levels.append(self.children[2 * levels[-1][:, None] + [0, 1]].ravel())
+            self._heap_leaf = levels.pop()
+            inner = np.concatenate(levels)
+            leaf = self.is_leaf[inner]
+            self._heap_feature = np.where(leaf, 0, self.feature[inner]).astype(np.intp)
+            self._heap_threshold = np.where(leaf, np.float32(np.inf),
+                                            _float32_at_most(self.threshold[inner])).astype(np.float32)
+            return
+        # Deep trees: nodes are carried as 2 * node, so the next node is one
+        # lookup of (2 * node + go_right); feature and threshold are stored
+        # twice to be indexed the same way
+        self._heap_leaf = None
+        self._feature2 = np.repeat(self.feature, 2).astype(np.intp)
+        self._threshold2 = np.repeat(_float32_at_most(self.threshold), 2)
+        self._children2 = (2 * self.children).astype(np.intp)
+
+    def to_arrays(self):
+        """
+        The evaluator's arrays by name, for sharing between processes.
+        """
+        return {
+            "is_leaf": self.is_leaf,
+            "children": self.children,
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "missing_left": self.missing_left,
+            "value": self.value,
+            "max_depth": np.array(self.max_depth),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Rebuilds an evaluator from `to_arrays()` output without copying
+        the arrays (they may be read-only views of shared memory).
+        """
+        tree = cls.__new__(cls)
+        for name in ("is_leaf", "children", "feature", "threshold", "missing_left", "value"):
+            setattr(tree, name, arrays[name])
+        tree.n_nodes = tree.is_leaf.shape[0]
+        tree.max_depth = int(arrays["max_depth"])
+        tree._build_scalar_path()
+        tree._build_block_path()
+        return tree
+
+    @classmethod
+    def from_sklearn(cls, estimator):
+        """
+        Builds the evaluator from a fitted DecisionTreeRegressor.
+        """
+        tree = estimator.tree_
+        if tree.n_outputs != 1:
+            raise ValueError("CompiledTree supports single-output trees only")
+        return cls(
+            tree.children_left,
+            tree.children_right,
+            tree.feature,
+            tree.threshold,
+            tree.value[:, 0, 0],
+            getattr(tree, "missing_go_to_left", None),
+        )
+
+    def predict_one(self, row):
+        """
+        Predicts a single feature row (any sequence of numbers).
+        """
+        x = _float32_row(row)
+        left = self._left
+        threshold = self._threshold
+        feature = self._feature
+        node = 0
+        while left[node] >= 0:
+            v = x[feature[node]]
+            if v <= threshold[node] or (v != v and self._missing_left[node]):
+                node = left[node]
+            else:
+                node = self._right[node]
+        return self._value[node]
+
+    def apply(self, X):
+        """
+        Returns the leaf index reached by every row of X.
+        """
+        return self._apply_blocks(_as_float32_2d(X))
+
+    def _apply_blocks(self, X):
+        # Blocks holding a NaN take the generic descent, which follows
+        # missing_left
+        n_rows, n_features = X.shape
+        heap = self._heap_leaf is not None
+        if heap:
+            feature, threshold = self._heap_feature, self._heap_threshold
+        else:
+            feature, threshold, children = self._feature2, self._threshold2, self._children2
+        leaves = np.empty(n_rows, dtype=np.intp)
+        row_offsets = np.arange(min(n_rows, BLOCK_ROWS), dtype=np.intp) * n_features
+        for start in range(0, n_rows, BLOCK_ROWS):
+            block = X[start:start + BLOCK_ROWS]
+            stop = start + block.shape[0]
+            if np.isnan(block).any():
+                leaves[start:stop] = _descend(self, block, [0])[0]
+                continue
+            block = block.ravel()
+            offsets = row_offsets[:stop - start]
+            nodes = np.zeros(offsets.size, dtype=np.intp)
+            for _ in range(self.max_depth):
+                go_right = block.take(offsets + feature.take(nodes)) > threshold.take(nodes)
+                nodes = 2 * nodes + 1 + go_right if heap else children.take(nodes + go_right)
+            # Complete-tree slot / doubled index back to the node number
+            leaves[start:stop] = self._heap_leaf.take(nodes - threshold.size) if heap else nodes >> 1
+        return leaves
+
+    def split_points(self, feature):
+        """
+        Sorted distinct thresholds the tree uses to split on `feature`.
+        """
+        used = ~self.is_leaf & (self.feature == feature)
+        return np.unique(self.threshold[used]).tolist()
+
+    def predict(self, X):
+        """
+        Predicts every row of a 2-D array in one vectorized pass.
+        """
+        return self.value[self.apply(X)]
+
+
+class PackedForest:
+    """
+    Packed evaluator for a fitted RandomForestClassifier.
+
+    All trees share one set of node arrays; tree `t` starts at
+    `roots[t]`. Leaf class probabilities are stored per node so a
+    prediction is one gather per level plus a sum over trees.
+    """
+
+    # Slack on the early-exit margin for float rounding of the votes
+    vote_tolerance = 1e-9
+
+    def __init__(self, children_left, children_right, feature, threshold,
+                 missing_go_to_left, leaf_proba, roots, classes):
+        children_left = np.asarray(children_left, dtype=np.intp)
+        children_right = np.asarray(children_right, dtype=np.intp)
+
+        # Leaves point to themselves, as in CompiledTree
+        self.children = _self_looping_children(children_left, children_right)
+        self.feature = np.where(children_left < 0, 0, feature).astype(np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.missing_left = np.asarray(missing_go_to_left, dtype=bool)
+        self.leaf_proba = np.asarray(leaf_proba, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.classes = np.asarray(classes)
+        self.n_trees = self.roots.shape[0]
+        self.n_nodes = children_left.shape[0]
+        self.max_depth = _max_depth(children_left, children_right)
+
+    def to_arrays(self):
+        """
+        The evaluator's arrays by name, for sharing between processes.
+        """
+        return {
+            "children": self.children,
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "missing_left": self.missing_left,
+            "leaf_proba": self.leaf_proba,
+            "roots": self.roots,
+            "classes": self.classes,
+            "max_depth": np.array(self.max_depth),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Rebuilds an evaluator from `to_arrays()` output without copying
+        the arrays (they may be read-only views of shared memory).
+        """
+        forest = cls.__new__(cls)
+        for name in ("children", "feature", "threshold", "missing_left", "leaf_proba", "roots", "classes"):
+            setattr(forest, name, arrays[name])
+        forest.n_trees = forest.roots.shape[0]
+        forest.n_nodes = forest.feature.shape[0]
+        forest.max_depth = int(arrays["max_depth"])
+        return forest
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """
+        Packs the trees of a fitted single-output RandomForestClassifier.
+        """
+        parts = {key: [] for key in ("left", "right", "feature", "threshold", "missing", "proba")}
+        roots = []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            left = tree.children_left.astype(np.intp)
+            right = tree.children_right.astype(np.intp)
+            # Shift child indices so they address the packed arrays
+            parts["left"].append(np.where(left < 0, -1, left + offset))
+            parts["right"].append(np.where(right < 0, -1, right + offset))
+            parts["feature"].append(tree.feature)
+            parts["threshold"].append(tree.threshold)
+            parts["missing"].append(getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=bool)))
+            parts["proba"].append(_leaf_probabilities(tree.value[:, 0, :forest.n_classes_]))
+            roots.append(offset)
+            offset += tree.node_count
+
+        return cls(
+            *(np.concatenate(parts[key]) for key in ("left", "right", "feature", "threshold", "missing", "proba")),
+            roots,
+            forest.classes_,
+        )
+
+    def apply(self, X, trees=None):
+        """
+        Returns the leaf reached by every row in every tree,
+        as an (n_trees, n_rows) array. `trees` limits the trees used.
+        """
+        roots = self.roots if trees is None else self.roots[trees]
+        return _descend(self, _as_float32_2d(X), roots)
+
+    def leaf_values(self, leaves):
+        """
+        Class probabilities stored at each node of `leaves`.
+        """
+        return self.leaf_proba.take(leaves, axis=0)
+
+    def predict_proba(self, X, block_size=None):
+        """
+        Mean leaf probability over all trees, summed in tree order
+        like sklearn so the result is bit-identical. Trees are walked
+        `block_size` at a time to keep the working set in cache; by
+        default a block covers about 100k (tree, row) pairs.
+        """
+        X = _as_float32_2d(X)
+        if block_size is None:
+            block_size = max(1, 100000 // max(1, X.shape[0]))
+        proba = np.zeros((X.shape[0], self.classes.shape[0]), dtype=np.float64)
+        for start in range(0, self.n_trees, block_size):
+            for leaves in _descend(self, X, self.roots[start:start + block_size]):
+                proba += self.leaf_values(leaves)
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        """
+        Predicted class for every row of X.
+        """
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def predict_early_exit(self, X, check_every=10, min_rows=EARLY_EXIT_MIN_ROWS):
+        """
+        Predicts X, stopping for a row once its leading class is ahead of
+        the runner-up by more than the number of trees left. Each tree adds
+        at most 1 to any class, so the final vote can no longer change and
+        the prediction equals `predict`.
+
+        No row can be decided before more than half the trees have voted,
+        so the first check comes after n_trees // 2 + 1 trees and then
+        every `check_every` trees; decided rows are dropped from the
+        working set. Between checks trees are walked in cache-sized
+        blocks, as in predict_proba. Batches of fewer than `min_rows`
+        rows (e.g. micro-batches) get one full `predict` pass instead,
+        which is faster at that size, and report every tree as used.
+
+        Returns (predicted classes, trees used per row).
+        """
+        X = _as_float32_2d(X)
+        n_rows = X.shape[0]
+        if n_rows < min_rows:
+            return self.predict(X), np.full(n_rows, self.n_trees, dtype=np.intp)
+        votes = np.zeros((n_rows, self.classes.shape[0]), dtype=np.float64)
+        trees_used = np.full(n_rows, self.n_trees, dtype=np.intp)
+        active = np.arange(n_rows)
+        active_X, active_votes = X, votes.copy()
+        first_check = self.n_trees // 2 + 1
+
+        start = 0
+        while start < self.n_trees and active.size:
+            block_size = max(1, 100000 // active.size)
+            next_check = first_check if start < first_check else start + check_every
+            stop = min(start + block_size, next_check, self.n_trees)
+            for leaves in _descend(self, active_X, self.roots[start:stop]):
+                active_votes += self.leaf_values(leaves)
+            start = stop
+            if stop < first_check or stop == self.n_trees:
+                continue
+
+            top_two = np.partition(active_votes, -2, axis=1)[:, -2:]
+            # Small tolerance so float rounding can never flip a decision
+            decided = top_two[:, 1] - top_two[:, 0] > (self.n_trees - stop) + self.vote_tolerance
+            if decided.any():
+                rows = active[decided]
+                votes[rows] = active_votes[decided]
+                trees_used[rows] = stop
+                keep = ~decided
+                active, active_X, active_votes = active[keep], active_X[keep], active_votes[keep]
+
+        votes[active] = active_votes
+        return self.classes.take(np.argmax(votes, axis=1)), trees_used
+
+
+class CompactForest(PackedForest):
+    """
+    PackedForest over narrow arrays, for a smaller model in memory
+    and on disk:
+
+    - thresholds are float32, rounded down, so `x <= threshold`
+      gives the same split as sklearn's float64 threshold for every
+      float32 input;
+    - child, feature and leaf indices use the smallest unsigned type
+      that holds them;
+    - each node stores an index into a float32 table of the distinct
+      leaf distributions instead of its own probability row.
+
+    Leaf probabilities are rounded to float32, so predict_proba
+    differs from the source forest by about 1e-7.
+    """
+
+    vote_tolerance = 1e-4
+
+    def __init__(self, children, feature, threshold, missing_left, leaf_index,
+                 leaf_table, roots, classes, max_depth):
+        self.children = children
+        self.feature = feature
+        self.threshold = threshold
+        self.missing_left = missing_left
+        self.leaf_index = leaf_index
+        self.leaf_table = leaf_table
+        self.roots = roots
+        self.classes = np.asarray(classes)
+        self.n_trees = self.roots.shape[0]
+        self.n_nodes = self.feature.shape[0]
+        self.max_depth = int(max_depth)
+
+    def to_arrays(self):
+        """
+        The evaluator's arrays by name, for sharing between processes.
+        """
+        return {
+            "children": self.children,
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "missing_left": self.missing_left,
+            "leaf_index": self.leaf_index,
+            "leaf_table": self.leaf_table,
+            "roots": self.roots,
+            "classes": self.classes,
+            "max_depth": np.array(self.max_depth),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Rebuilds an evaluator from `to_arrays()` output without copying
+        the arrays (they may be read-only views of shared memory).
+        """
+        names = ("children", "feature", "threshold", "missing_left", "leaf_index",
+                 "leaf_table", "roots", "classes")
+        return cls(*(arrays[name] for name in names), int(arrays["max_depth"]))
+
+    @classmethod
+    def from_trees(cls, trees, classes):
+        """
+        Packs trees given as dicts of node arrays ("left", "right",
+        "feature", "threshold", "missing", "proba"), numbered from 0
+        in each tree like sklearn's tree_ arrays.
+        """
+        left, right, roots = [], [], []
+        offset = 0
+        for tree in trees:
+            left.append(np.where(tree["left"] < 0, -1, tree["left"] + offset))
+            right.append(np.where(tree["right"] < 0, -1, tree["right"] + offset))
+            roots.append(offset)
+            offset += tree["left"].shape[0]
+        left, right = np.concatenate(left), np.concatenate(right)
+        is_leaf = left < 0
+        n_nodes = left.shape[0]
+
+        threshold = np.where(is_leaf, 0.0, np.concatenate([tree["threshold"] for tree in trees]))
+        threshold32 = threshold.astype(np.float32)
+        # Round down: for float32 x, x <= t32 exactly when x <= t
+        above = threshold32 > threshold
+        threshold32[above] = np.nextafter(threshold32[above], np.float32(-np.inf))
+
+        feature = np.where(is_leaf, 0, np.concatenate([tree["feature"] for tree in trees]))
+        proba = np.concatenate([tree["proba"] for tree in trees]).astype(np.float32)
+        leaf_table, inverse = np.unique(proba[is_leaf], axis=0, return_inverse=True)
+        leaf_index = np.zeros(n_nodes, dtype=np.intp)
+        leaf_index[is_leaf] = inverse.ravel()
+
+        return cls(
+            _self_looping_children(left, right).astype(_index_type(n_nodes)),
+            feature.astype(_index_type(int(feature.max()) + 1)),
+            threshold32,
+            np.concatenate([tree["missing"] for tree in trees]).astype(bool),
+            leaf_index.astype(_index_type(leaf_table.shape[0])),
+            np.ascontiguousarray(leaf_table),
+            np.asarray(roots, dtype=_index_type(n_nodes)),
+            classes,
+            _max_depth(left, right),
+        )
+
+    def leaf_values(self, leaves):
+        """
+        Class probabilities of the leaf reached at each node of `leaves`.
+        """
+        return self.leaf_table.take(self.leaf_index.take(leaves), axis=0)
+
+    def predict_proba(self, X, block_size=None):
+        """
+        Mean leaf probability over all trees. Each block of trees is
+        gathered and summed in one call (the sum is not bit-identical
+        to sklearn's anyway, the leaf table being float32).
+        """
+        X = _as_float32_2d(X)
+        if block_size is None:
+            block_size = max(1, 100000 // max(1, X.shape[0]))
+        proba = np.zeros((X.shape[0], self.classes.shape[0]), dtype=np.float64)
+        for start in range(0, self.n_trees, block_size):
+            leaves = _descend(self, X, self.roots[start:start + block_size])
+            proba += self.leaf_values(leaves).sum(axis=0, dtype=np.float64)
+        proba /= self.n_trees
+        return proba
+
+
+def _index_type(n):
+    # Smallest unsigned integer type that can hold 0 .. n - 1
+    return np.min_scalar_type(max(n - 1, 0))
+
+
+def _leaf_probabilities(value):
+    # Recent sklearn stores class fractions in tree_.value, older versions
+    # store counts and normalize at predict time; handle both the same way
+    sums = value.sum(axis=1)
+    if np.allclose(sums, 1.0):
+        return value.copy()
+    sums[sums == 0.0] = 1.0
+    return value / sums[:, None]
+
+
+def check_parity(estimator, compiled, X):
+    """
+    Compares both evaluation paths with `estimator.predict` on X.
+    Returns the number of rows that differ (0 means bit-identical).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    expected = estimator.predict(X)
+    batch = compiled.predict(X)
+    single = np.array([compiled.predict_one(row) for row in X.tolist()])
+    mismatched = (expected != batch) | (expected != single)
+    return int(np.count_nonzero(mismatched))
+
+
+def _flight_check_rows(artifact, n_random=20000, seed=0):
+    # Every category combination over stops and months, at duration values
+    # on and next to each duration split, plus random rows and unknowns
+    model = artifact["model"]
+    encoders = artifact["label_encoders"]
+    features = artifact["features"]
+    duration_col = features.index("Duration_hours")
+    tree = model.tree_
+    splits = tree.threshold[tree.feature == duration_col].astype(np.float32)
+    durations = np.unique(np.concatenate([
+        splits, np.nextafter(splits, np.float32(np.inf)), [0.5, 5.0, 48.0]
+    ]))
+
+    codes = [np.arange(-1, len(encoders[col].classes_)) for col in ('Airline', 'Source', 'Destination')]
+    grid = np.meshgrid(*codes, np.arange(5), durations,
+                       np.arange(1, 13), indexing="ij")
+    grid = np.column_stack([g.ravel() for g in grid]).astype(np.float64)
+
+    rng = np.random.default_rng(seed)
+    random_rows = np.column_stack([
+        rng.integers(-1, len(encoders['Airline'].classes_), n_random),
+        rng.integers(-1, len(encoders['Source'].classes_), n_random),
+        rng.integers(-1, len(encoders['Destination'].classes_), n_random),
+        rng.integers(0, 5, n_random),
+        rng.uniform(0, 50, n_random),
+        rng.integers(1, 13, n_random),
+    ]).astype(np.float64)
+    return np.vstack([grid, random_rows])
+
+
+def _time_per_call(fn, arg, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(arg)
+    return (time.perf_counter() - start) / repeat
+
+
+def check_flight_tree():
+    """
+    Parity and latency of CompiledTree against the flight model.
+    Returns the number of mismatching rows.
+    """
+    import model_store
+
+    artifact = model_store.load_artifact("flight")
+    model = artifact["model"]
+    compiled = CompiledTree.from_sklearn(model)
+    X = _flight_check_rows(artifact)
+
+    mismatches = check_parity(model, compiled, X)
+    print(f"Parity: {len(X)} rows checked, {mismatches} mismatches")
+
+    # Missing values: NaN in each feature in turn (batch and single row),
+    # and None in a single row, must follow sklearn
+    missing = np.repeat(X[:2000], X.shape[1], axis=0)
+    missing[np.arange(len(missing)), np.tile(np.arange(X.shape[1]), 2000)] = np.nan
+    missing_mismatches = check_parity(model, compiled, missing)
+    none_row = X[0].tolist()
+    none_row[artifact["features"].index("Duration_hours")] = None
+    expected = model.predict(np.array([none_row], dtype=np.float64))[0]
+    missing_mismatches += int(compiled.predict_one(none_row) != expected)
+    print(f"Missing values: {len(missing) + 1} rows checked, {missing_mismatches} mismatches")
+    mismatches += missing_mismatches
+
+    row = X[0].tolist()
+    fast = _time_per_call(compiled.predict_one, row, 20000)
+    slow = _time_per_call(lambda r: model.predict([r]), row, 1000)
+    print(f"Single row: compiled {fast * 1e6:.2f} us, sklearn {slow * 1e6:.2f} us")
+
+    # The check rows, then 1M rows cycling through the random ones (the
+    # sorted category grid alone favours sklearn's branch prediction)
+    for name, batch in (("check rows", X), ("random rows", np.resize(X[-20000:], (1_000_000, X.shape[1])))):
+        fast = min(_time_per_call(compiled.predict, batch, 1) for _ in range(3))
+        slow = min(_time_per_call(model.predict, batch, 1) for _ in range(3))
+        print(f"Batch of {len(batch)} {name}: compiled {fast * 1e3:.2f} ms, sklearn {slow * 1e3:.2f} ms")
+    return mismatches
+
+
+def benchmark_forest(batch_rows=10000, seed=0):
+    """
+    Parity and latency of PackedForest against the earthquake forest,
+    for single rows and a batch of `batch_rows` dataset rows.
+    Returns the number of mismatching predictions.
+    """
+    import model_store
+
+    artifact = model_store.load_artifact("earthquake")
+    rf_model = artifact["model"]
+    packed = PackedForest.from_sklearn(rf_model)
+
+    dataset = model_store.load_dataset("earthquake")
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([dataset.columns[col] for col in artifact["features"]])
+    X = X[rng.integers(0, len(X), batch_rows)]
+
+    expected_proba = rf_model.predict_proba(X)
+    expected = rf_model.predict(X)
+    early, trees_used = packed.predict_early_exit(X)
+    # The early-exit path itself on a batch it would hand to predict
+    small, _ = packed.predict_early_exit(X[:100], min_rows=0)
+    mismatches = int(np.count_nonzero(packed.predict(X) != expected)
+                     + np.count_nonzero(early != expected)
+                     + np.count_nonzero(small != expected[:100])
+                     + np.count_nonzero(packed.predict_proba(X) != expected_proba))
+    print(f"Parity: {len(X)} rows checked, {mismatches} mismatches")
+    print(f"Early exit: {trees_used.mean():.1f} of {packed.n_trees} trees used on average")
+
+    row = X[:1]
+    print("Single row:")
+    print(f"  rf_model.predict            {_time_per_call(rf_model.predict, row, 200) * 1e6:9.1f} us")
+    print(f"  PackedForest.predict        {_time_per_call(packed.predict, row, 2000) * 1e6:9.1f} us")
+    print(f"  PackedForest early exit     {_time_per_call(packed.predict_early_exit, row, 2000) * 1e6:9.1f} us"
+          f"  (full pass below {EARLY_EXIT_MIN_ROWS} rows)")
+    forced = lambda batch: packed.predict_early_exit(batch, min_rows=0)
+    for batch in (X[:100], X[:1000], X):
+        print(f"Batch of {len(batch)} rows:")
+        print(f"  rf_model.predict            {_time_per_call(rf_model.predict, batch, 3) * 1e3:9.1f} ms")
+        print(f"  PackedForest.predict        {_time_per_call(packed.predict, batch, 20) * 1e3:9.1f} ms")
+        print(f"  PackedForest early exit     {_time_per_call(forced, batch, 20) * 1e3:9.1f} ms"
+              f"  (without the {EARLY_EXIT_MIN_ROWS}-row cutoff)")
+    return mismatches
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "forest":
+        mismatches = benchmark_forest()
+    else:
+        mismatches = check_flight_tree()
+    sys.exit(1 if mismatches else 0)